@@ -0,0 +1,101 @@
+"""
+Measure the space taken by stored coverage, and the time taken to save and load it, when the coverage of each test
+is stored in full and when it is stored as deltas relative to its previous execution.
+
+A database of synthetic runs is generated, in which each test covers runs of consecutive lines in several files, and a
+few of those lines change between runs, as is typical of a test suite whose code under test is being worked on.
+
+Usage: :code:`python benchmarks/coverage_deltas.py [--runs N] [--tests N] [--files N] [--lines N] [--changes N]`
+"""
+
+import argparse
+import random
+import time
+from tempfile import TemporaryDirectory
+
+from sqlalchemy import text
+from synthetic import database_url, random_coverage
+
+from pytest_flakefighters.database_management import Database, Run, Test, TestExecution
+
+
+def build_runs(args: argparse.Namespace) -> list[list[dict]]:
+    """
+    Generate the coverage of each test in each run.
+    :param args: The parsed command line arguments.
+    """
+    coverage = [
+        {path: set(lines) for path, lines in random_coverage(args.files, args.lines, vary=False).items()}
+        for _ in range(args.tests)
+    ]
+    runs = []
+    for _ in range(args.runs):
+        for lines in coverage:
+            for _ in range(args.changes):
+                file_lines = lines[random.choice(list(lines))]
+                file_lines.symmetric_difference_update({random.randint(1, 1100)})
+        runs.append([{path: sorted(file_lines) for path, file_lines in lines.items()} for lines in coverage])
+    return runs
+
+
+def measure(runs: list[list[dict]], deltas: bool) -> tuple[float, float, float]:
+    """
+    Save the runs, then load the coverage of every execution.
+    :param runs: The coverage of each test in each run.
+    :param deltas: Whether to store coverage as deltas.
+    :returns: The time taken to save and to load, in seconds, and the size of the stored coverage in MB.
+    """
+    with TemporaryDirectory() as tempdir:
+        url = database_url(tempdir)
+        with Database(url, coverage_deltas=deltas) as db:
+            start = time.perf_counter()
+            for coverage in runs:
+                db.save(
+                    Run(  # pylint: disable=E1123
+                        root=".",
+                        tests=[
+                            Test(name=f"test_{i}", executions=[TestExecution(coverage=lines)])  # pylint: disable=E1123
+                            for i, lines in enumerate(coverage)
+                        ],
+                    )
+                )
+            save_time = time.perf_counter() - start
+            with db.engine.connect() as connection:
+                size = connection.scalar(
+                    text("SELECT SUM(COALESCE(LENGTH(coverage), 0) + COALESCE(LENGTH(delta), 0)) FROM coverage_blob")
+                )
+        with Database(url) as db:
+            start = time.perf_counter()
+            lines = sum(
+                execution.coverage.line_count()
+                for run in db.load_runs()
+                for test in run.tests
+                for execution in test.executions
+            )
+            load_time = time.perf_counter() - start
+    assert lines
+    return save_time, load_time, size / 1e6
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=50, help="Number of runs.")
+    parser.add_argument("--tests", type=int, default=200, help="Number of tests per run.")
+    parser.add_argument("--files", type=int, default=10, help="Number of files each test covers.")
+    parser.add_argument("--lines", type=int, default=100, help="Number of lines covered in each file.")
+    parser.add_argument("--changes", type=int, default=3, help="Number of lines of each test that change per run.")
+    args = parser.parse_args()
+    random.seed(0)
+    runs = build_runs(args)
+
+    print(f"{'storage':<12}{'save (s)':>12}{'load (s)':>12}{'size (MB)':>12}")
+    for storage, deltas in [("full", False), ("deltas", True)]:
+        save_time, load_time, size = measure(runs, deltas)
+        print(f"{storage:<12}{save_time:>12.2f}{load_time:>12.2f}{size:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
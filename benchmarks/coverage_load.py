@@ -0,0 +1,66 @@
+"""
+Measure the time taken to decode stored coverage, and the space it takes, when it is packed and when it is pickled as by
+earlier versions.
+
+A database of distinct synthetic coverage is generated, in which each execution covers a run of consecutive lines in
+each of several files, as is typical of real coverage. The stored coverage is then decoded in full, both as it is
+stored and after being pickled.
+
+Usage: :code:`python benchmarks/coverage_load.py [--executions N] [--files N] [--lines N] [--repeats R]`
+"""
+
+import argparse
+import pickle
+import random
+import time
+from tempfile import TemporaryDirectory
+
+from sqlalchemy import text
+from synthetic import build_run, database_url
+
+from pytest_flakefighters.database_management import Database
+from pytest_flakefighters.models import unpack_coverage
+
+
+def decode(values: list[bytes], repeats: int) -> float:
+    """
+    Decode every stored coverage map.
+    :param values: The stored coverage.
+    :param repeats: The number of times to decode the coverage.
+    :returns: The shortest time taken to decode the coverage, in seconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        lines = sum(unpack_coverage(value).line_count() for value in values)
+        timings.append(time.perf_counter() - start)
+    assert lines
+    return min(timings)
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--executions", type=int, default=5000, help="Number of executions with distinct coverage.")
+    parser.add_argument("--files", type=int, default=20, help="Number of files each execution covers.")
+    parser.add_argument("--lines", type=int, default=100, help="Approximate number of lines covered in each file.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of times to decode the coverage.")
+    args = parser.parse_args()
+    random.seed(0)
+
+    with TemporaryDirectory() as tempdir:
+        with Database(database_url(tempdir)) as db:
+            db.save(build_run(args.executions, args.files, args.lines, distinct=True))
+            with db.engine.connect() as connection:
+                packed = connection.scalars(text("SELECT coverage FROM coverage_blob")).all()
+    pickled = [pickle.dumps(unpack_coverage(value), protocol=pickle.HIGHEST_PROTOCOL) for value in packed]
+
+    print(f"{'encoding':<12}{'decode (s)':>12}{'size (MB)':>12}")
+    for encoding, values in [("pickled", pickled), ("packed", packed)]:
+        print(f"{encoding:<12}{decode(values, args.repeats):>12.2f}{sum(map(len, values)) / 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure the time taken to load the coverage of many previous runs as matrices of executions by covered statements,
+through the ORM and from the coverage store.
+
+A database of synthetic runs is generated with a coverage store, in which each execution covers a run of consecutive
+lines in each of several files. The coverage of every run is then loaded and turned into a sparse matrix, both by
+loading the runs and from the memory-mapped matrices in the store.
+
+Usage: :code:`python benchmarks/coverage_matrix.py [--runs N] [--executions N] [--files N] [--lines N]`
+"""
+
+import argparse
+import os
+import random
+import time
+from tempfile import TemporaryDirectory
+
+from synthetic import build_run, database_url
+
+from pytest_flakefighters.coverage_store import CoverageMatrix
+from pytest_flakefighters.database_management import Database
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=50, help="Number of runs.")
+    parser.add_argument("--executions", type=int, default=200, help="Number of executions per run.")
+    parser.add_argument("--files", type=int, default=20, help="Number of files each execution covers.")
+    parser.add_argument("--lines", type=int, default=100, help="Approximate number of lines covered in each file.")
+    args = parser.parse_args()
+    random.seed(0)
+
+    with TemporaryDirectory() as tempdir:
+        url = database_url(tempdir)
+        store_dir = os.path.join(tempdir, "coverage")
+        with Database(url, coverage_store_dir=store_dir) as db:
+            for _ in range(args.runs):
+                db.save(build_run(args.executions, args.files, args.lines))
+
+        with Database(url) as db:
+            start = time.perf_counter()
+            orm = [
+                CoverageMatrix.from_coverage(
+                    [execution.coverage for test in run.tests for execution in test.executions]
+                ).to_sparse()
+                for run in db.load_runs()
+            ]
+            orm_time = time.perf_counter() - start
+
+        with Database(url, coverage_store_dir=store_dir) as db:
+            start = time.perf_counter()
+            stored = [matrix.to_sparse() for matrix in db.load_coverage_matrices().values()]
+            store_time = time.perf_counter() - start
+
+    assert sum(matrix.nnz for matrix in orm) == sum(matrix.nnz for matrix in stored)
+    print(f"{'source':<12}{'load (s)':>12}")
+    print(f"{'orm':<12}{orm_time:>12.2f}")
+    print(f"{'store':<12}{store_time:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
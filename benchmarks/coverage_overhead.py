@@ -0,0 +1,103 @@
+"""
+Measure the per-test overhead of the flakefighters plugin under each coverage measurement mode.
+
+A synthetic git repository containing a suite of small tests is generated in a temporary directory, and pytest is run
+on it in a subprocess with the plugin disabled, and enabled with each set of options.
+The per-test overhead is the difference in wall time from the disabled run, divided by the number of tests.
+
+Usage: :code:`python benchmarks/coverage_overhead.py [--tests N] [--repeats R]`
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+import git
+
+MODES = {
+    "disabled": [],
+    "per-test": ["--flakefighters", "--no-save"],
+    "continuous": ["--flakefighters", "--no-save", "--continuous-coverage"],
+}
+if sys.version_info >= (3, 12):
+    MODES["monitoring"] = ["--flakefighters", "--no-save", "--monitoring-coverage"]
+    MODES["monitoring-continuous"] = ["--flakefighters", "--no-save", "--monitoring-coverage", "--continuous-coverage"]
+
+SOURCE = """
+def collatz(n):
+    steps = 0
+    while n != 1:
+        n = n // 2 if n % 2 == 0 else 3 * n + 1
+        steps += 1
+    return steps
+"""
+
+TEST = """
+from source import collatz
+
+
+def test_collatz_{i}():
+    assert sum(collatz(n) for n in range(1, {i} % 100 + 100)) > 0
+"""
+
+
+def build_suite(root: str, tests: int):
+    """
+    Write a synthetic test suite into a fresh git repo.
+    :param root: The directory to create the repo in.
+    :param tests: The number of tests to generate.
+    """
+    repo = git.Repo.init(root)
+    with open(os.path.join(root, "source.py"), "w") as f:
+        f.write(SOURCE)
+    with open(os.path.join(root, "test_suite.py"), "w") as f:
+        f.write("".join(TEST.format(i=i) for i in range(tests)))
+    repo.index.add(["source.py", "test_suite.py"])
+    repo.index.commit("Initial commit")
+    repo.index.commit("Empty commit")
+
+
+def time_mode(root: str, options: list[str], repeats: int) -> float:
+    """
+    Return the fastest wall time of running the suite with the given options.
+    :param root: The root directory of the suite.
+    :param options: The extra pytest options.
+    :param repeats: The number of times to run the suite.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "test_suite.py"] + options,
+            cwd=root,
+            check=True,
+            capture_output=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--tests", type=int, default=1000, help="Number of tests in the synthetic suite.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of times to run each mode.")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as root:
+        build_suite(root, args.tests)
+        timings = {mode: time_mode(root, options, args.repeats) for mode, options in MODES.items()}
+
+    print(f"{'mode':<24}{'total (s)':>12}{'per test (ms)':>16}")
+    for mode, timing in timings.items():
+        overhead = (timing - timings["disabled"]) / args.tests * 1000
+        print(f"{mode:<24}{timing:>12.2f}{overhead:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measure the time taken to read the history that the built-in flakefighters need, through full ORM runs and through
+columns-only history views.
+
+A database of synthetic runs is generated, and then each method reads every test's name, execution outcomes, verdicts,
+and the traceback of each failing execution, as TracebackMatching does at startup.
+
+Usage: :code:`python benchmarks/history_load.py [--runs N] [--tests N] [--repeats R] [--database-url URL]`
+
+If a database URL is given (e.g. a remote PostgreSQL database), then its tables are emptied and refilled first.
+Otherwise, a new SQLite database is created in a temporary directory.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+
+from save_overhead import build_run
+
+from pytest_flakefighters.database_management import Base, Database
+
+
+def walk(runs) -> int:
+    """
+    Read the attributes used by the built-in flakefighters from each run.
+    :param runs: The runs to walk.
+    :returns: The number of traceback entries read, so that the walk cannot be optimised away.
+    """
+    entries = 0
+    for run in runs:
+        for test in run.tests:
+            _ = test.name, test.flaky
+            for execution in test.executions:
+                _ = execution.outcome, [result.flaky for result in execution.flakefighter_results]
+                if execution.exception:
+                    entries += len([(entry.path, entry.lineno, entry.colno) for entry in execution.exception.traceback])
+    return entries
+
+
+def fill(url: str, runs: int, tests: int):
+    """
+    Empty the database, then save synthetic runs into it, one day apart.
+    :param url: The database URL.
+    :param runs: The number of runs to save.
+    :param tests: The number of tests in each run.
+    """
+    with Database(url) as db:
+        with db.engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
+        for i in range(runs):
+            run = build_run(tests)
+            run.start_time = datetime.now() - timedelta(days=i)
+            db.save(run)
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs in the database.")
+    parser.add_argument("--tests", type=int, default=2000, help="Number of tests in each run.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of times to load with each method.")
+    parser.add_argument("--database-url", help="The database to load from. Defaults to a temporary SQLite database.")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tempdir:
+        url = args.database_url or f"sqlite:///{os.path.join(tempdir, 'flakefighters.db')}"
+        fill(url, args.runs, args.tests)
+
+        methods = {
+            "orm": lambda db: db.load_runs(),
+            "history": lambda db: db.load_history(tracebacks=True),
+        }
+        timings = {}
+        for method, load in methods.items():
+            repeats = []
+            for _ in range(args.repeats):
+                with Database(url) as db:
+                    start = time.perf_counter()
+                    walk(load(db))
+                    repeats.append(time.perf_counter() - start)
+            timings[method] = min(repeats)
+
+    print(f"{'method':<12}{'total (s)':>12}")
+    for method, timing in timings.items():
+        print(f"{method:<12}{timing:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Measure the time taken to import the plugin entry point, which every pytest session pays for with the plugin installed,
+even if the plugin is not enabled with --flakefighters.
+
+The entry point is imported in a fresh interpreter with :code:`-X importtime`, after pytest itself, so that only the
+cost of the plugin is counted. The benchmark fails if the best of the repeats exceeds the given budget.
+
+Usage: :code:`python benchmarks/import_time.py [--repeats R] [--max-seconds S]`
+"""
+
+import argparse
+import subprocess
+import sys
+
+ENTRY_POINT = "pytest_flakefighters.main"
+
+
+def import_time(module: str) -> tuple[float, list[str]]:
+    """
+    Import a module in a fresh interpreter that has already imported pytest.
+    :param module: The module to import.
+    :returns: The cumulative import time of the module in seconds, and the modules imported along with it.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import pytest; import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = result.stderr.splitlines()
+    # Imports are listed in the order they finish, so the modules imported along with the module come just before it
+    start = max(i for i, line in enumerate(lines) if line.rstrip().endswith("| pytest")) + 1
+    end = next(i for i, line in enumerate(lines) if line.rstrip().endswith(f"| {module}"))
+    cumulative = int(lines[end].split("|")[1])
+    return cumulative / 1e6, [line.split("|")[2].strip() for line in lines[start:end]]
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--repeats", type=int, default=5, help="Number of times to import the entry point.")
+    parser.add_argument("--max-seconds", type=float, default=0.1, help="The import time budget of the entry point.")
+    args = parser.parse_args()
+
+    timings = [import_time(ENTRY_POINT) for _ in range(args.repeats)]
+    best, modules = min(timings)
+    top_level = sorted({module.split(".")[0] for module in modules})
+    print(f"{ENTRY_POINT}: {best:.3f} s, {len(modules)} modules from {', '.join(top_level)}")
+    if best > args.max_seconds:
+        sys.exit(f"Import time exceeds the budget of {args.max_seconds:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
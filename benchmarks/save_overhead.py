@@ -0,0 +1,114 @@
+"""
+Measure the time taken by Database.save to insert a large run, in bulk and through the ORM unit of work.
+
+A synthetic run is generated in memory, with a mix of passing and failing tests, where each failing test has an
+exception with a traceback, and every test and execution has flakefighter results.
+It is saved into a fresh database with each method in turn.
+
+Usage: :code:`python benchmarks/save_overhead.py [--tests N] [--repeats R] [--database-url URL]`
+
+If a database URL is given (e.g. a remote PostgreSQL database), then its tables are emptied before each save.
+Otherwise, a new SQLite database is created in a temporary directory for each save.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+from tempfile import TemporaryDirectory
+
+from pytest_flakefighters.database_management import (
+    ActiveFlakeFighter,
+    Base,
+    Database,
+    FlakefighterResult,
+    Run,
+    Test,
+    TestException,
+    TestExecution,
+    TracebackEntry,
+)
+
+
+def build_run(tests: int) -> Run:
+    """
+    Generate a synthetic run.
+    :param tests: The number of tests in the run.
+    """
+    run = Run(  # pylint: disable=E1123
+        root=".",
+        start_time=datetime.now(),
+        active_flakefighters=[ActiveFlakeFighter(name="DiffCov", params={"root": "."})],
+    )
+    for i in range(tests):
+        failed = i % 10 == 0
+        execution = TestExecution(  # pylint: disable=E1123
+            outcome="failed" if failed else "passed",
+            start_time=datetime.now(),
+            end_time=datetime.now(),
+            coverage={"src/module.py": range(1, 50 + i % 50), f"tests/test_{i // 100}.py": [i % 100 + 1]},
+            flakefighter_results=[FlakefighterResult(name="DiffCov", flaky=False)],
+        )
+        if failed:
+            execution.exception = TestException(  # pylint: disable=E1123
+                name="AssertionError",
+                traceback=[
+                    TracebackEntry(path="src/module.py", lineno=line, statement="assert x", source="assert x")
+                    for line in range(5)
+                ],
+            )
+        run.tests.append(
+            Test(  # pylint: disable=E1123
+                name=f"tests/test_{i // 100}.py::test_{i}",
+                fspath=f"tests/test_{i // 100}.py",
+                line_no=i % 100 + 1,
+                executions=[execution],
+                flakefighter_results=[FlakefighterResult(name="CoverageIndependence", flaky=False)],
+            )
+        )
+    return run
+
+
+def time_save(url: str, tests: int, bulk: bool) -> float:
+    """
+    Return the time taken to save a synthetic run.
+    :param url: The database URL.
+    :param tests: The number of tests in the run.
+    :param bulk: Whether to insert the run in bulk.
+    """
+    run = build_run(tests)
+    with Database(url) as db:
+        with db.engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
+        start = time.perf_counter()
+        db.save(run, bulk=bulk)
+        return time.perf_counter() - start
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--tests", type=int, default=20000, help="Number of tests in the synthetic run.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of times to save with each method.")
+    parser.add_argument("--database-url", help="The database to save into. Defaults to a temporary SQLite database.")
+    args = parser.parse_args()
+
+    timings = {}
+    for method, bulk in [("orm", False), ("bulk", True)]:
+        repeats = []
+        for _ in range(args.repeats):
+            with TemporaryDirectory() as tempdir:
+                url = args.database_url or f"sqlite:///{os.path.join(tempdir, 'flakefighters.db')}"
+                repeats.append(time_save(url, args.tests, bulk))
+        timings[method] = min(repeats)
+
+    print(f"{'method':<12}{'total (s)':>12}{'per test (ms)':>16}")
+    for method, timing in timings.items():
+        print(f"{method:<12}{timing:>12.2f}{timing / args.tests * 1000:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
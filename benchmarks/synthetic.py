@@ -0,0 +1,51 @@
+"""
+Helpers shared by the benchmarks to generate synthetic coverage and to set up scratch databases.
+"""
+
+import os
+import random
+
+from pytest_flakefighters.database_management import Run, Test, TestExecution
+
+
+def database_url(directory: str) -> str:
+    """
+    Return the URL of an SQLite database in the given directory.
+    :param directory: The directory, typically a temporary one.
+    """
+    return f"sqlite:///{os.path.join(directory, 'flakefighters.db')}"
+
+
+def random_coverage(files: int, lines: int, vary: bool = True) -> dict[str, range]:
+    """
+    Generate the coverage of a test that covers a run of consecutive lines in each of several files, as is typical of
+    real coverage.
+    :param files: The number of files covered.
+    :param lines: The number of lines covered in each file.
+    :param vary: Whether to cover between half and twice as many lines in each file, rather than exactly that many.
+    """
+    coverage = {}
+    for file in random.sample(range(files * 4), files):
+        start = random.randint(1, 1000)
+        coverage[f"src/package/module_{file}.py"] = range(
+            start, start + (random.randint(lines // 2, lines * 2) if vary else lines)
+        )
+    return coverage
+
+
+def build_run(executions: int, files: int, lines: int, distinct: bool = False) -> Run:
+    """
+    Generate a synthetic run with one execution of each test.
+    :param executions: The number of executions.
+    :param files: The number of files each execution covers.
+    :param lines: The approximate number of lines each execution covers in each file.
+    :param distinct: Whether to also cover a different test line in each execution, so that no two executions have the
+    same coverage.
+    """
+    tests = []
+    for i in range(executions):
+        coverage = random_coverage(files, lines)
+        if distinct:
+            coverage["tests/test_module.py"] = [i + 1]
+        tests.append(Test(name=f"test_{i}", executions=[TestExecution(coverage=coverage)]))  # pylint: disable=E1123
+    return Run(root=".", tests=tests)  # pylint: disable=E1123
@@ -0,0 +1,392 @@
+"""
+This module implements bulk insertion of test results using SQLAlchemy Core, bypassing the ORM unit of work.
+Results are first snapshotted into plain records of column values, so that they can be inserted from any thread (or
+shipped to another process), and each table is then written with one multi-row statement per batch rather than one
+statement per object.
+"""
+
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Union
+
+from sqlalchemy import Connection, Table, insert, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from pytest_flakefighters.coverage_blobs import (
+    encode_deltas,
+    index_coverage,
+    lock_coverage,
+)
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.models import (
+    LOOKUP_BATCH_SIZE,
+    ActiveFlakeFighter,
+    Base,
+    CoverageBlob,
+    FlakefighterResult,
+    Run,
+    Test,
+    TestException,
+    TestExecution,
+    TracebackEntry,
+)
+
+
+@dataclass
+class ExecutionRecord:
+    """
+    Snapshot of a test execution and its related rows.
+
+    :ivar row: The column values of the execution.
+    :ivar coverage: The lines covered by the execution.
+    :ivar digest: The content hash of the coverage.
+    :ivar exception: The column values of the exception thrown by the execution, if any.
+    :ivar traceback: The column values of the traceback entries of the exception.
+    :ivar results: The column values of the execution-level flakefighter results.
+    :ivar id: The ID of the execution once it has been inserted.
+    """
+
+    row: dict
+    coverage: Union[CoverageMap, None] = None
+    digest: Union[bytes, None] = None
+    exception: Union[dict, None] = None
+    traceback: list[dict] = field(default_factory=list)
+    results: list[dict] = field(default_factory=list)
+    id: int = None  # pylint: disable=C0103
+
+
+@dataclass
+class TestRecord:
+    """
+    Snapshot of a test and its executions.
+
+    :ivar row: The column values of the test.
+    :ivar executions: The snapshots of the executions of the test.
+    :ivar results: The column values of the test-level flakefighter results.
+    :ivar id: The ID of the test once it has been inserted.
+    """
+
+    __test__ = False  # pylint: disable=C0103
+
+    row: dict
+    executions: list[ExecutionRecord] = field(default_factory=list)
+    results: list[dict] = field(default_factory=list)
+    id: int = None  # pylint: disable=C0103
+
+
+@cache
+def mapped_columns(cls: type) -> list[tuple[str, str, object]]:
+    """
+    Return the attribute name, column name, and scalar default value (if any) of each column of a mapped class.
+    This is cached since inspecting the mapper is much slower than reading the attributes themselves.
+
+    :param cls: The mapped class.
+    """
+    columns = []
+    for attribute in inspect(cls).column_attrs:
+        column = attribute.columns[0]
+        default = column.default.arg if column.default is not None and column.default.is_scalar else None
+        columns.append((attribute.key, column.name, default))
+    return columns
+
+
+def column_values(obj: Base, *exclude: str) -> dict:
+    """
+    Return the column values of a mapped object, keyed by column name.
+    The primary key and any excluded attributes are left out, and unset columns with scalar defaults take their default.
+
+    :param obj: The mapped object.
+    :param exclude: The attributes to leave out, typically foreign keys that are only known once the parent is inserted.
+    """
+    values = {}
+    for key, name, default in mapped_columns(type(obj)):
+        if key == "id" or key in exclude:
+            continue
+        value = getattr(obj, key)
+        values[name] = default if value is None else value
+    return values
+
+
+def result_row(result: FlakefighterResult) -> dict:
+    """
+    Return the column values of a flakefighter result, without its foreign keys.
+
+    :param result: The flakefighter result.
+    """
+    return column_values(result, "test_id", "test_execution_id")
+
+
+def snapshot_execution(execution: TestExecution) -> ExecutionRecord:
+    """
+    Snapshot a test execution.
+
+    :param execution: The test execution.
+    """
+    exception = execution.exception
+    return ExecutionRecord(
+        row=column_values(execution, "test_id", "coverage_id", "inline_coverage"),
+        coverage=execution.coverage,
+        digest=execution.coverage_blob.digest if execution.coverage_blob is not None else None,
+        exception=column_values(exception, "execution_id") if exception is not None else None,
+        traceback=[column_values(entry, "exception_id") for entry in exception.traceback] if exception else [],
+        results=[result_row(result) for result in execution.flakefighter_results],
+    )
+
+
+def snapshot_test(test: Test) -> TestRecord:
+    """
+    Snapshot a test and its executions.
+
+    :param test: The test.
+    """
+    return TestRecord(
+        row=column_values(test, "run_id"),
+        executions=[snapshot_execution(execution) for execution in test.executions],
+        results=[result_row(result) for result in test.flakefighter_results],
+    )
+
+
+def snapshot_run(run: Run) -> tuple[dict, list[dict]]:
+    """
+    Snapshot a run without its tests.
+
+    :param run: The run.
+    :returns: The column values of the run and of each of its active flakefighters.
+    """
+    row = {name: value for name, value in column_values(run).items() if value is not None}
+    return row, [column_values(flakefighter, "run_id") for flakefighter in run.active_flakefighters]
+
+
+def restore_execution(record: ExecutionRecord) -> TestExecution:
+    """
+    Rebuild a test execution from its snapshot.
+
+    :param record: The snapshot of the execution.
+    """
+    exception = record.exception
+    return TestExecution(  # pylint: disable=E1123
+        **record.row,
+        coverage=record.coverage,
+        exception=(
+            TestException(**exception, traceback=[TracebackEntry(**entry) for entry in record.traceback])
+            if exception is not None
+            else None
+        ),
+        flakefighter_results=[FlakefighterResult(**row) for row in record.results],
+    )
+
+
+def restore_test(record: TestRecord) -> Test:
+    """
+    Rebuild a test and its executions from its snapshot, e.g. one taken in another process.
+
+    :param record: The snapshot of the test.
+    """
+    return Test(  # pylint: disable=E1123
+        **record.row,
+        executions=[restore_execution(execution) for execution in record.executions],
+        flakefighter_results=[FlakefighterResult(**row) for row in record.results],
+    )
+
+
+def assign_ids(test: Test, record: TestRecord):
+    """
+    Give a test and its executions the IDs they were inserted with, as if they had been saved through the ORM.
+
+    :param test: The test.
+    :param record: The snapshot of the test, once it has been inserted.
+    """
+    test.id = record.id
+    for execution, execution_record in zip(test.executions, record.executions):
+        execution.id = execution_record.id
+
+
+def insert_returning_ids(connection: Connection, table: Table, rows: list[dict]) -> list[int]:
+    """
+    Insert rows and return their IDs in the same order.
+    Where the database supports it, this is a single statement with RETURNING, otherwise rows are inserted one by one.
+
+    :param connection: The database connection.
+    :param table: The table to insert into.
+    :param rows: The column values of each row.
+    """
+    if not rows:
+        return []
+    if connection.dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        return list(connection.execute(statement, rows).scalars())
+    return [connection.execute(insert(table).values(row)).inserted_primary_key[0] for row in rows]
+
+
+def insert_run(connection: Connection, row: dict, active_flakefighters: list[dict]) -> int:
+    """
+    Insert a run without its tests.
+
+    :param connection: The database connection.
+    :param row: The column values of the run.
+    :param active_flakefighters: The column values of each of its active flakefighters.
+    :returns: The ID of the run.
+    """
+    run_id = connection.execute(insert(Run.__table__).values(row)).inserted_primary_key[0]
+    if active_flakefighters:
+        connection.execute(
+            insert(ActiveFlakeFighter.__table__),
+            [flakefighter | {"run_id": run_id} for flakefighter in active_flakefighters],
+        )
+    return run_id
+
+
+def insert_ignoring_duplicates(connection: Connection, table: Table):
+    """
+    Return a statement that inserts rows into a table, skipping rows that clash with a unique constraint rather than
+    failing, on the databases that support this.
+
+    :param connection: The database connection.
+    :param table: The table to insert into.
+    """
+    if connection.dialect.name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if connection.dialect.name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if connection.dialect.name in ["mysql", "mariadb"]:
+        return insert(table).prefix_with("IGNORE")
+    return insert(table)
+
+
+def stored_coverage_ids(connection: Connection, digests: list[bytes]) -> dict[bytes, int]:
+    """
+    Look up the IDs of stored coverage by content hash.
+
+    :param connection: The database connection.
+    :param digests: The content hashes.
+    :returns: Dictionary mapping the content hash of each stored coverage map to its ID.
+    """
+    table = CoverageBlob.__table__
+    ids = {}
+    for i in range(0, len(digests), LOOKUP_BATCH_SIZE):
+        ids |= dict(
+            connection.execute(
+                select(table.c.digest, table.c.id).where(table.c.digest.in_(digests[i : i + LOOKUP_BATCH_SIZE]))
+            ).all()
+        )
+    return ids
+
+
+def store_coverage(
+    connection: Connection,
+    coverage: dict[bytes, CoverageMap],
+    indexed: bool = False,
+    tests: Union[dict[bytes, str], None] = None,
+) -> dict[bytes, int]:
+    """
+    Store coverage that is not already in the database.
+    The stored coverage is locked first (see :code:`lock_coverage`), so that coverage found here cannot be pruned by
+    another session before the executions that refer to it are inserted. New coverage is inserted skipping any that
+    another session has stored in the meantime, then looked up, rather than failing on its unique content hash.
+
+    :param connection: The database connection.
+    :param coverage: Dictionary mapping the content hash of each coverage map to the map.
+    :param indexed: Whether to add the newly stored coverage to the coverage index.
+    :param tests: Dictionary mapping the content hash of each coverage map to the name of its test, to store new
+                  coverage as deltas relative to the previous coverage of the same test (see :code:`encode_deltas`).
+    :returns: Dictionary mapping each content hash to the ID of its stored coverage.
+    """
+    if not coverage:
+        return {}
+    lock_coverage(connection)
+    ids = stored_coverage_ids(connection, list(coverage))
+    missing = [digest for digest in coverage if digest not in ids]
+    if not missing:
+        return ids
+    if tests is None:
+        rows = [{"digest": digest, "coverage": coverage[digest]} for digest in missing]
+    else:
+        encoded = encode_deltas(connection, {digest: coverage[digest] for digest in missing}, tests)
+        rows = [{"digest": digest} | encoded[digest] for digest in missing]
+    connection.execute(insert_ignoring_duplicates(connection, CoverageBlob.__table__), rows)
+    new_ids = stored_coverage_ids(connection, missing)
+    if indexed:
+        index_coverage(connection, {new_ids[digest]: coverage[digest] for digest in missing})
+    return ids | new_ids
+
+
+def insert_results(connection: Connection, rows: list[dict]):
+    """
+    Insert flakefighter results.
+
+    :param connection: The database connection.
+    :param rows: The column values of each result, including their foreign keys.
+    """
+    if rows:
+        connection.execute(insert(FlakefighterResult.__table__), rows)
+
+
+def insert_exceptions(connection: Connection, executions: list[ExecutionRecord]):
+    """
+    Insert the exceptions of the given executions, with their traceback entries.
+
+    :param connection: The database connection.
+    :param executions: The snapshots of the executions, whose IDs must already be set.
+    """
+    exceptions = [execution for execution in executions if execution.exception is not None]
+    exception_ids = insert_returning_ids(
+        connection,
+        TestException.__table__,
+        [execution.exception | {"execution_id": execution.id} for execution in exceptions],
+    )
+    traceback = [
+        entry | {"exception_id": exception_id}
+        for execution, exception_id in zip(exceptions, exception_ids)
+        for entry in execution.traceback
+    ]
+    if traceback:
+        connection.execute(insert(TracebackEntry.__table__), traceback)
+
+
+def insert_tests(  # pylint: disable=R0913,R0917
+    connection: Connection, run_id: int, records: list[TestRecord], indexed: bool = False, deltas: bool = False
+):
+    """
+    Insert tests with their executions, exceptions, and flakefighter results, setting the ID of each record.
+
+    :param connection: The database connection.
+    :param run_id: The ID of the run the tests belong to.
+    :param records: The snapshots of the tests.
+    :param indexed: Whether to add newly stored coverage to the coverage index.
+    :param deltas: Whether to store new coverage as deltas relative to the previous coverage of the same test.
+    """
+    executions = [(record, execution) for record in records for execution in record.executions]
+    tests = {execution.digest: record.row["name"] for record, execution in executions if execution.digest}
+    coverage_ids = store_coverage(
+        connection,
+        {execution.digest: execution.coverage for _, execution in executions if execution.digest},
+        indexed,
+        tests if deltas else None,
+    )
+
+    test_ids = insert_returning_ids(connection, Test.__table__, [record.row | {"run_id": run_id} for record in records])
+    for record, test_id in zip(records, test_ids):
+        record.id = test_id
+
+    execution_ids = insert_returning_ids(
+        connection,
+        TestExecution.__table__,
+        [
+            execution.row | {"test_id": record.id, "coverage_id": coverage_ids.get(execution.digest)}
+            for record, execution in executions
+        ],
+    )
+    for (_, execution), execution_id in zip(executions, execution_ids):
+        execution.id = execution_id
+
+    insert_exceptions(connection, [execution for _, execution in executions])
+
+    insert_results(
+        connection,
+        [result | {"test_id": record.id, "test_execution_id": None} for record in records for result in record.results]
+        + [
+            result | {"test_id": None, "test_execution_id": execution.id}
+            for _, execution in executions
+            for result in execution.results
+        ],
+    )
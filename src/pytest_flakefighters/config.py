@@ -27,11 +27,39 @@ options = {
         "default": False,
         "help": "Do not save this run to the database of previous flakefighters runs.",
     },
+    ("--stream-results",): {
+        "action": "store_true",
+        "default": False,
+        "help": "Write each test to the database in the background as soon as it finishes, rather than saving the "
+        "whole run at the end of the session. Tests are released from memory once written if nothing else needs them.",
+    },
     ("--function-coverage",): {
         "action": "store_true",
         "default": False,
         "help": "Use function-level coverage instead of line coverage.",
     },
+    ("--monitoring-coverage",): {
+        "action": "store_true",
+        "default": False,
+        "help": "Measure line coverage with sys.monitoring instead of coverage.py. Requires Python 3.12 or later.",
+    },
+    ("--coverage-include",): {
+        "action": "store",
+        "nargs": "+",
+        "help": "Glob patterns of extra files to measure coverage of. "
+        "By default, only files under the project root are measured.",
+    },
+    ("--coverage-omit",): {
+        "action": "store",
+        "nargs": "+",
+        "help": "Glob patterns of files not to measure coverage of, e.g. '*/tests/*'.",
+    },
+    ("--continuous-coverage",): {
+        "action": "store_true",
+        "default": False,
+        "help": "Start coverage measurement once for the whole session and switch contexts between tests, "
+        "rather than starting and stopping it around each test. Test setup and teardown are not measured.",
+    },
     ("--load-max-runs", "-M"): {
         "action": "store",
         "default": None,
@@ -42,6 +70,36 @@ options = {
         "default": "sqlite:///flakefighters.db",
         "help": "The database URL. Defaults to 'flakefighters.db' in current working directory.",
     },
+    ("--concurrent-database",): {
+        "action": "store_true",
+        "default": False,
+        "help": "Tune a SQLite database for several test sessions writing to it at once, e.g. parallel CI jobs sharing "
+        "one database file. Saves that find the database locked are retried.",
+    },
+    ("--history-cache",): {
+        "action": "store_true",
+        "default": False,
+        "help": "Keep a local copy of the history of previous runs in the pytest cache directory, so that only runs "
+        "saved since the previous session are downloaded from the database. Useful for remote databases.",
+    },
+    ("--coverage-index",): {
+        "action": "store_true",
+        "default": False,
+        "help": "Index the lines covered by each stored test execution, so that the executions that covered given "
+        "lines can be found with a single database query. Saving runs takes longer and the database is larger.",
+    },
+    ("--coverage-deltas",): {
+        "action": "store_true",
+        "default": False,
+        "help": "Store the coverage of each test execution as the lines added and removed relative to the previous "
+        "execution of the same test, where that is smaller than storing it in full.",
+    },
+    ("--coverage-store",): {
+        "action": "store",
+        "default": None,
+        "help": "A directory in which to also store the coverage of each saved run as a memory-mapped matrix, for fast "
+        "analysis over many runs. Every session sharing the database should use the same directory.",
+    },
     ("--store-max-runs",): {
         "action": "store",
         "default": None,
@@ -0,0 +1,265 @@
+"""
+This module implements the storage of line coverage in the test run database, which is shared between executions.
+Coverage can be stored in full or as a delta relative to previous coverage of the same test, and can be indexed by the
+ranges of lines it covers, so that the coverage that includes given lines can be found without decoding every blob.
+"""
+
+from collections.abc import Iterable
+
+from sqlalchemy import Connection, delete, func, insert, select, update
+
+from pytest_flakefighters.coverage_map import CoverageMap, pack_delta
+from pytest_flakefighters.models import (
+    LOOKUP_BATCH_SIZE,
+    CoverageBlob,
+    CoveredFile,
+    CoveredRange,
+    SchemaVersion,
+    Test,
+    TestExecution,
+    apply_delta,
+)
+
+# Maximum number of line ranges to look up per query of the coverage index, each of which takes three query parameters
+RANGE_BATCH_SIZE = LOOKUP_BATCH_SIZE // 3
+# Coverage stored as a delta is based on coverage at most this many deltas away from coverage stored in full, so that
+# reconstructing it never reads a long chain of deltas
+KEYFRAME_INTERVAL = 8
+
+
+def lock_coverage(connection: Connection):
+    """
+    Lock the stored coverage until the end of the transaction, so that sessions storing coverage and pruning it never
+    run at the same time. Otherwise, coverage that one session has found already stored could be pruned by another
+    before the executions that refer to it are inserted.
+    The lock is taken by touching the row that records the version of the stored coverage, which takes the write lock
+    of SQLite databases and locks that row in other databases.
+    :param connection: The database connection, within a transaction.
+    """
+    connection.execute(
+        update(SchemaVersion).where(SchemaVersion.name == "coverage").values(version=SchemaVersion.version)
+    )
+
+
+def load_coverage(connection: Connection, coverage_ids: Iterable[int]) -> dict[int, CoverageMap]:
+    """
+    Load stored coverage, reconstructing coverage that is stored as a delta from the coverage it is based on.
+    Each level of the chains of deltas is read with one query per batch, rather than one query per coverage.
+    :param connection: The database connection.
+    :param coverage_ids: The IDs of the stored coverage.
+    :returns: Dictionary mapping each ID to the covered lines.
+    """
+    coverage_ids = list(coverage_ids)
+    rows = {}
+    pending = sorted(set(coverage_ids))
+    while pending:
+        for i in range(0, len(pending), LOOKUP_BATCH_SIZE):
+            for row in connection.execute(
+                select(CoverageBlob.id, CoverageBlob.coverage, CoverageBlob.delta, CoverageBlob.base_id).where(
+                    CoverageBlob.id.in_(pending[i : i + LOOKUP_BATCH_SIZE])
+                )
+            ):
+                rows[row.id] = row
+        pending = sorted({row.base_id for row in rows.values() if row.delta is not None and row.base_id not in rows})
+
+    resolved = {}
+
+    def resolve(coverage_id: int) -> CoverageMap:
+        chain = []
+        while coverage_id not in resolved and rows[coverage_id].delta is not None:
+            chain.append(coverage_id)
+            coverage_id = rows[coverage_id].base_id
+        coverage = resolved.setdefault(coverage_id, rows[coverage_id].coverage)
+        for delta_id in reversed(chain):
+            coverage = resolved[delta_id] = apply_delta(coverage, rows[delta_id].delta)
+        return coverage
+
+    return {coverage_id: resolve(coverage_id) for coverage_id in coverage_ids}
+
+
+def latest_coverage_ids(connection: Connection, names: Iterable[str]) -> dict[str, int]:
+    """
+    Look up the stored coverage of the most recent execution of each of the given tests that has any.
+    :param connection: The database connection.
+    :param names: The names of the tests.
+    :returns: Dictionary mapping the name of each test to the ID of its coverage blob.
+    """
+    names = sorted(names)
+    coverage_ids = {}
+    for i in range(0, len(names), LOOKUP_BATCH_SIZE):
+        latest = (
+            select(func.max(TestExecution.id))
+            .select_from(TestExecution)
+            .join(Test, Test.id == TestExecution.test_id)
+            .where(Test.name.in_(names[i : i + LOOKUP_BATCH_SIZE]), TestExecution.coverage_id.is_not(None))
+            .group_by(Test.name)
+        )
+        coverage_ids |= dict(
+            connection.execute(
+                select(Test.name, TestExecution.coverage_id)
+                .join(Test, Test.id == TestExecution.test_id)
+                .where(TestExecution.id.in_(latest))
+            ).all()
+        )
+    return coverage_ids
+
+
+def encode_deltas(
+    connection: Connection, coverage: dict[bytes, CoverageMap], tests: dict[bytes, str]
+) -> dict[bytes, dict]:
+    """
+    Choose how to store new coverage, as a delta relative to the most recently stored coverage of the same test where
+    that is smaller than storing it in full. Coverage that is already :code:`KEYFRAME_INTERVAL - 1` deltas away from
+    coverage stored in full is stored in full instead, as a keyframe that later deltas can be based on.
+    :param connection: The database connection.
+    :param coverage: Dictionary mapping the content hash of each new coverage map to the map.
+    :param tests: Dictionary mapping the content hash of each new coverage map to the name of its test.
+    :returns: Dictionary mapping each content hash to the column values to store the coverage with.
+    """
+    references = latest_coverage_ids(connection, set(tests.values()))
+    reference_ids = sorted(set(references.values()))
+    depths = {}
+    for i in range(0, len(reference_ids), LOOKUP_BATCH_SIZE):
+        depths |= {
+            coverage_id: depth or 0
+            for coverage_id, depth in connection.execute(
+                select(CoverageBlob.id, CoverageBlob.depth).where(
+                    CoverageBlob.id.in_(reference_ids[i : i + LOOKUP_BATCH_SIZE])
+                )
+            )
+        }
+    bases = load_coverage(
+        connection, [coverage_id for coverage_id, depth in depths.items() if depth + 1 < KEYFRAME_INTERVAL]
+    )
+
+    rows = {}
+    for digest, coverage_map in coverage.items():
+        rows[digest] = {"coverage": coverage_map, "delta": None, "base_id": None, "depth": 0}
+        base_id = references.get(tests.get(digest))
+        if base_id in bases:
+            added = coverage_map - bases[base_id]
+            removed = bases[base_id] - coverage_map
+            if added.line_count() + removed.line_count() < coverage_map.line_count():
+                rows[digest] = {
+                    "coverage": None,
+                    "delta": pack_delta(added, removed),
+                    "base_id": base_id,
+                    "depth": depths[base_id] + 1,
+                }
+    return rows
+
+
+def index_coverage(connection: Connection, coverage: dict[int, CoverageMap]):
+    """
+    Add stored coverage to the coverage index, as the ranges of consecutive lines it covers in each file.
+    :param connection: The database connection.
+    :param coverage: Dictionary mapping the ID of each stored coverage map to the map.
+    """
+    ranges = [
+        (coverage_id, path, first_line, last_line)
+        for coverage_id, coverage_map in coverage.items()
+        for path, first_line, last_line in coverage_map.ranges()
+    ]
+    if not ranges:
+        return
+    file_ids = covered_file_ids(connection, {path for _, path, _, _ in ranges})
+    missing = sorted({path for _, path, _, _ in ranges} - set(file_ids))
+    if missing:
+        connection.execute(insert(CoveredFile), [{"path": path} for path in missing])
+        file_ids |= covered_file_ids(connection, missing)
+    connection.execute(
+        insert(CoveredRange),
+        [
+            {"coverage_id": coverage_id, "file_id": file_ids[path], "first_line": first_line, "last_line": last_line}
+            for coverage_id, path, first_line, last_line in ranges
+        ],
+    )
+
+
+def covered_file_ids(connection: Connection, paths: Iterable[str]) -> dict[str, int]:
+    """
+    Look up the IDs of covered files in the coverage index.
+    :param connection: The database connection.
+    :param paths: The file paths.
+    :returns: Dictionary mapping the path of each file in the index to its ID.
+    """
+    paths = list(paths)
+    file_ids = {}
+    for i in range(0, len(paths), LOOKUP_BATCH_SIZE):
+        file_ids |= dict(
+            connection.execute(
+                select(CoveredFile.path, CoveredFile.id).where(CoveredFile.path.in_(paths[i : i + LOOKUP_BATCH_SIZE]))
+            ).all()
+        )
+    return file_ids
+
+
+def indexed_coverage_id(connection: Connection) -> int:
+    """
+    Return the ID of the most recent stored coverage that the coverage index was last brought up to date with.
+    Coverage up to this ID has been indexed, apart from coverage with no lines, which has nothing to index.
+    :param connection: The database connection.
+    """
+    return connection.scalar(select(SchemaVersion.version).where(SchemaVersion.name == "coverage_index")) or 0
+
+
+def coverage_index_outdated(connection: Connection) -> bool:
+    """
+    Return whether coverage has been stored since the coverage index was last brought up to date, which it may not have
+    been indexed with, e.g. if it was saved by a session without the index.
+    :param connection: The database connection.
+    """
+    newer = select(CoverageBlob.id).where(CoverageBlob.id > indexed_coverage_id(connection)).limit(1)
+    return connection.scalar(newer) is not None
+
+
+def backfill_coverage_index(connection: Connection) -> int:
+    """
+    Add the stored coverage that is missing from the coverage index, e.g. because it was saved before the index was
+    enabled, then record the most recent coverage the index is up to date with. Only coverage stored since the index
+    was last brought up to date is checked, so coverage with no lines (which never has any entries in the index) is
+    only ever read once.
+    :param connection: The database connection, within a transaction.
+    :returns: The number of coverage maps that were added.
+    """
+    added = 0
+    last_id = indexed_coverage_id(connection)
+    while True:
+        coverage_ids = connection.scalars(
+            select(CoverageBlob.id)
+            .where(CoverageBlob.id > last_id, CoverageBlob.id.not_in(select(CoveredRange.coverage_id)))
+            .order_by(CoverageBlob.id)
+            .limit(LOOKUP_BATCH_SIZE)
+        ).all()
+        if not coverage_ids:
+            break
+        last_id = coverage_ids[-1]
+        index_coverage(connection, load_coverage(connection, coverage_ids))
+        added += len(coverage_ids)
+    last_id = max(last_id, connection.scalar(select(func.max(CoverageBlob.id))) or 0)
+    connection.execute(delete(SchemaVersion).where(SchemaVersion.name == "coverage_index"))
+    connection.execute(insert(SchemaVersion).values(name="coverage_index", version=last_id))
+    return added
+
+
+def prune_coverage(connection: Connection):
+    """
+    Delete the stored coverage that is no longer referenced, together with its entries in the coverage index.
+    Coverage is shared between executions, and may be the base of other coverage, so is only deleted once neither a
+    stored execution nor any other stored coverage references it. Deleting coverage may leave its base unreferenced, so
+    this is repeated until no more coverage is deleted.
+    :param connection: The database connection, within a transaction.
+    """
+    lock_coverage(connection)
+    unreferenced = select(CoverageBlob.id).where(
+        CoverageBlob.id.not_in(select(TestExecution.coverage_id).where(TestExecution.coverage_id.is_not(None))),
+        CoverageBlob.id.not_in(select(CoverageBlob.base_id).where(CoverageBlob.base_id.is_not(None))),
+    )
+    while True:
+        unreferenced_ids = connection.scalars(unreferenced).all()
+        if not unreferenced_ids:
+            return
+        for i in range(0, len(unreferenced_ids), LOOKUP_BATCH_SIZE):
+            batch = unreferenced_ids[i : i + LOOKUP_BATCH_SIZE]
+            connection.execute(delete(CoveredRange).where(CoveredRange.coverage_id.in_(batch)))
+            connection.execute(delete(CoverageBlob).where(CoverageBlob.id.in_(batch)))
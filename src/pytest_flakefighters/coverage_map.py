@@ -0,0 +1,495 @@
+"""
+This module implements the CoverageMap class, the compact representation of line coverage used throughout the plugin.
+"""
+
+import hashlib
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Typecode of an unsigned integer of (at least) 32 bits. This is "I" on every mainstream platform.
+LINE_TYPECODE = "I" if array("I").itemsize >= 4 else "L"
+# NumPy dtype with the same layout as the line arrays, to convert between them by copying bytes
+LINE_DTYPE = f"=u{array(LINE_TYPECODE).itemsize}"
+
+# Version of the packed binary encoding, stored as its first byte. This must never be 0x80, which begins a pickle.
+PACKED_VERSION = 1
+# Flag set in the second byte of the packed encoding if the rest of it is zlib-compressed
+PACKED_ZLIB = 1
+# Packed coverage of at least this many bytes is compressed, if that makes it smaller. Decompressing roughly doubles the
+# time taken to decode, so smaller maps, which gain little from compression, are left uncompressed.
+COMPRESS_THRESHOLD = 8192
+
+
+class FileTable:  # pylint: disable=R0903
+    """
+    Intern file paths as small integer IDs so that each path string is stored once per process, no matter how many
+    test executions cover the file.
+
+    :ivar paths: The path of each file, indexed by its ID.
+    :ivar ids: The ID of each file, indexed by its path.
+    """
+
+    def __init__(self):
+        self.paths: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, path: str) -> int:
+        """
+        Return the ID of a file path, assigning it a new one if it has not been seen before.
+
+        :param path: The file path.
+        """
+        file_id = self.ids.get(path)
+        if file_id is None:
+            file_id = self.ids[path] = len(self.paths)
+            self.paths.append(path)
+        return file_id
+
+
+FILES = FileTable()
+
+
+def _sorted_lines(lines: Iterable[int]) -> array:
+    """
+    Return the distinct line numbers in ascending order as a compact array.
+
+    :param lines: The line numbers.
+    """
+    return array(LINE_TYPECODE, sorted(set(lines)))
+
+
+def _pack_varint(out: bytearray, value: int):
+    """
+    Append an unsigned integer as a varint, seven bits per byte with the high bit set on every byte but the last.
+
+    :param out: The buffer to append to.
+    :param value: The integer.
+    """
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _unpack_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """
+    Read a varint.
+
+    :param data: The buffer to read from.
+    :param offset: The offset of the varint.
+    :returns: The integer and the offset after it.
+    """
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _pack_varints(values) -> bytes:
+    """
+    Encode an array of unsigned integers as varints, all at once.
+
+    :param values: The integers, as a NumPy array of unsigned 64-bit integers.
+    """
+    import numpy as np  # pylint: disable=C0415
+
+    # Covered lines are usually close together, so most deltas fit in a single byte
+    if not values.size or values.max() < 0x80:
+        return values.astype(np.uint8).tobytes()
+    sizes = np.ones(len(values), dtype=np.int64)
+    for bits in range(7, 64, 7):
+        sizes += values >= 1 << bits
+    offsets = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for i in range(int(sizes.max())):
+        has_byte = sizes > i
+        more = (sizes[has_byte] > i + 1).astype(np.uint8) << 7
+        out[offsets[has_byte] + i] = ((values[has_byte] >> np.uint64(7 * i)) & 0x7F).astype(np.uint8) | more
+    return out.tobytes()
+
+
+def _unpack_varints(data: bytes):
+    """
+    Decode a stream of varints, all at once.
+
+    :param data: The stream.
+    :returns: The integers, as a NumPy array of unsigned 64-bit integers.
+    """
+    import numpy as np  # pylint: disable=C0415
+
+    stream = np.frombuffer(data, dtype=np.uint8)
+    if not stream.size or stream.max() < 0x80:
+        return stream.astype(np.uint64)
+    # Each varint ends with the first byte without the high bit set
+    ends = np.flatnonzero(stream < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = ((np.arange(len(stream)) - np.repeat(starts, ends - starts + 1)) * 7).astype(np.uint64)
+    return np.add.reduceat((stream & 0x7F).astype(np.uint64) << shifts, starts)
+
+
+def _pack_lines(lines: list[array]) -> bytes:
+    """
+    Encode the sorted line numbers of several files as two streams of varints: the number of lines and the first line
+    of each file (prefixed with the length of the stream), then the gaps between the other lines of every file.
+    Covered lines are usually close together, so the gaps can usually be decoded as plain bytes.
+
+    :param lines: The sorted line numbers of each file.
+    """
+    import numpy as np  # pylint: disable=C0415
+
+    counts = np.array([len(file_lines) for file_lines in lines], dtype=np.uint64)
+    values = np.frombuffer(b"".join(file_lines.tobytes() for file_lines in lines), dtype=LINE_DTYPE).astype(np.uint64)
+    starts = (np.cumsum(counts) - counts).astype(np.int64)
+    header = _pack_varints(np.concatenate((counts, values[starts])))
+    packed = bytearray()
+    _pack_varint(packed, len(header))
+    return bytes(packed) + header + _pack_varints(np.delete(np.diff(values, prepend=np.uint64(0)), starts))
+
+
+def _unpack_lines(data: bytes, files: int) -> list[array]:
+    """
+    Decode streams encoded by :code:`_pack_lines` straight into line arrays, without a Python object per line.
+
+    :param data: The streams.
+    :param files: The number of files.
+    """
+    import numpy as np  # pylint: disable=C0415
+
+    size, offset = _unpack_varint(data, 0)
+    header = _unpack_varints(data[offset : offset + size])
+    counts = header[:files].astype(np.int64)
+    bounds = np.cumsum(counts)
+    starts = bounds - counts
+    # Restore the first line of each file in front of its gaps, then sum the gaps, starting each file from zero
+    steps = np.ones(int(bounds[-1]), dtype=bool)
+    steps[starts] = False
+    increments = np.empty(len(steps), dtype=np.uint64)
+    increments[starts] = header[files:]
+    increments[steps] = _unpack_varints(data[offset + size :])
+    totals = np.cumsum(increments)
+    previous = np.concatenate(([0], totals[starts[1:] - 1])).astype(np.uint64)
+    return _split_lines((totals - np.repeat(previous, counts)).astype(LINE_DTYPE), bounds.tolist())
+
+
+def _split_lines(lines: "np.ndarray", bounds: list[int]) -> list[array]:
+    """
+    Split the concatenated lines of several files into a line array per file.
+
+    :param lines: The lines of every file, one file after another.
+    :param bounds: The offset of the end of each file's lines.
+    """
+    buffer = memoryview(lines.tobytes())
+    itemsize = array(LINE_TYPECODE).itemsize
+    result = []
+    for start, end in zip([0] + bounds[:-1], bounds):
+        file_lines = array(LINE_TYPECODE)
+        file_lines.frombytes(buffer[start * itemsize : end * itemsize])
+        result.append(file_lines)
+    return result
+
+
+def _unpickle(coverage: dict[str, list[int]]) -> "CoverageMap":
+    """
+    Restore a pickled CoverageMap.
+
+    :param coverage: Dictionary mapping each file path to its sorted covered lines.
+    """
+    return CoverageMap.from_ids({FILES.intern(path): array(LINE_TYPECODE, lines) for path, lines in coverage.items()})
+
+
+class CoverageMap(Mapping):
+    """
+    Immutable line coverage, mapping each covered file to the sorted array of its covered lines.
+    Files are keyed internally by their ID in the shared :code:`FILES` table and lines are stored as packed unsigned
+    integers, so a map costs a few bytes per covered line rather than a Python object per line.
+    Maps can be combined with :code:`|` (union) and :code:`&` (intersection), and membership of individual lines is
+    checked by binary search.
+
+    Since it is a :code:`Mapping`, a CoverageMap can be used anywhere the dictionaries of lists it replaces were.
+    Files with no covered lines are never stored.
+    """
+
+    __slots__ = ("_lines",)
+
+    def __init__(self, coverage: Mapping[str, Iterable[int]] = None):
+        """
+        :param coverage: Dictionary mapping each file path to its covered lines, in any order.
+        """
+        self._lines: dict[int, array] = {}
+        for path, lines in (coverage or {}).items():
+            file_lines = _sorted_lines(lines)
+            if file_lines:
+                self._lines[FILES.intern(path)] = file_lines
+
+    @classmethod
+    def from_ids(cls, lines: dict[int, array]) -> "CoverageMap":
+        """
+        Create a CoverageMap directly from sorted line arrays keyed by file ID, without copying or sorting them.
+
+        :param lines: Dictionary mapping file IDs to sorted line arrays.
+        """
+        coverage = cls()
+        coverage._lines = {file_id: file_lines for file_id, file_lines in lines.items() if file_lines}
+        return coverage
+
+    def __getitem__(self, path: str) -> array:
+        file_id = FILES.ids.get(path)
+        if file_id is None or file_id not in self._lines:
+            raise KeyError(path)
+        return self._lines[file_id]
+
+    def __contains__(self, path: object) -> bool:
+        return FILES.ids.get(path) in self._lines
+
+    def __iter__(self) -> Iterator[str]:
+        return (FILES.paths[file_id] for file_id in self._lines)
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, CoverageMap):
+            return self._lines == other._lines
+        if isinstance(other, Mapping):
+            return self == CoverageMap(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(frozenset((file_id, file_lines.tobytes()) for file_id, file_lines in self._lines.items()))
+
+    def __repr__(self) -> str:
+        return f"CoverageMap({ {path: list(lines) for path, lines in self.items()} })"
+
+    def __reduce__(self):
+        # Pickle lines as lists, since pickle stores small integers more compactly than packed 32-bit arrays
+        return (_unpickle, ({path: lines.tolist() for path, lines in self.items()},))
+
+    def __or__(self, other: "CoverageMap") -> "CoverageMap":
+        if not isinstance(other, CoverageMap):
+            return NotImplemented
+        lines = dict(self._lines)
+        for file_id, file_lines in other._lines.items():
+            lines[file_id] = _sorted_lines(lines[file_id] + file_lines) if file_id in lines else file_lines
+        return CoverageMap.from_ids(lines)
+
+    def __and__(self, other: "CoverageMap") -> "CoverageMap":
+        if not isinstance(other, CoverageMap):
+            return NotImplemented
+        return CoverageMap.from_ids(
+            {
+                file_id: _sorted_lines(set(file_lines).intersection(other._lines[file_id]))
+                for file_id, file_lines in self._lines.items()
+                if file_id in other._lines
+            }
+        )
+
+    def __sub__(self, other: "CoverageMap") -> "CoverageMap":
+        if not isinstance(other, CoverageMap):
+            return NotImplemented
+        return CoverageMap.from_ids(
+            {
+                file_id: (
+                    _sorted_lines(set(file_lines).difference(other._lines[file_id]))
+                    if file_id in other._lines
+                    else file_lines
+                )
+                for file_id, file_lines in self._lines.items()
+            }
+        )
+
+    @classmethod
+    def union(cls, *coverages: "CoverageMap") -> "CoverageMap":
+        """
+        Return the lines covered by any of the given maps.
+
+        :param coverages: The coverage maps to merge.
+        """
+        lines: dict[int, set[int]] = {}
+        for coverage in coverages:
+            for file_id, file_lines in coverage._lines.items():  # pylint: disable=W0212
+                lines.setdefault(file_id, set()).update(file_lines)
+        return cls.from_ids({file_id: _sorted_lines(file_lines) for file_id, file_lines in lines.items()})
+
+    @classmethod
+    def intersection(cls, *coverages: "CoverageMap") -> "CoverageMap":
+        """
+        Return the lines covered by every one of the given maps.
+
+        :param coverages: The coverage maps to intersect.
+        """
+        if not coverages:
+            return cls()
+        result = coverages[0]
+        for coverage in coverages[1:]:
+            result = result & coverage
+        return result
+
+    def pack(self, compress: bool = None) -> bytes:
+        """
+        Encode the map compactly, to store it in the database.
+        The encoding is a version byte and a flags byte, followed by the table of covered files (their number, then
+        their paths separated by null characters), then the number of covered lines and the first covered line of each
+        file, then the gaps between the other covered lines of every file. Each integer is a varint.
+        Unlike unpickling, decoding never creates a Python object per line, since the lines are decoded straight into
+        the arrays of the map.
+
+        :param compress: Whether to zlib-compress the encoding. Defaults to compressing it if it is at least
+                         :code:`COMPRESS_THRESHOLD` bytes and compression makes it smaller.
+        """
+        paths = "\0".join(FILES.paths[file_id] for file_id in self._lines).encode()
+        body = bytearray()
+        _pack_varint(body, len(self._lines))
+        _pack_varint(body, len(paths))
+        body += paths
+        body += _pack_lines(list(self._lines.values()))
+        if compress is None:
+            compress = len(body) >= COMPRESS_THRESHOLD
+        if compress:
+            compressed = zlib.compress(body)
+            if len(compressed) < len(body):
+                return bytes([PACKED_VERSION, PACKED_ZLIB]) + compressed
+        return bytes([PACKED_VERSION, 0]) + body
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "CoverageMap":
+        """
+        Decode a map encoded by :code:`pack`.
+
+        :param data: The encoded map.
+        """
+        if data[0] != PACKED_VERSION:
+            raise ValueError(f"Unsupported packed coverage version {data[0]}")
+        body = zlib.decompress(data[2:]) if data[1] & PACKED_ZLIB else bytes(data[2:])
+        files, offset = _unpack_varint(body, 0)
+        if not files:
+            return cls()
+        size, offset = _unpack_varint(body, offset)
+        file_ids = [FILES.intern(path) for path in body[offset : offset + size].decode().split("\0")]
+        return cls.from_ids(dict(zip(file_ids, _unpack_lines(body[offset + size :], files))))
+
+    def digest(self) -> bytes:
+        """
+        Return a 128-bit hash of the covered lines, to identify the map by its content.
+        The hash is the same for equal maps on every platform.
+        """
+        blake = hashlib.blake2b(digest_size=16)
+        for path, lines in sorted(self.items()):
+            if sys.byteorder == "big":  # pragma: no cover
+                lines = array(LINE_TYPECODE, lines)
+                lines.byteswap()
+            blake.update(path.encode())
+            blake.update(b"\0")
+            blake.update(len(lines).to_bytes(4, "little"))
+            blake.update(lines.tobytes())
+        return blake.digest()
+
+    def covers(self, path: str, line: int) -> bool:
+        """
+        Return whether the given line is covered.
+
+        :param path: The file path.
+        :param line: The line number.
+        """
+        file_lines = self._lines.get(FILES.ids.get(path))
+        if file_lines is None:
+            return False
+        index = bisect_left(file_lines, line)
+        return index < len(file_lines) and file_lines[index] == line
+
+    def lines(self, path: str) -> array:
+        """
+        Return the covered lines of a file, which are empty if the file is not covered.
+
+        :param path: The file path.
+        """
+        return self._lines.get(FILES.ids.get(path), array(LINE_TYPECODE))
+
+    def filter(self, predicate: Callable[[str], bool]) -> "CoverageMap":
+        """
+        Return the coverage of only the files whose paths satisfy the given predicate.
+
+        :param predicate: Function from a file path to whether its coverage should be kept.
+        """
+        return CoverageMap.from_ids(
+            {file_id: lines for file_id, lines in self._lines.items() if predicate(FILES.paths[file_id])}
+        )
+
+    def statements(self) -> Iterator[tuple[int, int]]:
+        """
+        Iterate over every covered statement as a (file ID, line) pair, e.g. to use as compact feature keys.
+        """
+        for file_id, file_lines in self._lines.items():
+            for line in file_lines:
+                yield file_id, line
+
+    def statement_keys(self) -> "np.ndarray":
+        """
+        Return every covered statement as an array of integer keys, with the file ID in the upper 32 bits and the line
+        in the lower 32 bits, e.g. to build coverage matrices without iterating over each statement in Python.
+        """
+        import numpy as np  # pylint: disable=C0415
+
+        if not self._lines:
+            return np.zeros(0, dtype=np.uint64)
+        return np.concatenate(
+            [
+                (np.uint64(file_id) << np.uint64(32)) | np.frombuffer(file_lines, dtype=LINE_DTYPE).astype(np.uint64)
+                for file_id, file_lines in self._lines.items()
+            ]
+        )
+
+    def ranges(self) -> Iterator[tuple[str, int, int]]:
+        """
+        Iterate over every range of consecutive covered lines as a (path, first line, last line) triple.
+        """
+        import numpy as np  # pylint: disable=C0415
+
+        for file_id, file_lines in self._lines.items():
+            lines = np.frombuffer(file_lines, dtype=LINE_DTYPE)
+            breaks = np.flatnonzero(np.diff(lines) != 1)
+            firsts = np.concatenate(([0], breaks + 1))
+            lasts = np.concatenate((breaks, [len(lines) - 1]))
+            for first, last in zip(lines[firsts].tolist(), lines[lasts].tolist()):
+                yield FILES.paths[file_id], first, last
+
+    def line_count(self) -> int:
+        """
+        Return the total number of covered lines across all files.
+        """
+        return sum(len(file_lines) for file_lines in self._lines.values())
+
+
+def pack_delta(added: CoverageMap, removed: CoverageMap) -> bytes:
+    """
+    Encode the difference between two coverage maps as the packed lines that were added, preceded by their length, then
+    the packed lines that were removed.
+
+    :param added: The lines covered by the new map but not the old one.
+    :param removed: The lines covered by the old map but not the new one.
+    """
+    packed = added.pack()
+    out = bytearray()
+    _pack_varint(out, len(packed))
+    return bytes(out) + packed + removed.pack()
+
+
+def unpack_delta(data: bytes) -> tuple[CoverageMap, CoverageMap]:
+    """
+    Decode a difference encoded by :code:`pack_delta`.
+
+    :param data: The encoded difference.
+    :returns: The lines that were added and the lines that were removed.
+    """
+    length, offset = _unpack_varint(data, 0)
+    return CoverageMap.unpack(data[offset : offset + length]), CoverageMap.unpack(data[offset + length :])
@@ -0,0 +1,296 @@
+"""
+This module implements a sidecar store of coverage matrices alongside the database, for analyses over many runs.
+The coverage of each saved run is written to its own directory as a boolean sparse matrix, with one row per test
+execution and one column per covered statement, in compressed sparse row (CSR) form. The arrays are stored as
+:code:`.npy` files and memory-mapped on read, so that they can be analysed without decoding the coverage of each
+execution into Python objects.
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+from typing import TYPE_CHECKING, Union
+
+import numpy as np
+
+from pytest_flakefighters.coverage_map import FILES, CoverageMap
+
+if TYPE_CHECKING:
+    from scipy.sparse import csr_array
+
+# Incremented whenever the layout of the stored matrices changes, so that matrices from other versions are not misread
+FORMAT_VERSION = 1
+# The arrays that make up each stored matrix
+ARRAYS = ["execution_ids", "paths", "column_files", "column_lines", "indptr", "indices"]
+
+
+class CoverageMatrix:
+    """
+    Boolean matrix of the statements covered by a set of test executions, in compressed sparse row (CSR) form.
+    Row :code:`i` covers the columns :code:`indices[indptr[i]:indptr[i + 1]]`, in ascending order.
+    Columns are ordered by file then line.
+
+    :ivar execution_ids: The ID of the execution of each row.
+    :ivar paths: The path of each covered file.
+    :ivar column_files: The index into :code:`paths` of the file of each column.
+    :ivar column_lines: The line of each column.
+    :ivar indptr: The offsets into :code:`indices` of the start of each row, followed by the number of entries.
+    :ivar indices: The columns covered by each row.
+    """
+
+    def __init__(  # pylint: disable=R0913,R0917
+        self,
+        execution_ids: np.ndarray,
+        paths: np.ndarray,
+        column_files: np.ndarray,
+        column_lines: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+    ):
+        self.execution_ids = execution_ids
+        self.paths = paths
+        self.column_files = column_files
+        self.column_lines = column_lines
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_coverage(
+        cls, coverage: list[Union[CoverageMap, None]], execution_ids: list[int] = None
+    ) -> "CoverageMatrix":
+        """
+        Build the matrix of the given coverage.
+        :param coverage: The lines covered by each execution, or None for executions without coverage.
+        :param execution_ids: The ID of each execution, if known.
+        """
+        keys = [coverage_map.statement_keys() for coverage_map in coverage if coverage_map is not None]
+        counts = [coverage_map.line_count() if coverage_map is not None else 0 for coverage_map in coverage]
+        # The columns are the distinct statements, which are sorted by file ID then line since the line is in the
+        # lower bits of each key
+        statements, columns = np.unique(
+            np.concatenate(keys) if keys else np.zeros(0, dtype=np.uint64), return_inverse=True
+        )
+        rows = np.repeat(np.arange(len(coverage)), counts)
+        order = np.lexsort((columns, rows))
+        return cls.from_statements(
+            execution_ids if execution_ids is not None else [-1] * len(coverage),
+            statements,
+            np.concatenate(([0], np.cumsum(counts))),
+            columns[order],
+        )
+
+    @classmethod
+    def concatenate(cls, matrices: list["CoverageMatrix"]) -> "CoverageMatrix":
+        """
+        Build the matrix of the rows of several matrices, in order, whose columns are the union of their columns.
+        :param matrices: The matrices to concatenate.
+        """
+        if not matrices:
+            return cls.from_coverage([])
+        keys = [matrix.statement_keys() for matrix in matrices]
+        statements, columns = np.unique(np.concatenate(keys), return_inverse=True)
+        # The columns of each matrix are sorted, so mapping them onto the merged columns keeps each row in order
+        bounds = np.cumsum([0] + [len(matrix_keys) for matrix_keys in keys]).tolist()
+        offsets = np.cumsum([0] + [len(matrix.indices) for matrix in matrices]).tolist()
+        return cls.from_statements(
+            np.concatenate([matrix.execution_ids for matrix in matrices]),
+            statements,
+            np.concatenate(
+                [[0]] + [matrix.indptr[1:].astype(np.int64) + offset for matrix, offset in zip(matrices, offsets)]
+            ),
+            np.concatenate(
+                [columns[start:end][matrix.indices] for matrix, start, end in zip(matrices, bounds, bounds[1:])]
+            ),
+        )
+
+    @classmethod
+    def from_statements(
+        cls, execution_ids: list[int], statements: np.ndarray, indptr: np.ndarray, indices: np.ndarray
+    ) -> "CoverageMatrix":
+        """
+        Build a matrix whose columns are the given statements.
+        :param execution_ids: The ID of the execution of each row.
+        :param statements: The statement of each column as an integer key, in ascending order.
+        :param indptr: The offsets into :code:`indices` of the start of each row, followed by the number of entries.
+        :param indices: The columns covered by each row.
+        """
+        # SciPy needs both index arrays to be the same signed type to use them without copying
+        index_dtype = np.int32 if len(indices) < 2**31 else np.int64
+        file_ids, column_files = np.unique(statements >> np.uint64(32), return_inverse=True)
+        return cls(
+            np.asarray(execution_ids, dtype=np.int64),
+            np.array([FILES.paths[file_id] for file_id in file_ids.tolist()], dtype=str),
+            column_files.astype(np.uint32),
+            (statements & np.uint64(0xFFFFFFFF)).astype(np.uint32),
+            np.asarray(indptr).astype(index_dtype),
+            np.asarray(indices).astype(index_dtype),
+        )
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """
+        Return the number of rows and columns.
+        """
+        return len(self.execution_ids), len(self.column_lines)
+
+    def __len__(self) -> int:
+        return len(self.execution_ids)
+
+    def columns(self) -> list[tuple[str, int]]:
+        """
+        Return the (path, line) of each column.
+        """
+        return list(zip(self.paths[self.column_files].tolist(), self.column_lines.tolist()))
+
+    def statement_keys(self) -> np.ndarray:
+        """
+        Return the statement of each column as an integer key, as returned by :code:`CoverageMap.statement_keys`, so
+        that columns can be matched against coverage maps without iterating over each statement in Python.
+        """
+        file_ids = np.array([FILES.intern(str(path)) for path in self.paths.tolist()], dtype=np.uint64)
+        return (file_ids[self.column_files] << np.uint64(32)) | self.column_lines.astype(np.uint64)
+
+    def take(self, rows: list[int]) -> "CoverageMatrix":
+        """
+        Return the matrix of the given rows, in the given order, with the same columns.
+        The matrix itself is returned if that is every row in order, so memory-mapped arrays are not copied.
+        :param rows: The index of each row to take.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if np.array_equal(rows, np.arange(len(self))):
+            return self
+        starts = self.indptr[rows]
+        counts = self.indptr[rows + 1] - starts
+        indptr = np.concatenate(([0], np.cumsum(counts))).astype(self.indptr.dtype)
+        # Offset each entry of the new rows by where its row starts in this matrix
+        offsets = np.repeat(starts - indptr[:-1], counts) + np.arange(indptr[-1])
+        return CoverageMatrix(
+            self.execution_ids[rows],
+            self.paths,
+            self.column_files,
+            self.column_lines,
+            indptr,
+            self.indices[offsets],
+        )
+
+    def row(self, i: int) -> CoverageMap:
+        """
+        Return the lines covered by the execution of a row.
+        :param i: The index of the row.
+        """
+        columns = self.indices[self.indptr[i] : self.indptr[i + 1]]
+        files = self.column_files[columns]
+        lines = self.column_lines[columns]
+        # Columns are sorted by file, so each file's lines are contiguous and already sorted
+        starts = np.flatnonzero(np.diff(files, prepend=-1))
+        return CoverageMap(
+            {
+                str(self.paths[files[start]]): lines[start:end].tolist()
+                for start, end in zip(starts.tolist(), starts[1:].tolist() + [len(files)])
+            }
+        )
+
+    def to_dense(self) -> np.ndarray:
+        """
+        Return the matrix as a dense boolean array.
+        """
+        dense = np.zeros(self.shape, dtype=bool)
+        dense[np.repeat(np.arange(len(self)), np.diff(self.indptr)), self.indices] = True
+        return dense
+
+    def to_sparse(self) -> "csr_array":
+        """
+        Return the matrix as a SciPy sparse array that shares the index arrays rather than copying them.
+        This needs scipy to be installed.
+        """
+        from scipy.sparse import csr_array  # pylint: disable=C0415
+
+        return csr_array((np.ones(len(self.indices), dtype=bool), self.indices, self.indptr), shape=self.shape)
+
+    def save(self, directory: str):
+        """
+        Write the matrix to a new directory, writing to a temporary directory first so that readers never see a partial
+        matrix.
+        :param directory: The directory, which must not already exist.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        temporary = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+        try:
+            for name in ARRAYS:
+                np.save(os.path.join(temporary, f"{name}.npy"), getattr(self, name))
+            with open(os.path.join(temporary, "VERSION"), "w", encoding="utf-8") as f:
+                f.write(str(FORMAT_VERSION))
+            os.replace(temporary, directory)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, directory: str) -> "CoverageMatrix":
+        """
+        Memory-map a matrix written by :code:`save`.
+        :param directory: The directory of the matrix.
+        :raises ValueError: If the matrix was written by another version.
+        """
+        with open(os.path.join(directory, "VERSION"), encoding="utf-8") as f:
+            version = f.read().strip()
+        if version != str(FORMAT_VERSION):
+            raise ValueError(f"Unsupported coverage matrix version {version} in {directory}")
+        return cls(*(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAYS))
+
+
+class CoverageStore:
+    """
+    Directory of coverage matrices, one per saved run. The database refers to the matrix of each run by name, so every
+    session that shares a database should also share the store.
+
+    :ivar directory: The directory of the store.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def path(self, name: str) -> str:
+        """
+        Return the directory of a stored matrix.
+        :param name: The name of the matrix.
+        """
+        return os.path.join(self.directory, name)
+
+    def write(self, execution_ids: list[int], coverage: list[Union[CoverageMap, None]]) -> str:
+        """
+        Store the matrix of the coverage of the given executions under a new name.
+        Names are unique rather than derived from the run, so sessions sharing the store never clash.
+        :param execution_ids: The ID of each execution.
+        :param coverage: The lines covered by each execution.
+        :returns: The name of the matrix.
+        """
+        name = f"run-{uuid.uuid4().hex}"
+        CoverageMatrix.from_coverage(coverage, execution_ids).save(self.path(name))
+        return name
+
+    def merge(self, names: list[str]) -> str:
+        """
+        Store the concatenation of stored matrices under a new name, leaving the matrices themselves in place.
+        :param names: The names of the matrices, in order.
+        :returns: The name of the concatenated matrix.
+        """
+        name = f"run-{uuid.uuid4().hex}"
+        CoverageMatrix.concatenate([self.read(matrix_name) for matrix_name in names]).save(self.path(name))
+        return name
+
+    def read(self, name: str) -> CoverageMatrix:
+        """
+        Memory-map a stored matrix.
+        :param name: The name of the matrix.
+        """
+        return CoverageMatrix.load(self.path(name))
+
+    def remove(self, name: str):
+        """
+        Delete a stored matrix, if it still exists.
+        :param name: The name of the matrix.
+        """
+        shutil.rmtree(self.path(name), ignore_errors=True)
@@ -1,347 +1,949 @@
 """
 This module manages all interaction with the test run database.
+The classes that are stored in the database are defined in :code:`models`, and are re-exported from here.
 """
 
 import logging
-from dataclasses import dataclass
+import random
+import time
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from typing import Union
+from typing import TYPE_CHECKING, Callable, Union
 
 from sqlalchemy import (
-    Boolean,
-    CheckConstraint,
-    Column,
-    DateTime,
-    ForeignKey,
-    Integer,
-    PickleType,
-    String,
-    Text,
+    Connection,
+    and_,
+    bindparam,
     create_engine,
+    delete,
     desc,
-    func,
+    event,
+    insert,
+    inspect,
+    or_,
     select,
+    update,
 )
-from sqlalchemy.orm import (
-    DeclarativeBase,
-    Mapped,
-    Session,
-    declared_attr,
-    relationship,
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from pytest_flakefighters.bulk_insert import (
+    assign_ids,
+    insert_run,
+    insert_tests,
+    snapshot_run,
+    snapshot_test,
 )
+from pytest_flakefighters.coverage_blobs import (
+    RANGE_BATCH_SIZE,
+    backfill_coverage_index,
+    coverage_index_outdated,
+    covered_file_ids,
+    encode_deltas,
+    index_coverage,
+    load_coverage,
+    lock_coverage,
+    prune_coverage,
+)
+from pytest_flakefighters.coverage_map import PACKED_VERSION, CoverageMap
+from pytest_flakefighters.history_cache import HistoryCache
+from pytest_flakefighters.models import (  # pylint: disable=W0611
+    LOOKUP_BATCH_SIZE,
+    ActiveFlakeFighter,
+    Base,
+    CoverageBlob,
+    CoverageType,
+    CoveredFile,
+    CoveredRange,
+    ExceptionView,
+    ExecutionView,
+    FlakefighterResult,
+    ResultView,
+    Run,
+    RunView,
+    SchemaVersion,
+    Test,
+    TestException,
+    TestExecution,
+    TestSummary,
+    TestView,
+    TracebackEntry,
+    TracebackView,
+)
+from pytest_flakefighters.prefetch import prefetch
+from pytest_flakefighters.schema_upgrade import upgrade_coverage, upgrade_schema
 
-logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.WARNING)
+if TYPE_CHECKING:
+    from pytest_flakefighters.coverage_store import CoverageMatrix
 
+logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.WARNING)
 
-@dataclass
-class Base(DeclarativeBase):
+# Tuning for SQLite databases that several processes write to at once, e.g. parallel CI jobs sharing one file
+# How long in milliseconds a connection waits for another process to release its lock before failing
+SQLITE_BUSY_TIMEOUT = 30000
+# The page cache size of each connection, with negative values being in KiB rather than pages
+SQLITE_CACHE_SIZE = -65536
+# The number of times to retry a write that still finds the database locked, and the delay in seconds before the first
+SAVE_RETRIES = 5
+RETRY_BACKOFF = 0.1
+# Execution options for transactions that write, so that SQLite takes the write lock as soon as they begin rather than
+# failing to upgrade a read lock once another process has written
+WRITE_TRANSACTION = {"sqlite_begin": "BEGIN IMMEDIATE"}
+# The columns of the test summaries that are running totals over the runs of each test
+SUMMARY_TOTALS = ["runs", "passed_executions", "failed_executions", "flaky_runs", "total_duration", "timed_executions"]
+
+
+def group_rows(rows) -> dict[int, list[tuple]]:
     """
-    Declarative base class for data objects.
-
-    :ivar id: Unique autoincrementing ID for the object.
+    Group result rows by their first column, keeping the remaining columns in order.
+    :param rows: The result rows.
     """
+    groups = defaultdict(list)
+    for key, *values in rows:
+        groups[key].append(values)
+    return groups
 
-    id: Mapped[int] = Column(Integer, primary_key=True)  # pylint: disable=C0103
-    # Explicitly flag that we don't want pytest to collect our Test, TestExecution, etc. classes.
-    __test__ = False  # pylint: disable=C0103
-
-    @declared_attr
-    def __tablename__(self):
-        return self.__name__.lower()
 
-
-@dataclass
-class Run(Base):
+def load_exceptions(connection: Connection, in_runs) -> dict[int, ExceptionView]:
     """
-    Class to store attributes of a flakefighters run.
-    :ivar start_time: The time the test run was begun.
-    :ivar created_at: The time the entry was added to the database.
-    This is not necessarily equivalent to start_time if the test suite took a long time to run or
-    if the entry was migrated from a separate database.
-    :ivar root: The root directory of the project.
-    :ivar commit_sha: The commit SHA at the time of the run.
-                      This should only be set if the root is a git repo and is clean at the time of the run.
-    :ivar tests: The test suite.
-    :ivar active_flakefighters: The flakefighters that are active on the run.
+    Load views of the exceptions of the executions of the tests that satisfy the given condition.
+    :param connection: The connection to read through.
+    :param in_runs: Condition on the :code:`Test` table that selects the tests.
+    :returns: Dictionary of execution IDs to exception views.
     """
-
-    start_time = Column(DateTime)
-    created_at = Column(DateTime, default=func.now())
-    root: Mapped[str] = Column(String)
-    # <<<<<<< HEAD
-    # tests = relationship("Test", backref="run", cascade="all, delete")
-    # active_flakefighters = relationship("ActiveFlakeFighter", backref="run", cascade="all, delete")
-    # =======
-    commit_sha: Mapped[str] = Column(String)
-    tests = relationship(
-        "Test",
-        backref="run",
-        lazy="subquery",
-        cascade="all, delete",
-        passive_deletes=True,
-    )
-    active_flakefighters = relationship(
-        "ActiveFlakeFighter",
-        backref="run",
-        lazy="subquery",
-        cascade="all, delete",
-        passive_deletes=True,
+    traceback = group_rows(
+        connection.execute(
+            select(
+                TracebackEntry.exception_id,
+                TracebackEntry.path,
+                TracebackEntry.lineno,
+                TracebackEntry.colno,
+                TracebackEntry.statement,
+            )
+            .join(TestException, TestException.id == TracebackEntry.exception_id)
+            .join(TestExecution, TestExecution.id == TestException.execution_id)
+            .join(Test, Test.id == TestExecution.test_id)
+            .where(in_runs)
+            .order_by(TracebackEntry.id)
+        )
     )
+    return {
+        execution_id: ExceptionView(name, [TracebackView(*entry) for entry in traceback[exception_id]])
+        for execution_id, exception_id, name in connection.execute(
+            select(TestException.execution_id, TestException.id, TestException.name)
+            .join(TestExecution, TestExecution.id == TestException.execution_id)
+            .join(Test, Test.id == TestExecution.test_id)
+            .where(in_runs)
+        )
+    }
 
 
-# >>>>>>> main
-
-
-@dataclass
-class ActiveFlakeFighter(Base):
+def build_test_views(
+    test_rows: list[tuple],
+    execution_rows: list[tuple],
+    test_results: dict[int, list[tuple]],
+    execution_results: dict[int, list[tuple]],
+    exceptions: dict[int, ExceptionView],
+) -> dict[int, list[TestView]]:
     """
-    Store relevant information about the active flakefighters.
-
-    :ivar run_id: Foreign key of the related run.
-    :ivar name: Class name of the flakefighter.
-    :ivar params: The parameterss of the flakefighter.
+    Assemble test views from the rows of each table.
+    :param test_rows: The (run ID, test ID, name, line number) of each test, in order.
+    :param execution_rows: The (test ID, execution ID, outcome, start time, end time) of each execution, in order.
+    :param test_results: The flakefighter results of each test.
+    :param execution_results: The flakefighter results of each execution.
+    :param exceptions: The exception of each execution that raised one.
+    :returns: Dictionary of run IDs to the views of their tests.
     """
-
-    run_id: Mapped[int] = Column(Integer, ForeignKey("run.id"), nullable=False)
-    name: Mapped[str] = Column(String)
-    params: Mapped[dict] = Column(PickleType)
+    executions = defaultdict(list)
+    for test_id, execution_id, outcome, start_time, end_time in execution_rows:
+        executions[test_id].append(
+            ExecutionView(
+                outcome,
+                [ResultView(*result) for result in execution_results[execution_id]],
+                exceptions.get(execution_id),
+                start_time,
+                end_time,
+            )
+        )
+    tests = defaultdict(list)
+    for run_id, test_id, name, line_no in test_rows:
+        tests[run_id].append(
+            TestView(name, line_no, executions[test_id], [ResultView(*result) for result in test_results[test_id]])
+        )
+    return tests
 
 
-@dataclass
-class Test(Base):
+def load_test_views(connection: Connection, in_runs, tracebacks: bool = False) -> dict[int, list[TestView]]:
     """
-    Class to store attributes of a test case.
-
-    :ivar run_id: Foreign key of the related run.
-    :ivar fspath: File system path of the file containing the test definition.
-    :ivar line_no: Line number of the test definition.
-    :ivar name: Name of the test case.
-    :ivar skipped: Boolean true if the test was skipped, else false.
-    :ivar executions: List of execution attempts.
-    :ivar flakefighter_results: List of test-level flakefighter results.
-
-    .. note::
-      Execution-level flakefighter results will be stored inside the individual TestExecution objects
+    Load columns-only views of the tests that satisfy the given condition, reading each table with a single query.
+    :param connection: The connection to read through.
+    :param in_runs: Condition on the :code:`Test` table that selects the tests.
+    :param tracebacks: Whether to load the exceptions of failing executions and their traceback entries.
+    :returns: Dictionary mapping each run ID to the views of its selected tests, in order.
     """
-
-    run_id: Mapped[int] = Column(Integer, ForeignKey("run.id"), nullable=False)
-    fspath: Mapped[str] = Column(String)
-    line_no: Mapped[int] = Column(Integer)
-    name: Mapped[str] = Column(String)
-    skipped: Mapped[bool] = Column(Boolean, default=False)
-    executions = relationship(
-        "TestExecution", backref="test", cascade="all, delete", passive_deletes=True
-    )
-    flakefighter_results = relationship(
-        "FlakefighterResult",
-        backref="test",
-        cascade="all, delete",
-        passive_deletes=True,
-    )
-
-    @property
-    def flaky(self) -> bool:
-        """
-        Return whether a test (or any of its executions) has been marked as flaky by any flakefighter.
-        """
-        if not self.executions and not self.flakefighter_results:
-            return None
-        return any(result.flaky for result in self.flakefighter_results) or any(
-            execution.flaky for execution in self.executions
+    test_rows = connection.execute(
+        select(Test.run_id, Test.id, Test.name, Test.line_no).where(in_runs).order_by(Test.id)
+    ).all()
+    execution_rows = connection.execute(
+        select(
+            TestExecution.test_id,
+            TestExecution.id,
+            TestExecution.outcome,
+            TestExecution.start_time,
+            TestExecution.end_time,
+        )
+        .join(Test, Test.id == TestExecution.test_id)
+        .where(in_runs)
+        .order_by(TestExecution.id)
+    ).all()
+    test_results = group_rows(
+        connection.execute(
+            select(FlakefighterResult.test_id, FlakefighterResult.name, FlakefighterResult.flaky)
+            .join(Test, Test.id == FlakefighterResult.test_id)
+            .where(in_runs)
+            .order_by(FlakefighterResult.id)
         )
-
-
-@dataclass
-class TestExecution(Base):  # pylint: disable=R0902
-    """
-    Class to store attributes of a test outcome.
-
-    :ivar test_id: Foreign key of the related test.
-    :ivar outcome: Outcome of the test. One of "passed", "failed", or "skipped".
-    :ivar stdout: The captured stdout string.
-    :ivar stedrr: The captured stderr string.
-    :ivar start_time: The start time of the test.
-    :ivar end_time: The end time of the test.
-    :ivar coverage: The line coverage of the test.
-    :ivar flakefighter_results: The execution-level flakefighter results.
-    :ivar exception: The exception associated with the test if one was thrown.
-    """
-
-    __tablename__ = "test_execution"
-
-    test_id: Mapped[int] = Column(Integer, ForeignKey("test.id"), nullable=False)
-    outcome: Mapped[str] = Column(String)
-    stdout: Mapped[str] = Column(Text)
-    stderr: Mapped[str] = Column(Text)
-    report: Mapped[str] = Column(Text)
-    start_time: Mapped[datetime] = Column(DateTime(timezone=True))
-    end_time: Mapped[datetime] = Column(DateTime(timezone=True))
-    coverage: Mapped[dict] = Column(PickleType)
-    flakefighter_results = relationship(
-        "FlakefighterResult",
-        backref="test_execution",
-        cascade="all, delete",
-        passive_deletes=True,
     )
-    exception = relationship(
-        "TestException",
-        uselist=False,
-        backref="test_execution",
-        cascade="all, delete",
-        passive_deletes=True,
+    execution_results = group_rows(
+        connection.execute(
+            select(FlakefighterResult.test_execution_id, FlakefighterResult.name, FlakefighterResult.flaky)
+            .join(TestExecution, TestExecution.id == FlakefighterResult.test_execution_id)
+            .join(Test, Test.id == TestExecution.test_id)
+            .where(in_runs)
+            .order_by(FlakefighterResult.id)
+        )
     )
-
-    @property
-    def flaky(self) -> bool:
-        """
-        Return whether a test (or any of its executions) has been marked as flaky by any flakefighter.
-        """
-        return any(result.flaky for result in self.flakefighter_results)
+    exceptions = load_exceptions(connection, in_runs) if tracebacks else {}
+    return build_test_views(test_rows, execution_rows, test_results, execution_results, exceptions)
 
 
-@dataclass
-class TestException(Base):  # pylint: disable=R0902
+def summarise_test(test: Union[Test, TestView]) -> dict:
     """
-    Class to store information about the exceptions that cause tests to fail.
-
-    :ivar execution_id: Foreign key of the related execution.
-    :ivar name: Name of the exception.
-    :traceback: The full stack of traceback entries.
+    Summarise a test from a single run, to be added to its running summary.
+    :param test: The test, which may be a view of a stored test.
+    :returns: Dictionary of the values to add to the running summary of the test.
     """
-
-    __tablename__ = "test_exception"
-
-    execution_id: Mapped[int] = Column(
-        Integer, ForeignKey("test_execution.id"), nullable=False
-    )
-    name: Mapped[str] = Column(String)
-    traceback = relationship(
-        "TracebackEntry",
-        backref="exception",
-        cascade="all, delete",
-        passive_deletes=True,
-    )
+    verdicts = {}
+    for execution in test.executions:
+        for result in execution.flakefighter_results:
+            verdicts[result.name] = verdicts.get(result.name, False) or bool(result.flaky)
+    for result in test.flakefighter_results:
+        verdicts[result.name] = verdicts.get(result.name, False) or bool(result.flaky)
+    outcomes = [execution.outcome for execution in test.executions]
+    durations = [
+        (execution.end_time - execution.start_time).total_seconds()
+        for execution in test.executions
+        if execution.start_time is not None and execution.end_time is not None
+    ]
+    return {
+        "name": test.name,
+        "passed_executions": outcomes.count("passed"),
+        "failed_executions": outcomes.count("failed"),
+        "flaky_runs": int(bool(test.flaky)),
+        "verdicts": verdicts,
+        "last_outcomes": outcomes,
+        "total_duration": sum(durations),
+        "timed_executions": len(durations),
+    }
+
+
+def update_test_summaries(connection: Connection, run: dict, summaries: list[dict]):
+    """
+    Add the summaries of the tests of a newly saved run to the running summaries of those tests.
+    Existing summaries are read in batches and written back with one statement, so this costs a handful of queries
+    regardless of the number of tests.
+
+    :param connection: The database connection.
+    :param run: The ID, start time, and commit SHA of the run, keyed by :code:`id`, :code:`start_time`, and
+                :code:`commit_sha`.
+    :param summaries: The summary of each test in the run, as returned by :code:`summarise_test`.
+    """
+    table = TestSummary.__table__
+    names = [summary["name"] for summary in summaries]
+    existing = {}
+    for i in range(0, len(names), LOOKUP_BATCH_SIZE):
+        existing |= {
+            row.name: row
+            for row in connection.execute(select(table).where(table.c.name.in_(names[i : i + LOOKUP_BATCH_SIZE])))
+        }
+    rows = {}
+    for summary in summaries:
+        row = summary | {
+            "runs": 1,
+            "last_run_id": run["id"],
+            "last_commit_sha": run.get("commit_sha"),
+            "last_seen": run.get("start_time"),
+        }
+        previous = rows.get(summary["name"])
+        if previous is None and summary["name"] in existing:
+            previous = existing[summary["name"]]._asdict()
+        if previous is not None:
+            for key in SUMMARY_TOTALS:
+                row[key] += previous[key] or 0
+            row["verdicts"] = (previous["verdicts"] or {}) | row["verdicts"]
+        rows[summary["name"]] = row
+    inserts = [row for name, row in rows.items() if name not in existing]
+    updates = [row | {"summary_id": existing[name].id} for name, row in rows.items() if name in existing]
+    if inserts:
+        connection.execute(insert(table), inserts)
+    if updates:
+        connection.execute(update(table).where(table.c.id == bindparam("summary_id")), updates)
+
+
+def summary_totals(tests: Iterable[TestView]) -> dict[str, dict]:
+    """
+    Add up the summaries of the given tests by name.
+    :param tests: The tests, which may be views of stored tests.
+    :returns: Dictionary mapping the name of each test to the totals of its summaries, keyed by column.
+    """
+    totals = {}
+    for test in tests:
+        summary = summarise_test(test) | {"runs": 1}
+        total = totals.setdefault(test.name, dict.fromkeys(SUMMARY_TOTALS, 0))
+        for key in SUMMARY_TOTALS:
+            total[key] += summary[key]
+    return totals
 
 
-@dataclass
-class TracebackEntry(Base):  # pylint: disable=R0902
+def rebuild_summaries(connection: Connection, names: list[str], excluded):
     """
-    Class to store attributes of entries in the stack trace.
-
-    :ivar exception_id: Foreign key of the related exception.
-    :ivar path: Filepath of the source file.
-    :ivar lineno: Line number of the executed statement.
-    :ivar colno: Column number of the executed statement.
-    :ivar statement: The executed statement.
-    :ivar source: The surrounding source code.
+    Rebuild the running summaries of the given tests from their stored runs.
+    :param connection: The database connection.
+    :param names: The names of the tests.
+    :param excluded: Query selecting the IDs of runs to leave out, e.g. because they are about to be pruned.
+    """
+    table = TestSummary.__table__
+    for i in range(0, len(names), LOOKUP_BATCH_SIZE):
+        batch = names[i : i + LOOKUP_BATCH_SIZE]
+        connection.execute(delete(table).where(table.c.name.in_(batch)))
+        remaining = Test.name.in_(batch) & Test.run_id.not_in(excluded)
+        tests = load_test_views(connection, remaining)
+        for run in connection.execute(
+            select(Run.id, Run.start_time, Run.commit_sha)
+            .where(Run.id.in_(select(Test.run_id).where(remaining)))
+            .order_by(Run.start_time, Run.id)
+        ):
+            update_test_summaries(connection, run._asdict(), [summarise_test(test) for test in tests[run.id]])
+
+
+def forget_test_summaries(connection: Connection, pruned):
     """
+    Subtract the tests of runs about to be pruned from the running summaries of those tests, so that the summaries only
+    cover the stored runs. Summaries of tests with no stored runs left are deleted, and those whose last run is pruned
+    are rebuilt from the runs that are left, since their last outcomes and verdicts cannot be subtracted.
 
-    exception_id: Mapped[int] = Column(
-        Integer, ForeignKey("test_exception.id"), nullable=False
-    )
-    path: Mapped[str] = Column(String)
-    lineno: Mapped[int] = Column(Integer)
-    colno: Mapped[int] = Column(Integer)
-    statement: Mapped[str] = Column(String)
-    source: Mapped[str] = Column(Text)
+    :param connection: The database connection.
+    :param pruned: Query selecting the IDs of the runs about to be pruned.
+    """
+    table = TestSummary.__table__
+    pruned_tests = load_test_views(connection, Test.run_id.in_(pruned))
+    totals = summary_totals(test for tests in pruned_tests.values() for test in tests)
+    names = list(totals)
+    updates = []
+    stale = []
+    for i in range(0, len(names), LOOKUP_BATCH_SIZE):
+        for row in connection.execute(select(table).where(table.c.name.in_(names[i : i + LOOKUP_BATCH_SIZE]))):
+            total = totals[row.name]
+            if (row.runs or 0) <= total["runs"] or row.last_run_id in pruned_tests:
+                stale.append(row.name)
+                continue
+            update_row = {"summary_id": row.id}
+            for key in SUMMARY_TOTALS:
+                update_row[key] = max((getattr(row, key) or 0) - total[key], 0)
+            updates.append(update_row)
+    if updates:
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam("summary_id"))
+            .values({key: bindparam(key) for key in updates[0] if key != "summary_id"}),
+            updates,
+        )
+    rebuild_summaries(connection, stale, pruned)
 
 
-@dataclass
-class FlakefighterResult(Base):  # pylint: disable=R0902
+def parse_time_immemorial(time_immemorial: Union[timedelta, str, None]) -> Union[timedelta, None]:
+    """
+    Parse a time immemorial specified as `days:hours:minutes`.
+    :param time_immemorial: The time immemorial, which is returned unchanged if it is not a string.
     """
-    Class to store flakefighter results.
+    if isinstance(time_immemorial, str):
+        if not time_immemorial:
+            return None
+        days, hours, minutes = [int(x) for x in time_immemorial.split(":")]
+        return timedelta(days=days, hours=hours, minutes=minutes)
+    return time_immemorial
+
 
-    :ivar test_execution_id: Foreign key of the related test execution. Should not be set if test_id is present.
-    :ivar test_id: Foreign key of the related test. Should not be set if test_execution_id is present.
-    :ivar name: Name of the flakefighter.
-    :ivar flaky: Boolean true if the test (execution) was classified as flaky.
+def create_database_engine(url: str, concurrent: bool = False) -> Engine:
+    """
+    Create an engine for the given database URL.
+    SQLite only enforces foreign keys, and so only cascades deletes, when this is turned on for each connection.
+    :param url: The database URL.
+    :param concurrent: Whether to tune SQLite for several processes writing to the same file at once. The database is
+                       switched to write-ahead logging, so that readers and the writer do not block each other,
+                       connections wait for locks rather than failing immediately, and transactions begun with
+                       :code:`WRITE_TRANSACTION` take the write lock up front. This has no effect on other databases.
+    """
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        pragmas = ["foreign_keys=ON"]
+        if concurrent:
+            # The busy timeout comes first, since switching to WAL needs a lock of its own
+            pragmas = [
+                f"busy_timeout={SQLITE_BUSY_TIMEOUT}",
+                "journal_mode=WAL",
+                "synchronous=NORMAL",
+                f"cache_size={SQLITE_CACHE_SIZE}",
+            ] + pragmas
+
+        @event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, _):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(f"PRAGMA {pragma}")
+            cursor.close()
+            if concurrent:
+                # Stop the driver beginning transactions itself, so that they can be begun below
+                dbapi_connection.isolation_level = None
+
+        if concurrent:
+
+            @event.listens_for(engine, "begin")
+            def begin(connection):
+                connection.exec_driver_sql(connection.get_execution_options().get("sqlite_begin", "BEGIN"))
+
+    return engine
+
+
+def is_locked(error: OperationalError) -> bool:
     """
+    Return whether a database error was caused by another process holding a lock, so the operation can be retried.
+    :param error: The database error.
+    """
+    message = str(error.orig).lower()
+    return "locked" in message or "busy" in message
 
-    __tablename__ = "flakefighter_result"
 
-    test_execution_id: Mapped[int] = Column(
-        Integer, ForeignKey("test_execution.id"), nullable=True
-    )
-    test_id: Mapped[int] = Column(Integer, ForeignKey("test.id"), nullable=True)
-    name: Mapped[str] = Column(String)
-    flaky: Mapped[bool] = Column(Boolean)
-
-    __table_args__ = (
-        CheckConstraint(
-            "NOT (test_execution_id IS NULL AND test_id IS NULL)",
-            name="check_test_id_not_null",
-        ),
+def with_retries(
+    operation: Callable,
+    retries: int,
+    backoff: float = RETRY_BACKOFF,
+    retryable: Callable[[OperationalError], bool] = is_locked,
+    rollback: Callable = None,
+):
+    """
+    Call an operation, retrying it with exponential backoff and jitter if the database is locked by another process.
+    :param operation: The operation, which must not leave any partial changes behind if it fails.
+    :param retries: The maximum number of times to retry the operation.
+    :param backoff: The delay in seconds before the first retry, which doubles with each subsequent one.
+    :param retryable: Function to decide whether an error is transient.
+    :param rollback: Function to call after each failure that is retried, e.g. to roll back a session.
+    :returns: The return value of the operation.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except OperationalError as e:
+            if attempt == retries or not retryable(e):
+                raise
+            if rollback is not None:
+                rollback()
+            time.sleep(backoff * 2**attempt * random.uniform(1, 2))
+    return None
+
+
+def cascades_deletes(connection: Connection) -> bool:
+    """
+    Return whether deleting a run cascades to all of its related rows in the database itself.
+    Databases created by earlier versions declared their foreign keys without :code:`ON DELETE CASCADE`.
+    Stored coverage and covered files are shared between runs, so are not deleted along with them.
+    :param connection: The database connection.
+    """
+    inspector = inspect(connection)
+    return all(
+        (foreign_key["options"].get("ondelete") or "").upper() == "CASCADE"
+        for table in Base.metadata.sorted_tables
+        for foreign_key in inspector.get_foreign_keys(table.name)
+        if foreign_key["referred_table"] not in [CoverageBlob.__tablename__, CoveredFile.__tablename__]
     )
 
-    @property
-    def classification(self):
-        """
-        Return the classification as a string.
-        "flaky" if the test was classified as flaky, else "genuine".
-        """
-        return "flaky" if self.flaky else "genuine"
+
+def prune_runs(
+    connection: Connection, store_max_runs: int = None, time_immemorial: Union[timedelta, str] = None
+) -> int:
+    """
+    Delete the runs that are older than time immemorial or exceed the maximum number of stored runs, together with
+    their tests, executions, exceptions, and flakefighter results, then delete any coverage no longer referenced.
+    Runs are deleted with a handful of set-based statements. Only the outcomes and verdicts of their tests are loaded,
+    to subtract them from the running summaries of those tests.
+
+    :param connection: The database connection.
+    :param store_max_runs: The maximum number of runs to keep, most recent first.
+    :param time_immemorial: Time before which runs should be deleted.
+    :returns: The number of runs deleted.
+    """
+    time_immemorial = parse_time_immemorial(time_immemorial)
+    conditions = []
+    if time_immemorial is not None:
+        conditions.append(Run.created_at < datetime.now() - time_immemorial)
+    if store_max_runs is not None:
+        kept = select(Run.id).order_by(desc(Run.start_time), desc(Run.id)).limit(store_max_runs).subquery()
+        conditions.append(Run.id.not_in(select(kept.c.id)))
+    if not conditions:
+        return 0
+    pruned = select(Run.id).where(or_(*conditions))
+    forget_test_summaries(connection, pruned)
+
+    if not cascades_deletes(connection):
+        # Delete the related rows explicitly, from the bottom up
+        tests = select(Test.id).where(Test.run_id.in_(pruned))
+        executions = select(TestExecution.id).where(TestExecution.test_id.in_(tests))
+        exceptions = select(TestException.id).where(TestException.execution_id.in_(executions))
+        for statement in [
+            delete(TracebackEntry).where(TracebackEntry.exception_id.in_(exceptions)),
+            delete(TestException).where(TestException.id.in_(exceptions)),
+            delete(FlakefighterResult).where(FlakefighterResult.test_execution_id.in_(executions)),
+            delete(FlakefighterResult).where(FlakefighterResult.test_id.in_(tests)),
+            delete(TestExecution).where(TestExecution.id.in_(executions)),
+            delete(Test).where(Test.id.in_(tests)),
+            delete(ActiveFlakeFighter).where(ActiveFlakeFighter.run_id.in_(pruned)),
+        ]:
+            connection.execute(statement)
+
+    deleted = connection.execute(delete(Run).where(Run.id.in_(pruned))).rowcount
+    if deleted:
+        prune_coverage(connection)
+    return deleted
+
+
+def coverage_matrix_names(connection: Connection) -> set[str]:
+    """
+    Return the names of the coverage matrices that stored runs refer to.
+    :param connection: The database connection.
+    """
+    return set(connection.scalars(select(Run.coverage_matrix).where(Run.coverage_matrix.is_not(None))))
 
 
-class Database:
+class Database:  # pylint: disable=R0902
     """
     Class to handle database setup and interaction.
 
     :ivar engine: The database engine.
+    :ivar load_max_runs: The maximum number of previous runs to consider.
     :ivar store_max_runs: The maximum number of previous runs that should be stored. If the database exceeds this size,
                           older runs will be pruned to make space for newer ones.
     :ivar time_immemorial: Time before which runs should not be considered. Runs before this date will be pruned when
                            saving new runs.
-    :ivar previous_runs: List of previous flakefighter runs with most recent first.
+    :ivar previous_runs: List of previous flakefighter runs with most recent first. These are only loaded when they are
+                         first read, so sessions that do not need them never query them.
+    :ivar concurrent: Whether SQLite is tuned for several processes writing to the database at once.
+    :ivar retries: The number of times to retry a write that finds the database locked by another process.
+    :ivar history_cache: The local cache that the history of previous runs is read through, if any.
+    :ivar coverage_store: The store that the coverage of each saved run is also written to as a matrix, if any.
+    :ivar coverage_deltas: Whether new coverage is stored as a delta relative to the most recently stored coverage of
+                           the same test, where that is smaller. Coverage stored as a delta is always read in full,
+                           whether or not this is set.
+    :ivar coverage_index: Whether the lines covered by stored executions are indexed, so that the executions that
+                          covered given lines can be found with a single query (see :code:`covering_executions`).
+    :ivar background: The reads that have been started in background threads.
     """
 
-    def __init__(
+    def __init__(  # pylint: disable=R0913,R0917
         self,
         url: str,
         load_max_runs: int = None,
         store_max_runs: int = None,
         time_immemorial: Union[timedelta, str] = None,
+        concurrent: bool = False,
+        history_cache_dir: str = None,
+        coverage_index: bool = False,
+        coverage_store_dir: str = None,
+        coverage_deltas: bool = False,
     ):
-        if isinstance(time_immemorial, str) and time_immemorial:
-            days, hours, minutes = [int(x) for x in time_immemorial.split(":")]
-            time_immemorial = timedelta(days=days, hours=hours, minutes=minutes)
-
-        self.engine = create_engine(url)
+        self.engine = create_database_engine(url, concurrent)
         self.session = Session(self.engine)
-        Base.metadata.create_all(self.engine)
+        self.concurrent = concurrent
+        self.coverage_index = coverage_index
+        self.coverage_deltas = coverage_deltas
+        self.retries = SAVE_RETRIES if concurrent else 0
+        self.history_cache = None
+        self.coverage_store = None
+        # Processes opening a new database at the same time race to create its tables
+        with_retries(
+            self.create_schema, self.retries, retryable=lambda e: is_locked(e) or "already exists" in str(e.orig)
+        )
+        if history_cache_dir is not None:
+            self.history_cache = HistoryCache(history_cache_dir, self.engine.url.render_as_string(hide_password=True))
+        if coverage_store_dir is not None:
+            # Imported here since the store needs numpy, which sessions without it should not pay for importing
+            from pytest_flakefighters.coverage_store import (  # pylint: disable=C0415
+                CoverageStore,
+            )
 
+            self.coverage_store = CoverageStore(coverage_store_dir)
+
+        # The limit is a string if it was given on the commandline
+        self.load_max_runs = None if load_max_runs is None else int(load_max_runs)
         self.store_max_runs = store_max_runs
-        self.time_immemorial = time_immemorial
-        self.previous_runs = self.load_runs(load_max_runs)
+        self.time_immemorial = parse_time_immemorial(time_immemorial)
+        self.background: list[Future] = []
+        self._previous_runs: Union[list[Run], None] = None
 
-    def save(self, run: Run):
+    def prefetch(self, function: Callable, *args, **kwargs) -> Future:
         """
-        Save the given run into the database.
+        Start reading from the database in a background thread. Reads that are still running when the database is
+        closed are finished first.
+        :param function: The function that reads from the database.
+        :param args: The positional arguments of the function.
+        :param kwargs: The keyword arguments of the function.
+        :returns: The future result of the function.
         """
-        self.session.add(run)
-        if self.time_immemorial is not None:
-            expiry_date = datetime.now() - self.time_immemorial
-            for r in self.session.query(Run).filter(
-                Run.created_at < (expiry_date - self.time_immemorial)
-            ):
-                self.session.delete(r)
+        future = prefetch(function, *args, **kwargs)
+        self.background.append(future)
+        return future
+
+    def create_schema(self):
+        """
+        Create any missing tables, columns, and indexes.
+        """
+        # Databases created before test summaries were introduced need them building from the stored runs
+        missing_summaries = not inspect(self.engine).has_table(TestSummary.__tablename__)
+        Base.metadata.create_all(self.engine)
+        upgrade_schema(self.engine)
+        with self.engine.connect() as connection:
+            coverage_version = connection.scalar(select(SchemaVersion.version).where(SchemaVersion.name == "coverage"))
+        if coverage_version != PACKED_VERSION:
+            with self.begin_write() as connection:
+                upgrade_coverage(connection)
+        if missing_summaries:
+            self.rebuild_test_summaries()
+        if self.coverage_index:
+            # Coverage saved before the index was enabled, or since by sessions without it, is indexed once it is
+            with self.engine.connect() as connection:
+                outdated = coverage_index_outdated(connection)
+            if outdated:
+                with self.begin_write() as connection:
+                    backfill_coverage_index(connection)
+
+    def begin_write(self):
+        """
+        Begin a transaction on a new connection that will write to the database.
+        """
+        return self.engine.execution_options(**WRITE_TRANSACTION).begin()
+
+    def write_connection(self) -> Connection:
+        """
+        Return the connection of the session, beginning a transaction that will write to the database if none is open.
+        """
+        if self.session.in_transaction():
+            return self.session.connection()
+        return self.session.connection(execution_options=WRITE_TRANSACTION)
+
+    def deduplicate_coverage(self, run: Run) -> list[CoverageBlob]:
+        """
+        Make the executions of the given run share a single blob for each distinct coverage, reusing those already in
+        the database.
+        :param run: The run whose executions should be deduplicated.
+        :returns: The blobs that are not already in the database.
+        """
+        blobs = {}
+        for test in run.tests:
+            for execution in test.executions:
+                if execution.coverage_blob is not None and execution.coverage_blob.id is None:
+                    blobs.setdefault(execution.coverage_blob.digest, []).append(execution)
+        digests = list(blobs)
+        existing = {}
+        with self.session.no_autoflush:
+            for i in range(0, len(digests), LOOKUP_BATCH_SIZE):
+                existing |= {
+                    blob.digest: blob
+                    for blob in self.session.scalars(
+                        select(CoverageBlob).where(CoverageBlob.digest.in_(digests[i : i + LOOKUP_BATCH_SIZE]))
+                    )
+                }
+        for digest, executions in blobs.items():
+            blob = existing.get(digest, executions[0].coverage_blob)
+            for execution in executions:
+                execution.coverage_blob = blob
+        return [executions[0].coverage_blob for digest, executions in blobs.items() if digest not in existing]
+
+    def encode_coverage_deltas(self, connection: Connection, run: Run, blobs: list[CoverageBlob]):
+        """
+        Store new coverage as deltas where that is smaller (see :code:`encode_deltas`).
+        :param connection: The database connection.
+        :param run: The run whose coverage is being saved.
+        :param blobs: The coverage that is not already in the database.
+        """
+        digests = {blob.digest for blob in blobs}
+        tests = {
+            execution.coverage_blob.digest: test.name
+            for test in run.tests
+            for execution in test.executions
+            if execution.coverage_blob is not None and execution.coverage_blob.digest in digests
+        }
+        rows = encode_deltas(connection, {blob.digest: blob.coverage for blob in blobs}, tests)
+        for blob in blobs:
+            row = rows[blob.digest]
+            if row["delta"] is not None:
+                # The full coverage is kept in memory, so the base never needs loading in this session
+                blob._covered_lines = blob.coverage  # pylint: disable=W0201,W0212
+                blob.coverage = None
+                blob.delta = row["delta"]
+                blob.base_id = row["base_id"]
+                blob.depth = row["depth"]
+
+    def save(self, run: Run, bulk: bool = True):
+        """
+        Save the given run into the database, then prune old runs, all in a single transaction.
+        By default, new runs are inserted with one multi-row statement per table, rather than one statement per object
+        through the ORM unit of work.
+        The running summaries of the tests of new runs are updated in the same transaction.
+        If the database is locked by another process, the transaction is rolled back and retried (see
+        :code:`retries`).
+        :param run: The run to save.
+        :param bulk: Whether to insert new runs in bulk.
+        """
+        new = inspect(run).transient
+        with_retries(lambda: self._save(run, bulk, new), self.retries, rollback=self.session.rollback)
+        if self.history_cache is not None:
+            self.history_cache.invalidate()
+
+    def _save(self, run: Run, bulk: bool, new: bool):
+        """
+        Make a single attempt at saving the given run.
+        :param run: The run to save.
+        :param bulk: Whether to insert new runs in bulk.
+        :param new: Whether the run has not been saved before.
+        """
+        if bulk and new:
+            connection = self.write_connection()
+            run_id = insert_run(connection, *snapshot_run(run))
+            records = [snapshot_test(test) for test in run.tests]
+            insert_tests(connection, run_id, records, self.coverage_index, self.coverage_deltas)
+            if self.coverage_store is not None:
+                self.store_coverage_matrix(
+                    connection,
+                    run_id,
+                    [(execution.id, execution.coverage) for record in records for execution in record.executions],
+                )
+            run.id = run_id
+            for test, record in zip(run.tests, records):
+                assign_ids(test, record)
+        else:
+            connection = self.write_connection()
+            lock_coverage(connection)
+            blobs = self.deduplicate_coverage(run)
+            if self.coverage_deltas:
+                self.encode_coverage_deltas(connection, run, blobs)
+            self.session.add(run)
+            self.session.flush()
+            run_id = run.id
+            if self.coverage_index:
+                index_coverage(connection, {blob.id: blob.covered_lines for blob in blobs})
+            if new and self.coverage_store is not None:
+                self.store_coverage_matrix(
+                    connection,
+                    run_id,
+                    [(execution.id, execution.coverage) for test in run.tests for execution in test.executions],
+                )
+        if new:
+            update_test_summaries(
+                self.session.connection(),
+                {"id": run_id, "start_time": run.start_time, "commit_sha": run.commit_sha},
+                [summarise_test(test) for test in run.tests],
+            )
+        self.prune()
 
-        if self.store_max_runs is not None:
-            for r in self.load_runs()[self.store_max_runs - 1 :]:
-                self.session.delete(r)
+    def store_coverage_matrix(self, connection: Connection, run_id: int, executions: list[tuple[int, CoverageMap]]):
+        """
+        Write the coverage of the executions of a run to the coverage store, and refer to it from the run.
+        :param connection: The database connection, within the transaction that saves the run.
+        :param run_id: The ID of the run.
+        :param executions: The ID and coverage of each execution of the run.
+        """
+        name = self.coverage_store.write(
+            [execution_id for execution_id, _ in executions], [coverage for _, coverage in executions]
+        )
+        connection.execute(update(Run).where(Run.id == run_id).values(coverage_matrix=name))
+
+    def load_coverage_matrices(self, *criteria, limit: int = None) -> dict[int, "CoverageMatrix"]:
+        """
+        Memory-map the coverage matrices of previous runs from the coverage store, without reading any coverage from the
+        database. Runs saved without the store are left out.
+        :param criteria: Conditions that the runs must satisfy, e.g. :code:`Run.commit_sha == sha`.
+        :param limit: The maximum number of runs to return (these will be most recent runs).
+        :returns: Dictionary mapping the ID of each run to its coverage matrix, with most recent first.
+        """
+        if self.coverage_store is None:
+            raise ValueError("The database was opened without a coverage store")
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(Run.id, Run.coverage_matrix)
+                .where(Run.coverage_matrix.is_not(None), *criteria)
+                .order_by(desc(Run.start_time))
+                .limit(limit)
+            ).all()
+        return {run_id: self.coverage_store.read(name) for run_id, name in rows}
+
+    def load_run_coverage(self, run: Run) -> Union["CoverageMatrix", None]:
+        """
+        Memory-map the coverage matrix of a run from the coverage store, with one row per execution in the order of its
+        tests, once the run and its executions have been written, e.g. because its tests were streamed into the
+        database. Collection coverage is not included.
+        :param run: The run.
+        :returns: The coverage matrix, or None if there is no coverage store or the matrix has not been written.
+        """
+        if self.coverage_store is None or run.id is None:
+            return None
+        stored = self.load_coverage_matrices(Run.id == run.id).get(run.id)
+        if stored is None:
+            return None
+        rows = {execution_id: row for row, execution_id in enumerate(stored.execution_ids.tolist())}
+        executions = [execution.id for test in run.tests for execution in test.executions]
+        if not all(execution_id in rows for execution_id in executions):
+            return None
+        return stored.take([rows[execution_id] for execution_id in executions])
+
+    def rebuild_test_summaries(self):
+        """
+        Rebuild the running summaries of every test from the runs stored in the database.
+        Runs that have already been pruned cannot be included.
+        """
+        with self.begin_write() as connection:
+            connection.execute(delete(TestSummary))
+            # The runs are read once the write lock is held, so that no run saved by another process in the meantime is
+            # left out of the summaries
+            runs = self.load_history()
+            for run in reversed(runs):
+                update_test_summaries(connection, run._asdict(), [summarise_test(test) for test in run.tests])
+
+    def prune(self) -> int:
+        """
+        Delete the runs that are older than time immemorial or exceed the maximum number of stored runs, then commit.
+        The coverage matrices of the deleted runs are then deleted from the coverage store.
+        :returns: The number of runs deleted.
+        """
+        connection = self.write_connection()
+        stored = coverage_matrix_names(connection) if self.coverage_store is not None else set()
+        pruned = prune_runs(connection, self.store_max_runs, self.time_immemorial)
+        orphaned = stored - coverage_matrix_names(connection) if stored else set()
         self.session.commit()
+        # The matrices are only deleted once the runs that refer to them are
+        for name in orphaned:
+            self.coverage_store.remove(name)
+        return pruned
 
-    def get_source_runs(self, target_sha: str) -> list[Run]:
+    def get_source_runs(self, target_sha: str) -> list[RunView]:
         """
         Return the pytest run for the given target sha.
         :param target_sha: The SHA for which to return runs.
         :returns: List of pytest runs with DiffCov flakefighter active with the target_sha.
         """
-        with Session(self.engine) as session:
-            return (
-                session.execute(select(Run).where(Run.commit_sha == target_sha))
-                .scalars()
-                .all()
+        return self.load_history(Run.commit_sha == target_sha)
+
+    def get_source_outcomes(self, target_sha: str) -> dict[str, set[str]]:
+        """
+        Return the outcomes of each test in its most recent stored run at the given commit.
+        This is a single query over the executions of the runs at the commit, rather than loading the runs themselves.
+        :param target_sha: The SHA for which to return outcomes.
+        :returns: Dictionary mapping the name of each test to the outcomes of its executions.
+        """
+        outcomes = {}
+        last_runs = {}
+        with self.engine.connect() as connection:
+            for name, run_id, outcome in connection.execute(
+                select(Test.name, Test.run_id, TestExecution.outcome)
+                .join(Run, Run.id == Test.run_id)
+                .outerjoin(TestExecution, TestExecution.test_id == Test.id)
+                .where(Run.commit_sha == target_sha)
+                .order_by(Run.start_time, Run.id)
+            ):
+                # Later runs of each test replace the outcomes of earlier ones
+                if last_runs.get(name) != run_id:
+                    last_runs[name] = run_id
+                    outcomes[name] = set()
+                if outcome is not None:
+                    outcomes[name].add(outcome)
+        return outcomes
+
+    def load_history(self, *criteria, limit: int = None, tracebacks: bool = False) -> list[RunView]:
+        """
+        Load columns-only views of previous runs.
+        This is much faster than loading the runs themselves, since each table is read with a single query and coverage,
+        captured output, and traceback source code are never read.
+        If there is a history cache, then the most recent runs are read through it, with their tracebacks.
+
+        :param criteria: Conditions that the runs must satisfy, e.g. :code:`Run.commit_sha == sha`.
+        :param limit: The maximum number of runs to return (these will be most recent runs).
+        :param tracebacks: Whether to load the exceptions of failing executions and their traceback entries.
+        :returns: List of run views with most recent first.
+        """
+        if self.history_cache is not None and not criteria:
+            return self.history_cache.read(self, limit)
+        runs = select(Run.id).where(*criteria).order_by(desc(Run.start_time)).limit(limit).subquery()
+        in_runs = Test.run_id.in_(select(runs.c.id))
+        with self.engine.connect() as connection:
+            run_rows = connection.execute(
+                select(Run.id, Run.start_time, Run.root, Run.commit_sha)
+                .where(Run.id.in_(select(runs.c.id)))
+                .order_by(desc(Run.start_time))
+            ).all()
+            tests = load_test_views(connection, in_runs, tracebacks)
+        return [RunView(*row, tests[row.id]) for row in run_rows]
+
+    def covering_executions(self, coverage: CoverageMap, *criteria) -> list[int]:
+        """
+        Find the stored executions that covered any of the given lines, e.g. the lines changed by a diff.
+        With the coverage index, this is a single indexed query per batch of line ranges, otherwise the coverage of
+        every matching execution is read and decoded.
+        Executions stored by versions that did not share coverage between executions are not found.
+
+        :param coverage: The lines to look for.
+        :param criteria: Conditions that the runs of the executions must satisfy, e.g. :code:`Run.commit_sha == sha`.
+        :returns: The IDs of the executions in the order they were stored.
+        """
+        with self.engine.connect() as connection:
+            executions = (
+                select(TestExecution.id)
+                .join(Test, Test.id == TestExecution.test_id)
+                .join(Run, Run.id == Test.run_id)
+                .where(*criteria)
             )
+            if not self.coverage_index:
+                rows = connection.execute(
+                    executions.add_columns(TestExecution.coverage_id)
+                    .where(TestExecution.coverage_id.is_not(None))
+                    .order_by(TestExecution.id)
+                ).all()
+                stored = load_coverage(connection, {coverage_id for _, coverage_id in rows})
+                return [execution_id for execution_id, coverage_id in rows if stored[coverage_id] & coverage]
+            file_ids = covered_file_ids(connection, coverage)
+            ranges = [
+                and_(
+                    CoveredRange.file_id == file_ids[path],
+                    CoveredRange.first_line <= last,
+                    CoveredRange.last_line >= first,
+                )
+                for path, first, last in coverage.ranges()
+                if path in file_ids
+            ]
+            execution_ids = set()
+            for i in range(0, len(ranges), RANGE_BATCH_SIZE):
+                covering = select(CoveredRange.coverage_id).where(or_(*ranges[i : i + RANGE_BATCH_SIZE]))
+                execution_ids.update(connection.scalars(executions.where(TestExecution.coverage_id.in_(covering))))
+            return sorted(execution_ids)
+
+    @property
+    def previous_runs(self) -> list[Run]:
+        """
+        Return the previous runs, loading them if this is the first time they have been read.
+        """
+        if self._previous_runs is None:
+            self._previous_runs = self.load_runs(self.load_max_runs)
+        return self._previous_runs
 
     def load_runs(self, limit: int = None):
         """
@@ -349,14 +951,16 @@ class Database:
 
         :param limit: The maximum number of runs to return (these will be most recent runs).
         """
-        return self.session.scalars(
-            select(Run).order_by(desc(Run.start_time)).limit(limit)
-        ).all()
+        return self.session.scalars(select(Run).order_by(desc(Run.start_time)).limit(limit)).all()
 
     def close(self):
         """
         Close the database session and dispose of open resources.
+        Background reads are cancelled if they have not started yet, or finished first if they have.
         """
+        for future in self.background:
+            if not future.cancel():
+                future.exception()
         self.session.close()
         self.engine.dispose()
 
@@ -0,0 +1,58 @@
+"""
+This module implements support for running tests in parallel with pytest-xdist.
+Each worker runs its share of the tests, along with the live flakefighters, and ships snapshots of them to the
+controller when it finishes. The controller assembles the tests of every worker into a single run, so that
+postprocessing flakefighters and SFFL see the whole test suite, and saves it once.
+"""
+
+import pickle
+import zlib
+from typing import Union
+
+import pytest
+
+from pytest_flakefighters.bulk_insert import restore_test, snapshot_test
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.database_management import Test
+
+# The key of the worker output that the snapshots are shipped under
+WORKER_OUTPUT_KEY = "flakefighters"
+
+
+def is_worker(config: pytest.Config) -> bool:
+    """
+    Return whether this process is a pytest-xdist worker.
+    :param config: The config options.
+    """
+    return hasattr(config, "workerinput")
+
+
+def is_controller(config: pytest.Config) -> bool:
+    """
+    Return whether this process is a pytest-xdist controller, which distributes the tests to workers rather than running
+    them itself.
+    :param config: The config options.
+    """
+    return not is_worker(config) and getattr(config.option, "dist", "no") != "no"
+
+
+def pack_worker_output(collection_coverage: Union[CoverageMap, None], tests: list[Test]) -> bytes:
+    """
+    Pack the tests run by a worker for shipping to the controller.
+    Worker output can only contain builtin types, so the snapshots are pickled, and then compressed since coverage is
+    highly repetitive.
+    :param collection_coverage: The lines covered while the worker collected the tests.
+    :param tests: The tests run by the worker.
+    :returns: The packed tests.
+    """
+    return zlib.compress(pickle.dumps((collection_coverage, [snapshot_test(test) for test in tests])))
+
+
+def unpack_worker_output(data: bytes) -> tuple[Union[CoverageMap, None], list[Test]]:
+    """
+    Unpack the tests shipped by a worker.
+    :param data: The packed tests.
+    :returns: The lines covered while the worker collected the tests, and the tests.
+    """
+    collection_coverage, records = pickle.loads(zlib.decompress(data))
+    return collection_coverage, [restore_test(record) for record in records]
@@ -0,0 +1,32 @@
+"""
+This module implements the FileFilter class to decide which source files should have their coverage measured.
+"""
+
+from fnmatch import fnmatch
+
+
+class FileFilter:  # pylint: disable=R0903
+    """
+    Decide which source files should be measured based on glob patterns of their paths.
+    Decisions are cached, since the same files are checked over and over again while measuring coverage.
+
+    :ivar include: Patterns of files to measure. If empty, every file is measured unless it is omitted.
+    :ivar omit: Patterns of files not to measure, even if they are included.
+    """
+
+    def __init__(self, include: list[str] = None, omit: list[str] = None):
+        self.include = include or []
+        self.omit = omit or []
+        self._decisions: dict[str, bool] = {}
+
+    def __call__(self, file_path: str) -> bool:
+        """
+        Return whether the given file should be measured.
+
+        :param file_path: The absolute path of the file.
+        """
+        if file_path not in self._decisions:
+            self._decisions[file_path] = (
+                not self.include or any(fnmatch(file_path, pattern) for pattern in self.include)
+            ) and not any(fnmatch(file_path, pattern) for pattern in self.omit)
+        return self._decisions[file_path]
@@ -8,16 +8,46 @@ If running as a postprocessing step, detectors are run at the start of pytest_se
 """
 
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields
+from typing import Union
 
 from pytest_flakefighters.database_management import Run, TestExecution
 
 
+@dataclass(frozen=True)
+class Requirements:
+    """
+    The data that needs to be collected for a flakefighter to classify tests.
+    Data that is not required by any active flakefighter is neither collected nor saved to the database.
+
+    :ivar coverage: The line coverage of each test execution.
+    :ivar traceback: The exception and traceback entries of each failing test execution.
+    :ivar captured_output: The captured stdout, stderr, and failure report of each test execution.
+    :ivar history: The previous runs stored in the database.
+    """
+
+    coverage: bool = False
+    traceback: bool = False
+    captured_output: bool = False
+    history: bool = False
+
+    def __or__(self, other: "Requirements") -> "Requirements":
+        """
+        Combine two sets of requirements so that data required by either is collected.
+        """
+        return Requirements(**{f.name: getattr(self, f.name) or getattr(other, f.name) for f in fields(self)})
+
+
 class FlakeFighter(ABC):  # pylint: disable=R0903
     """
     Abstract base class for a FlakeFighter
     :ivar run_live: Run detection "live" after each test. Otherwise run as a postprocessing step after the test suite.
+    :cvar requirements: The data the flakefighter needs to be collected. Defaults to everything, so subclasses should
+        override this to allow the plugin to skip collecting data they do not use.
     """
 
+    requirements = Requirements(coverage=True, traceback=True, captured_output=True, history=True)
+
     def __init__(self, run_live: bool):
         self.run_live = run_live
 
@@ -48,3 +78,11 @@ class FlakeFighter(ABC):  # pylint: disable=R0903
         Convert the key parameters into a dictionary so that the object can be replicated.
         :return A dictionary of the parameters used to create the object.
         """
+
+    def coverage_scope(self) -> Union[list[str], None]:
+        """
+        Return the files whose coverage this flakefighter needs so that measurement can be restricted to them.
+        :return: List of absolute file paths, which is empty if coverage is not needed at all, or None if the coverage
+        of every file under the project root is needed.
+        """
+        return None if self.requirements.coverage else []
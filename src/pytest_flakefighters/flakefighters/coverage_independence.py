@@ -2,16 +2,56 @@
 This module implements the CoverageIndependence FlakeFighter.
 """
 
-import pandas as pd
+from typing import Union
+
+import numpy as np
 from scipy.cluster.hierarchy import fcluster, linkage
-from scipy.spatial.distance import pdist
+from scipy.spatial.distance import pdist, squareform
 
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.coverage_store import CoverageMatrix
 from pytest_flakefighters.database_management import (
+    Database,
     FlakefighterResult,
     Run,
     TestExecution,
 )
-from pytest_flakefighters.flakefighters.abstract_flakefighter import FlakeFighter
+from pytest_flakefighters.flakefighters.abstract_flakefighter import (
+    FlakeFighter,
+    Requirements,
+)
+
+
+def pairwise_distances(
+    coverage: CoverageMatrix, measured: np.ndarray, common: Union[CoverageMap, None], metric: str
+) -> np.ndarray:
+    """
+    Calculate the distance between each pair of rows of a coverage matrix, with the lines covered in common (i.e. while
+    collecting the tests) added to every measured row.
+    Jaccard distances are calculated from the sparse matrix, so only other metrics need it to be made dense.
+    :param coverage: The coverage matrix, without the common lines.
+    :param measured: Whether the coverage of each row was measured.
+    :param common: The lines covered in common.
+    :param metric: The distance metric.
+    :returns: The condensed distance matrix, as returned by :code:`scipy.spatial.distance.pdist`.
+    """
+    matrix = coverage.to_sparse()
+    common_lines = 0
+    if common:
+        # Columns of common lines are covered by every measured row, so are counted separately
+        matrix = matrix[:, np.flatnonzero(~np.isin(coverage.statement_keys(), common.statement_keys()))]
+        common_lines = common.line_count()
+    if metric != "jaccard":
+        return pdist(
+            np.hstack([matrix.toarray(), np.outer(measured, np.ones(common_lines, dtype=bool))]), metric=metric
+        )
+    counts = matrix.astype(np.int64)
+    intersections = (counts @ counts.T).toarray() + common_lines * np.outer(measured, measured)
+    sizes = np.diagonal(intersections)
+    unions = sizes[:, None] + sizes[None, :] - intersections
+    # Rows that cover nothing are the same as each other, as with pdist
+    distances = np.divide(unions - intersections, unions, out=np.zeros(unions.shape), where=unions > 0)
+    return squareform(distances, checks=False)
 
 
 class CoverageIndependence(FlakeFighter):
@@ -31,13 +71,20 @@ class CoverageIndependence(FlakeFighter):
         distances <https://docs.scipy.org/doc/scipy/reference/spatial.distance.html>`_.
     :ivar linkage_method: From `scipy.cluster.hierarchy.linkage`: ['single', 'complete', 'average', 'weighted',
         'centroid', 'median', 'ward']
+    :ivar database: The database, whose coverage store the coverage of a run is read from once the run has been
+        written there, rather than building the coverage matrix again.
     """
 
-    def __init__(self, threshold: float = 0, metric: str = "jaccard", linkage_method="single"):
+    requirements = Requirements(coverage=True)
+
+    def __init__(
+        self, threshold: float = 0, metric: str = "jaccard", linkage_method="single", database: Database = None
+    ):
         super().__init__(False)
         self.threshold = threshold
         self.metric = metric
         self.linkage_method = linkage_method
+        self.database = database
 
     @classmethod
     def from_config(cls, config: dict):
@@ -48,6 +95,7 @@ class CoverageIndependence(FlakeFighter):
             threshold=config.get("threshold", 0),
             metric=config.get("metric", "jaccard"),
             linkage_method=config.get("linkage_method", "single"),
+            database=config.get("database"),
         )
 
     def params(self):
@@ -70,36 +118,32 @@ class CoverageIndependence(FlakeFighter):
         Go through each test in the test suite and append the result to its `flakefighter_results` attribute.
         :param run: Run object representing the pytest run, with tests accessible through run.tests.
         """
-        coverage = []
         # Enumerating tests and executions since they won't have IDs if they are not yet in the database
-        for test in run.tests:
-            for execution in test.executions:
-                coverage.append(
-                    {"test": test, "execution": execution}
-                    | {f"{file}:{line}": True for file in execution.coverage for line in execution.coverage[file]}
-                )
+        executions = [(test, execution) for test in run.tests for execution in test.executions]
 
         # Can't compute the pairwise distance of a single execution
-        if len(coverage) < 2:
+        if len(executions) < 2:
             return
 
-        coverage = pd.DataFrame(coverage)
-        coverage[coverage.columns.drop(["test", "execution"])] = (
-            coverage[coverage.columns.drop(["test", "execution"])].astype(pd.BooleanDtype()).fillna(False).astype(bool)
-        )
+        coverage = self.database.load_run_coverage(run) if self.database is not None else None
+        if coverage is None:
+            coverage = CoverageMatrix.from_coverage([execution.coverage for _, execution in executions])
         # Calculate the distance between each pair of test executions
-        raw_coverage = coverage.drop(["test", "execution"], axis=1).to_numpy()
-        distances = pdist(raw_coverage, metric=self.metric)
-        # Assign each test execution to a cluster
-        coverage["cluster"] = fcluster(
-            linkage(distances, method=self.linkage_method), t=self.threshold, criterion="distance"
+        distances = pairwise_distances(
+            coverage,
+            np.array([execution.coverage is not None for _, execution in executions]),
+            run.collection_coverage,
+            self.metric,
         )
+        # Assign each test execution to a cluster
+        clusters = fcluster(linkage(distances, method=self.linkage_method), t=self.threshold, criterion="distance")
 
-        for _, group in coverage.groupby("cluster"):
-            for test in group["test"]:
-                result = FlakefighterResult(
-                    name=self.__class__.__name__,
-                    flaky=len(set(map(lambda x: x.outcome, group["execution"]))) > 1,
-                )
+        groups = {}
+        for cluster, (test, execution) in zip(clusters, executions):
+            groups.setdefault(cluster, []).append((test, execution))
+        for _, group in sorted(groups.items()):
+            flaky = len({execution.outcome for _, execution in group}) > 1
+            for test, _ in group:
+                result = FlakefighterResult(name=self.__class__.__name__, flaky=flaky)
                 if result not in test.flakefighter_results:
                     test.flakefighter_results.append(result)
@@ -4,16 +4,23 @@ This module implements the differential coverage FlakeFighter, inspired by the D
 
 import ast
 import os
+from typing import Union
 
 import git
 from unidiff import PatchSet
 
+from pytest_flakefighters.coverage_map import CoverageMap
 from pytest_flakefighters.database_management import (
     FlakefighterResult,
     Run,
+    RunView,
     TestExecution,
 )
-from pytest_flakefighters.flakefighters.abstract_flakefighter import FlakeFighter
+from pytest_flakefighters.flakefighters.abstract_flakefighter import (
+    FlakeFighter,
+    Requirements,
+)
+from pytest_flakefighters.prefetch import prefetch
 
 
 class DiffCov(FlakeFighter):
@@ -24,57 +31,128 @@ class DiffCov(FlakeFighter):
 
     :ivar run_live: Run detection "live" after each test. Otherwise run as a postprocessing step after the test suite.
     :ivar source_runs: The runs to consider when checking whether a test has transitioned from passing to failing.
+    :ivar source_outcomes: Dictionary mapping the name of each test in the source runs to its execution outcomes. If not
+                           given, this is worked out from the source runs.
     :ivar root: The root directory of the Git repository.
     :ivar source_commit: The source (older) commit hash. Defaults to HEAD^ (the previous commit to target).
     :ivar target_commit: The target (newer) commit hash. Defaults to HEAD (the most recent commit).
+    :ivar lines_changed: Dictionary mapping each changed file to the lines changed between the commits.
+    :ivar changed_coverage: The changed lines as a coverage map, to be intersected with the coverage of each execution.
+    :ivar method_declarations: Dictionary mapping each changed file to the lines of its changed method declarations.
+
+    The commits are resolved and diffed, and the changed files parsed, in the background, so that this overlaps with
+    the rest of the startup and test collection. Reading any of the attributes that depend on them blocks until they
+    are ready.
     """
 
+    requirements = Requirements(coverage=True, history=True)
+
     def __init__(  # pylint: disable=R0913,R0917
         self,
         run_live: bool,
-        source_runs: list[Run],
+        source_runs: list[Union[Run, RunView]],
         root: str = ".",
         source_commit: str = None,
         target_commit: str = None,
+        source_outcomes: dict[str, set[str]] = None,
     ):
         super().__init__(run_live)
 
         self.repo_root = git.Repo(root)
         self.source_runs = source_runs
+        if source_outcomes is None:
+            # Source runs are most recent first, so the outcomes of the most recent run of each test take precedence
+            source_outcomes = {
+                test.name: {execution.outcome for execution in test.executions}
+                for run in reversed(source_runs)
+                for test in run.tests
+            }
+        self.source_outcomes = source_outcomes
+        self._commits = prefetch(self.resolve_commits, source_commit, target_commit)
+        self._diff = prefetch(self.diff)
+        self._method_declarations = prefetch(self.find_method_declarations)
+
+    @property
+    def source_commit(self) -> str:
+        """
+        Return the source commit, waiting for it to be resolved if needed.
+        """
+        return self._commits.result()[0]
+
+    @property
+    def target_commit(self) -> Union[str, None]:
+        """
+        Return the target commit, waiting for it to be resolved if needed.
+        """
+        return self._commits.result()[1]
+
+    @property
+    def lines_changed(self) -> dict[str, list[int]]:
+        """
+        Return the lines changed between the commits, waiting for them to be diffed if needed.
+        """
+        return self._diff.result()[0]
+
+    @property
+    def changed_coverage(self) -> CoverageMap:
+        """
+        Return the changed lines as a coverage map, waiting for them to be diffed if needed.
+        """
+        return self._diff.result()[1]
+
+    @property
+    def method_declarations(self) -> dict[str, list[int]]:
+        """
+        Return the lines of the changed method declarations, waiting for the changed files to be parsed if needed.
+        """
+        return self._method_declarations.result()
+
+    def resolve_commits(self, source_commit: Union[str, None], target_commit: Union[str, None]) -> tuple[str, str]:
+        """
+        Work out which commits to diff.
+        :param source_commit: The source commit, if specified.
+        :param target_commit: The target commit, if specified.
+        :returns: The source and target commits. The target commit is None to diff against the working tree.
+        """
         if target_commit is None and not self.repo_root.is_dirty():
             # No uncommitted changes, so use most recent commit
-            self.target_commit = self.repo_root.commit().hexsha
-        else:
-            self.target_commit = target_commit
+            target_commit = self.repo_root.commit().hexsha
         if source_commit is None:
-            if self.target_commit is None:
+            if target_commit is None:
                 # If uncommitted changes, use most recent commit as source
-                self.source_commit = self.repo_root.commit().hexsha
+                source_commit = self.repo_root.commit().hexsha
             else:
                 # If no uncommitted changes, use previous commit as source
                 parents = [
                     commit.hexsha
                     for commit in self.repo_root.commit(source_commit).iter_parents()
-                    if commit.hexsha != self.target_commit
+                    if commit.hexsha != target_commit
                 ]
-                self.source_commit = parents[0]
-        else:
-            self.source_commit = source_commit
+                source_commit = parents[0]
+        return source_commit, target_commit
 
+    def diff(self) -> tuple[dict[str, list[int]], CoverageMap]:
+        """
+        Diff the source and target commits.
+        :returns: Dictionary mapping each changed file to the lines changed, and the changed lines as a coverage map.
+        """
         patches = PatchSet(self.repo_root.git.diff(self.source_commit, self.target_commit, "-U0", "--no-prefix"))
-        self.lines_changed = {}
+        lines_changed = {}
         for patch in patches:
             if patch.target_file == patch.source_file:
                 abspath = os.path.join(self.repo_root.working_dir, patch.source_file)
-                self.lines_changed[abspath] = []
+                lines_changed[abspath] = []
                 for hunk in patch:
                     # Add each line in the hunk to lines_changed
-                    self.lines_changed[abspath] += list(
-                        range(hunk.target_start, hunk.target_start + hunk.target_length)
-                    )
+                    lines_changed[abspath] += list(range(hunk.target_start, hunk.target_start + hunk.target_length))
+        return lines_changed, CoverageMap(lines_changed)
 
-        # Need to know method declaration lines so we can ignore new/changed test methods
-        self.method_declarations = {}
+    def find_method_declarations(self) -> dict[str, list[int]]:
+        """
+        Find the method declarations on changed lines, so that new and changed test methods can be ignored.
+        :returns: Dictionary mapping each changed file to the lines of its changed method declarations.
+        """
+        method_declarations = {}
         for file, lines in self.lines_changed.items():
             with open(file) as f:
                 try:
@@ -82,20 +160,22 @@ class DiffCov(FlakeFighter):
                 except SyntaxError:
                     continue
 
-            self.method_declarations[file] = [
+            method_declarations[file] = [
                 node.lineno
                 for node in ast.walk(tree)
                 if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.lineno in lines
             ]
+        return method_declarations
 
     @classmethod
     def from_config(cls, config: dict):
         """
         Factory method to create a new instance from a pytest configuration.
         """
-        source_runs = config["database"].get_source_runs(config.get("source_commit"))
+        database = config["database"]
         source_commit = config.get("source_commit")
-        if source_commit is not None and not source_runs:
+        source_outcomes = database.get_source_outcomes(source_commit)
+        if source_commit is not None and not source_outcomes and not database.get_source_runs(source_commit):
             raise ValueError(
                 f"Could not find a run for specified source commit {source_commit}. "
                 f"Please checkout {source_commit} and run pytest again, use a different source commit hash, or leave it"
@@ -103,10 +183,11 @@ class DiffCov(FlakeFighter):
             )
         return DiffCov(
             run_live=config.get("run_live", True),
-            source_runs=source_runs,
+            source_runs=[],
             root=config.get("root", "."),
             source_commit=config.get("source_commit"),
             target_commit=config.get("target_commit"),
+            source_outcomes=source_outcomes,
         )
 
     def params(self):
@@ -116,6 +197,13 @@ class DiffCov(FlakeFighter):
         """
         return {"root": self.repo_root, "source_commit": self.source_commit, "target_commit": self.target_commit}
 
+    def coverage_scope(self) -> list[str]:
+        """
+        Only the coverage of the files changed between the source and target commits can affect classification.
+        :return: List of the changed files.
+        """
+        return list(self.lines_changed)
+
     def line_modified_by_target_commit(self, file_path: str, line_no: int) -> bool:
         """
         Returns true if the given line in the file has been modified by the present commit.
@@ -123,26 +211,22 @@ class DiffCov(FlakeFighter):
         :param file_path: The file to check.
         :param line_no: The line number to check.
         """
-        return line_no in self.lines_changed.get(file_path, [])
+        return self.changed_coverage.covers(file_path, line_no)
 
     def _flaky_execution(self, execution):
         """
         Classify an execution as flaky or not.
         :return: Boolean True of the test is classed as flaky and False otherwise.
         """
-        previous_execution_outcomes = {}
-        for run in self.source_runs:
-            for test in run.tests:
-                if test.name == execution.test.name:
-                    previous_execution_outcomes = {e.outcome for e in test.executions}
+        previous_execution_outcomes = set()
+        if self.source_outcomes:
+            previous_execution_outcomes = self.source_outcomes.get(execution.test.name, set())
         return (
             execution.outcome not in previous_execution_outcomes or len(previous_execution_outcomes) > 1
         ) and not any(
-            self.line_modified_by_target_commit(file_path, line_no)
-            for file_path in execution.coverage
-            for line_no in execution.coverage[file_path]
-            if file_path in self.lines_changed
-            and (line_no == execution.test.line_no or line_no not in self.method_declarations.get(file_path, []))
+            line_no == execution.test.line_no or line_no not in self.method_declarations.get(file_path, [])
+            for file_path, lines in (execution.full_coverage & self.changed_coverage).items()
+            for line_no in lines
         )
 
     def flaky_test_live(self, execution: TestExecution):
@@ -5,17 +5,20 @@ This module implements three FlakeFighters based on failure de-duplication from
 
 import os
 import re
-
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import Future
+from typing import Union
 
 from pytest_flakefighters.database_management import (
     FlakefighterResult,
     Run,
+    RunView,
     TestExecution,
 )
-from pytest_flakefighters.flakefighters.abstract_flakefighter import FlakeFighter
+from pytest_flakefighters.flakefighters.abstract_flakefighter import (
+    FlakeFighter,
+    Requirements,
+)
+from pytest_flakefighters.prefetch import prefetch, resolved
 
 
 class TracebackMatching(FlakeFighter):
@@ -26,21 +29,44 @@ class TracebackMatching(FlakeFighter):
     exception and stacktrace.
 
     :ivar run_live: Run detection "live" after each test. Otherwise run as a postprocessing step after the test suite.
+    :ivar previous_runs: List of previous FlakeFighters runs. This may be given as a future, e.g. if it is being
+                         loaded in the background, in which case reading it blocks until it has loaded.
+    :ivar previous_tracebacks: The tracebacks of the previous flaky executions, extracted once in the background since
+                               the previous runs do not change during the session.
+    :ivar root: The root directory of the code repository.
     """
 
-    def __init__(self, run_live: bool, previous_runs: list[Run], root: str = "."):
+    requirements = Requirements(traceback=True, history=True)
+
+    def __init__(self, run_live: bool, previous_runs: Union[list[Union[Run, RunView]], Future], root: str = "."):
         super().__init__(run_live)
         self.root = os.path.abspath(root)
-        self.previous_runs = previous_runs
+        self._previous_runs = previous_runs if isinstance(previous_runs, Future) else resolved(previous_runs)
+        self._previous_tracebacks = prefetch(lambda: self.previous_flaky_executions(self.previous_runs))
+
+    @property
+    def previous_runs(self) -> list[Union[Run, RunView]]:
+        """
+        Return the previous runs, waiting for them to finish loading if needed.
+        """
+        return self._previous_runs.result()
+
+    @property
+    def previous_tracebacks(self) -> list:
+        """
+        Return the tracebacks of the previous flaky executions, waiting for them to be extracted if needed.
+        """
+        return self._previous_tracebacks.result()
 
     @classmethod
     def from_config(cls, config: dict):
         """
         Factory method to create a new instance from a pytest configuration.
         """
+        database = config["database"]
         return TracebackMatching(
             run_live=config.get("run_live", True),
-            previous_runs=config["database"].previous_runs,
+            previous_runs=database.prefetch(database.load_history, limit=database.load_max_runs, tracebacks=True),
             root=config.get("root", "."),
         )
 
@@ -66,7 +92,7 @@ class TracebackMatching(FlakeFighter):
         ]
         return any(e == current_traceback for e in previous_executions)
 
-    def previous_flaky_executions(self, runs: list[Run]) -> list:
+    def previous_flaky_executions(self, runs: list[Union[Run, RunView]]) -> list:
         """
         Extract the relevant information from previous flaky executions and collapse into a single list.
         :param runs: The runs to consider. Defaults to self.previous_runs.
@@ -85,21 +111,26 @@ class TracebackMatching(FlakeFighter):
             if execution.exception
         ]
 
-    def flaky_test_live(self, execution: TestExecution, previous_runs: list[Run] = None):
+    def flaky_test_live(self, execution: TestExecution, previous_runs: list[Union[Run, RunView]] = None):
         """
         Classify executions as flaky if they have the same failure logs as a flaky execution.
         :param execution: Test execution to consider.
-        :param previous_runs: The previous runs to which the execution will be compared.
+        :param previous_runs: The previous runs to which the execution will be compared. Defaults to self.previous_runs.
         """
         if previous_runs is None:
-            previous_runs = self.previous_runs
+            previous_tracebacks = self.previous_tracebacks
+        else:
+            previous_tracebacks = self.previous_flaky_executions(previous_runs)
+        self._append_result(execution, previous_tracebacks)
+
+    def _append_result(self, execution: TestExecution, previous_tracebacks: list):
+        """
+        Classify an execution against the given tracebacks and append the result to its flakefighter results.
+        """
         execution.flakefighter_results.append(
             FlakefighterResult(
                 name=self.__class__.__name__,
-                flaky=self._flaky_execution(
-                    execution,
-                    self.previous_flaky_executions(previous_runs),
-                ),
+                flaky=self._flaky_execution(execution, previous_tracebacks),
             )
         )
 
@@ -110,7 +141,8 @@ class TracebackMatching(FlakeFighter):
         """
         for test in run.tests:
             for execution in test.executions:
-                self.flaky_test_live(execution, self.previous_runs + [run])
+                # Tests of the current run may have been classified as flaky by the time later ones are considered
+                self._append_result(execution, self.previous_tracebacks + self.previous_flaky_executions([run]))
 
 
 class CosineSimilarity(TracebackMatching):
@@ -126,10 +158,14 @@ class CosineSimilarity(TracebackMatching):
         represents no difference and 1 represents complete difference.
     """
 
-    def __init__(self, run_live: bool, previous_runs: list[Run], root: str = ".", threshold: float = 1):
+    def __init__(
+        self,
+        run_live: bool,
+        previous_runs: Union[list[Union[Run, RunView]], Future],
+        root: str = ".",
+        threshold: float = 1,
+    ):
         super().__init__(run_live, previous_runs, root)
-        self.root = os.path.abspath(root)
-        self.previous_runs = previous_runs
         self.threshold = threshold
 
     @classmethod
@@ -137,9 +173,10 @@ class CosineSimilarity(TracebackMatching):
         """
         Factory method to create a new instance from a pytest configuration.
         """
+        database = config["database"]
         return CosineSimilarity(
             run_live=config.get("run_live", True),
-            previous_runs=config["database"].previous_runs,
+            previous_runs=database.prefetch(database.load_history, limit=database.load_max_runs, tracebacks=True),
             root=config.get("root", "."),
             threshold=config.get("threshold", 1),
         )
@@ -152,6 +189,11 @@ class CosineSimilarity(TracebackMatching):
         return super().params() | {"threshold": self.threshold}
 
     def _tf_idf_matrix(self, executions):
+        # pandas and scikit-learn are only needed by this subclass, so are not imported for TracebackMatching
+        # pylint: disable=C0415
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
         corpus = [
             re.sub(r"[^\w\s]", " ", "\n".join([" ".join(map(str, tuple)) for tuple in execution]))
             for execution in executions
@@ -170,6 +212,7 @@ class CosineSimilarity(TracebackMatching):
         """
         if not execution.exception or not previous_executions:
             return False
+        from sklearn.metrics.pairwise import cosine_similarity  # pylint: disable=C0415
 
         execution = [
             (os.path.relpath(elem.path, self.root), elem.lineno, elem.colno, elem.statement)
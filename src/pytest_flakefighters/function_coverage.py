@@ -9,6 +9,8 @@ import pstats
 
 from coverage import CoverageData
 
+from pytest_flakefighters.file_filter import FileFilter
+
 
 class Profiler:
     """
@@ -17,12 +19,16 @@ class Profiler:
     :ivar coverage_data: The (potentially) covered lines for each module.
     :ivar function_defs: The lines that define a given function in a given module, accessed as
         `function_defs[module][function]`.
+    :ivar file_filter: Decides which modules to record. cProfile cannot be restricted while profiling, so modules
+        that are not measured are skipped when the profiling stats are recorded.
     """
 
-    def __init__(self):
+    def __init__(self, file_filter: FileFilter = None):
         self.coverage_data: CoverageData = CoverageData(no_disk=True)
+        self.file_filter = file_filter or FileFilter()
         self.function_defs: dict[str, dict[str, list[int]]] = {}
         self.profiler = cProfile.Profile()
+        self.running = False
 
     def update_function_defs(self, module: str):
         """
@@ -43,14 +49,24 @@ class Profiler:
         Start measuring coverage.
         """
         self.profiler.enable()
+        self.running = True
 
     def stop(self):
         """
         Stop measuring coverage.
         """
         self.profiler.disable()
+        self.running = False
+        self._record_functions()
+
+    def _record_functions(self):
+        """
+        Add the lines of the functions called since the profiler was last cleared to the coverage data.
+        """
         p = pstats.Stats(self.profiler)
         for module, _, function in p.stats.keys():
+            if not self.file_filter(module):
+                continue
             if module not in self.function_defs and os.path.exists(module):
                 self.update_function_defs(module)
             self.coverage_data.add_lines({module: self.function_defs.get(module, {}).get(function, [])})
@@ -58,11 +74,17 @@ class Profiler:
     def switch_context(self, context: str):
         """
         Set the context name of the coverage measurement.
+        If coverage is being measured, the functions called so far are recorded under the previous context first.
 
         :param context: The context name to set.
         """
+        if self.running:
+            self.profiler.disable()
+            self._record_functions()
         self.profiler.clear()
         self.coverage_data.set_context(context)
+        if self.running:
+            self.profiler.enable()
 
     def get_data(self) -> CoverageData:
         """
@@ -0,0 +1,544 @@
+"""
+This module implements a local read-through cache of the history of previous runs, so that sessions using a remote
+database only need to download the runs that have been saved since the previous session.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Union
+
+from sqlalchemy import desc, func, select
+
+from pytest_flakefighters.models import (
+    LOOKUP_BATCH_SIZE,
+    ExceptionView,
+    ExecutionView,
+    FlakefighterResult,
+    ResultView,
+    Run,
+    RunView,
+    Test,
+    TestExecution,
+    TestView,
+    TracebackView,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from pytest_flakefighters.database_management import Database
+
+# Incremented whenever the layout of the cache file changes, so that stale caches are rebuilt rather than misread
+FORMAT_VERSION = 2
+MAGIC = b"FFHC"
+# The magic number, format version, and length of the header at the start of the cache file
+PREAMBLE = struct.Struct("<4sII")
+# Arrays are aligned in the file so that they can be viewed in place once memory-mapped
+ALIGNMENT = 8
+# Integer columns store None as this, and columns of strings store None as -1
+NULL = -(2**63)
+# The type of each array in the cache file. Strings, including timestamps, are indices into a table of the distinct
+# strings. The children of each row are the rows between consecutive entries of its offsets, e.g. the tests of run i
+# are the rows run_tests[i] to run_tests[i + 1] of the test columns.
+COLUMNS = {
+    "run_id": "<i8",
+    "run_start_time": "<i8",
+    "run_root": "<i8",
+    "run_commit_sha": "<i8",
+    "run_tests": "<i8",
+    "test_name": "<i8",
+    "test_line_no": "<i8",
+    "test_executions": "<i8",
+    "test_results": "<i8",
+    "execution_outcome": "<i8",
+    "execution_start_time": "<i8",
+    "execution_end_time": "<i8",
+    "execution_exception": "<i8",
+    "execution_results": "<i8",
+    "test_result_name": "<i8",
+    "test_result_flaky": "<i1",
+    "execution_result_name": "<i8",
+    "execution_result_flaky": "<i1",
+    "exception_name": "<i8",
+    "exception_traceback": "<i8",
+    "traceback_path": "<i8",
+    "traceback_lineno": "<i8",
+    "traceback_colno": "<i8",
+    "traceback_statement": "<i8",
+    "strings": "|u1",
+    "string_offsets": "<i8",
+}
+# The arrays of offsets into other arrays, which have a leading zero, and the array that each points into
+OFFSETS = {
+    "run_tests": "test_name",
+    "test_executions": "execution_outcome",
+    "test_results": "test_result_name",
+    "execution_results": "execution_result_name",
+    "exception_traceback": "traceback_path",
+    "string_offsets": "strings",
+}
+
+
+class RunEncoder:
+    """
+    Encoder of history views into the columns of a cache file.
+
+    :ivar columns: The values of each column so far.
+    :ivar strings: The index of each distinct string so far.
+    """
+
+    def __init__(self):
+        self.columns: dict[str, list[int]] = {name: [0] if name in OFFSETS else [] for name in COLUMNS}
+        self.strings: dict[str, int] = {}
+
+    def string(self, value: Union[str, datetime, None]) -> int:
+        """
+        Return the index of a string in the table of strings, adding it if it is new.
+        Timestamps are stored as ISO 8601 strings, which keep their time zone, if any.
+        :param value: The string or timestamp, or None.
+        """
+        if value is None:
+            return -1
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        return self.strings.setdefault(value, len(self.strings))
+
+    def append(self, **values: int):
+        """
+        Append a value to each of the given columns.
+        :param values: The value of each column.
+        """
+        for name, value in values.items():
+            self.columns[name].append(NULL if value is None else value)
+
+    def add_results(self, results: list[ResultView], level: str):
+        """
+        Add the flakefighter results of a test or execution, then record where they end.
+        :param results: The results.
+        :param level: Either "test" or "execution".
+        """
+        for result in results:
+            self.append(
+                **{
+                    f"{level}_result_name": self.string(result.name),
+                    f"{level}_result_flaky": -1 if result.flaky is None else result.flaky,
+                }
+            )
+        self.append(**{f"{level}_results": len(self.columns[f"{level}_result_name"])})
+
+    def add_execution(self, execution: ExecutionView):
+        """
+        Add a test execution, along with its results and exception.
+        :param execution: The execution.
+        """
+        exception = -1
+        if execution.exception is not None:
+            exception = len(self.columns["exception_name"])
+            for entry in execution.exception.traceback:
+                self.append(
+                    traceback_path=self.string(entry.path),
+                    traceback_lineno=entry.lineno,
+                    traceback_colno=entry.colno,
+                    traceback_statement=self.string(entry.statement),
+                )
+            self.append(
+                exception_name=self.string(execution.exception.name),
+                exception_traceback=len(self.columns["traceback_path"]),
+            )
+        self.append(
+            execution_outcome=self.string(execution.outcome),
+            execution_start_time=self.string(execution.start_time),
+            execution_end_time=self.string(execution.end_time),
+            execution_exception=exception,
+        )
+        self.add_results(execution.flakefighter_results, "execution")
+
+    def add_run(self, run: RunView):
+        """
+        Add a run, along with its tests.
+        :param run: The run.
+        """
+        for test in run.tests:
+            for execution in test.executions:
+                self.add_execution(execution)
+            self.add_results(test.flakefighter_results, "test")
+            self.append(
+                test_name=self.string(test.name),
+                test_line_no=test.line_no,
+                test_executions=len(self.columns["execution_outcome"]),
+            )
+        self.append(
+            run_id=run.id,
+            run_start_time=self.string(run.start_time),
+            run_root=self.string(run.root),
+            run_commit_sha=self.string(run.commit_sha),
+            run_tests=len(self.columns["test_name"]),
+        )
+
+    def arrays(self) -> dict[str, "np.ndarray"]:
+        """
+        Return each column as an array, including the table of strings as UTF-8.
+        """
+        import numpy as np  # pylint: disable=C0415
+
+        encoded = [value.encode() for value in self.strings]
+        self.columns["strings"] = list(b"".join(encoded))
+        self.columns["string_offsets"] = [0] + np.cumsum([len(value) for value in encoded], dtype=np.int64).tolist()
+        return {name: np.array(self.columns[name], dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+class CachedRuns:
+    """
+    Runs decoded one at a time from the arrays of a cache file, so that runs which are no longer needed are never
+    decoded.
+
+    :ivar arrays: The arrays of the cache file, which are typically memory-mapped.
+    :ivar strings: The strings decoded so far, by index.
+    """
+
+    def __init__(self, arrays: dict[str, "np.ndarray"]):
+        self.arrays = arrays
+        self.strings: dict[int, str] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "CachedRuns":
+        """
+        Memory-map the arrays of a cache file.
+        Only arrays of the expected integer types are read, so a cache file can hold nothing but data.
+        :param path: The path of the cache file.
+        :raises ValueError: If the file is not a cache file of this version.
+        """
+        import numpy as np  # pylint: disable=C0415
+
+        header, data_offset = read_header(path)
+        data = np.memmap(path, dtype=np.uint8, mode="r", offset=data_offset)
+        arrays = {}
+        for name, dtype in COLUMNS.items():
+            offset, length = header[name]
+            end = offset + length * np.dtype(dtype).itemsize
+            if offset % ALIGNMENT or not 0 <= offset <= end <= len(data):
+                raise ValueError(f"Array {name} is out of bounds in {path}")
+            arrays[name] = data[offset:end].view(dtype)
+        cached = cls(arrays)
+        cached.check_offsets(path)
+        return cached
+
+    def check_offsets(self, path: str):
+        """
+        Check that each array of offsets starts at zero, is in ascending order, and stays within the array it points
+        into, so that a corrupt cache file is rejected rather than misread.
+        :param path: The path of the cache file, for error messages.
+        :raises ValueError: If any offsets are out of order.
+        """
+        import numpy as np  # pylint: disable=C0415
+
+        for name, target in OFFSETS.items():
+            offsets = self.arrays[name]
+            if offsets[:1].tolist() != [0] or (np.diff(offsets) < 0).any() or offsets[-1] > len(self.arrays[target]):
+                raise ValueError(f"Offsets {name} are out of order in {path}")
+
+    def __len__(self) -> int:
+        return len(self.arrays["run_id"])
+
+    def string(self, index: int) -> Union[str, None]:
+        """
+        Return a string from the table of strings.
+        :param index: The index of the string, or -1 for None.
+        """
+        if index < 0:
+            return None
+        if index not in self.strings:
+            start, end = self.arrays["string_offsets"][index : index + 2].tolist()
+            self.strings[index] = self.arrays["strings"][start:end].tobytes().decode()
+        return self.strings[index]
+
+    def timestamp(self, index: int) -> Union[datetime, None]:
+        """
+        Return a timestamp from the table of strings.
+        :param index: The index of the timestamp, or -1 for None.
+        """
+        value = self.string(index)
+        return None if value is None else datetime.fromisoformat(value)
+
+    def span(self, offsets: str, start: int, end: int) -> tuple[int, int]:
+        """
+        Return the range of child rows of a range of rows.
+        :param offsets: The array of offsets into the child rows.
+        :param start: The first row.
+        :param end: The row after the last row.
+        """
+        return int(self.arrays[offsets][start]), int(self.arrays[offsets][end])
+
+    def run_id(self, i: int) -> int:
+        """
+        Return the ID of a run.
+        :param i: The index of the run in the cache file.
+        """
+        return int(self.arrays["run_id"][i])
+
+    def fingerprint(self, i: int) -> tuple:
+        """
+        Return the start time of a run and the number of its tests and flakefighter results, which grow while the run is
+        being written, so that a cached run can be told apart from the run as it is now stored, without decoding it.
+        :param i: The index of the run in the cache file.
+        """
+        tests = self.span("run_tests", i, i + 1)
+        test_results = self.span("test_results", *tests)
+        execution_results = self.span("execution_results", *self.span("test_executions", *tests))
+        return (
+            self.timestamp(int(self.arrays["run_start_time"][i])),
+            tests[1] - tests[0],
+            test_results[1] - test_results[0] + execution_results[1] - execution_results[0],
+        )
+
+    def results(self, level: str, i: int) -> list[ResultView]:
+        """
+        Decode the flakefighter results of a test or execution.
+        :param level: Either "test" or "execution".
+        :param i: The index of the test or execution.
+        """
+        start, end = self.span(f"{level}_results", i, i + 1)
+        return [
+            ResultView(self.string(name), None if flaky < 0 else bool(flaky))
+            for name, flaky in zip(
+                self.arrays[f"{level}_result_name"][start:end].tolist(),
+                self.arrays[f"{level}_result_flaky"][start:end].tolist(),
+            )
+        ]
+
+    def exception(self, i: int) -> Union[ExceptionView, None]:
+        """
+        Decode an exception, along with its traceback.
+        :param i: The index of the exception, or -1 for None.
+        """
+        if i < 0:
+            return None
+        start, end = self.span("exception_traceback", i, i + 1)
+        columns = [
+            self.arrays[f"traceback_{name}"][start:end].tolist() for name in ["path", "lineno", "colno", "statement"]
+        ]
+        return ExceptionView(
+            self.string(int(self.arrays["exception_name"][i])),
+            [
+                TracebackView(self.string(path), nullable(lineno), nullable(colno), self.string(statement))
+                for path, lineno, colno, statement in zip(*columns)
+            ],
+        )
+
+    def execution(self, i: int) -> ExecutionView:
+        """
+        Decode a test execution.
+        :param i: The index of the execution.
+        """
+        return ExecutionView(
+            self.string(int(self.arrays["execution_outcome"][i])),
+            self.results("execution", i),
+            self.exception(int(self.arrays["execution_exception"][i])),
+            self.timestamp(int(self.arrays["execution_start_time"][i])),
+            self.timestamp(int(self.arrays["execution_end_time"][i])),
+        )
+
+    def run(self, i: int) -> RunView:
+        """
+        Decode a run, along with its tests.
+        :param i: The index of the run in the cache file.
+        """
+        return RunView(
+            self.run_id(i),
+            self.timestamp(int(self.arrays["run_start_time"][i])),
+            self.string(int(self.arrays["run_root"][i])),
+            self.string(int(self.arrays["run_commit_sha"][i])),
+            [
+                TestView(
+                    self.string(int(self.arrays["test_name"][test])),
+                    nullable(int(self.arrays["test_line_no"][test])),
+                    [self.execution(execution) for execution in range(*self.span("test_executions", test, test + 1))],
+                    self.results("test", test),
+                )
+                for test in range(*self.span("run_tests", i, i + 1))
+            ],
+        )
+
+
+def read_header(path: str) -> tuple[dict[str, list[int]], int]:
+    """
+    Read the header of a cache file.
+    :param path: The path of the cache file.
+    :returns: The offset from the start of the data and the length of each array, and the offset of the data.
+    :raises ValueError: If the file is not a cache file of this version.
+    """
+    with open(path, "rb") as f:
+        magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not a version {FORMAT_VERSION} history cache: {path}")
+        return json.loads(f.read(header_length)), aligned(PREAMBLE.size + header_length)
+
+
+def aligned(offset: int) -> int:
+    """
+    Return the first aligned offset at or after the given one.
+    :param offset: The offset.
+    """
+    return offset + -offset % ALIGNMENT
+
+
+def nullable(value: int) -> Union[int, None]:
+    """
+    Return the value of an integer column, or None if it is null.
+    :param value: The stored value.
+    """
+    return None if value == NULL else value
+
+
+class HistoryCache:
+    """
+    Local copy of the most recent runs in a database, stored as columns of integers and a table of strings in a file
+    that is memory-mapped when it is read, so that only the runs that are still needed are decoded.
+    Runs are identified by their ID, start time, and the number of their tests and flakefighter results. Runs which
+    have been pruned from the database are dropped from the cache, runs which were still being written when they were
+    cached are downloaded again, and a database that has been recreated at the same URL is not confused with the old
+    one.
+    The cache file holds nothing but data, so reading it never runs any code from it.
+
+    :ivar path: The path of the cache file, which is keyed by the database URL.
+    :ivar runs: The cached runs with most recent first, once synced in this session.
+    :ivar limit: The maximum number of runs that were synced, or None if every run was synced.
+    :ivar lock: Lock held while reading or invalidating, since history may be prefetched by several consumers at once.
+    """
+
+    def __init__(self, directory: str, url: str):
+        os.makedirs(directory, exist_ok=True)
+        key = hashlib.sha256(url.encode()).hexdigest()[:16]
+        self.path = os.path.join(directory, f"history-{key}.bin")
+        self.runs: Union[list[RunView], None] = None
+        self.limit: Union[int, None] = None
+        self.lock = threading.Lock()
+
+    def covers(self, limit: Union[int, None]) -> bool:
+        """
+        Return whether the runs synced in this session include the given number of most recent runs.
+        :param limit: The number of runs, or None for every run.
+        """
+        return self.runs is not None and (self.limit is None or (limit is not None and limit <= self.limit))
+
+    def cached(self, current: dict[int, tuple]) -> tuple[dict[int, RunView], int]:
+        """
+        Decode the runs in the cache file that are still stored as they were cached, or none if the file is missing,
+        unreadable, or from another version.
+        :param current: The fingerprint of each stored run, by ID.
+        :returns: The decoded runs by ID, and the number of runs in the cache file.
+        """
+        try:
+            cached = CachedRuns.load(self.path)
+            runs = {
+                cached.run_id(i): cached.run(i)
+                for i in range(len(cached))
+                if current.get(cached.run_id(i)) == cached.fingerprint(i)
+            }
+            return runs, len(cached)
+        except (OSError, ValueError, KeyError, IndexError, TypeError, struct.error):
+            return {}, 0
+
+    def load(self) -> list[RunView]:
+        """
+        Load every run in the cache file, or none if it is missing, unreadable, or from another version.
+        """
+        try:
+            cached = CachedRuns.load(self.path)
+            return [cached.run(i) for i in range(len(cached))]
+        except (OSError, ValueError, KeyError, IndexError, TypeError, struct.error):
+            return []
+
+    def store(self, runs: list[RunView]):
+        """
+        Replace the cache file with the given runs, writing to a temporary file first so that concurrent sessions never
+        read a partial file.
+        :param runs: The runs to store.
+        """
+        encoder = RunEncoder()
+        for run in runs:
+            encoder.add_run(run)
+        arrays = encoder.arrays()
+        # The header holds the offset of each array from the start of the data, which follows the header
+        header = {}
+        offset = 0
+        for name, array in arrays.items():
+            header[name] = [offset, len(array)]
+            offset = aligned(offset + array.nbytes)
+        encoded_header = json.dumps(header).encode()
+        fd, path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(encoded_header)))
+                f.write(encoded_header)
+                for array in arrays.values():
+                    f.write(b"\0" * (aligned(f.tell()) - f.tell()))
+                    f.write(array.tobytes())
+            os.replace(path, self.path)
+        except OSError:
+            os.unlink(path)
+            raise
+
+    def sync(self, database: "Database", limit: Union[int, None]):
+        """
+        Bring the cache up to date with the given number of most recent runs in the database, downloading only the runs
+        that are not already cached or have had tests or flakefighter results added since they were cached.
+        :param database: The database.
+        :param limit: The number of runs, or None for every run.
+        """
+        test_count = select(func.count(Test.id)).where(Test.run_id == Run.id).scalar_subquery()
+        test_result_count = (
+            select(func.count(FlakefighterResult.id))
+            .join(Test, Test.id == FlakefighterResult.test_id)
+            .where(Test.run_id == Run.id)
+            .scalar_subquery()
+        )
+        execution_result_count = (
+            select(func.count(FlakefighterResult.id))
+            .join(TestExecution, TestExecution.id == FlakefighterResult.test_execution_id)
+            .join(Test, Test.id == TestExecution.test_id)
+            .where(Test.run_id == Run.id)
+            .scalar_subquery()
+        )
+        with database.engine.connect() as connection:
+            current = {
+                run_id: (start_time, tests, test_results + execution_results)
+                for run_id, start_time, tests, test_results, execution_results in connection.execute(
+                    select(Run.id, Run.start_time, test_count, test_result_count, execution_result_count)
+                    .order_by(desc(Run.start_time))
+                    .limit(limit)
+                )
+            }
+        runs, cached = self.cached(current)
+        missing = [run_id for run_id in current if run_id not in runs]
+        for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            for run in database.load_history(Run.id.in_(missing[i : i + LOOKUP_BATCH_SIZE]), tracebacks=True):
+                runs[run.id] = run
+        self.runs = [runs[run_id] for run_id in current if run_id in runs]
+        self.limit = limit
+        if missing or cached != len(runs):
+            self.store(self.runs)
+
+    def read(self, database: "Database", limit: Union[int, None]) -> list[RunView]:
+        """
+        Return the given number of most recent runs, syncing the cache with the database first if needed.
+        Tracebacks are always included.
+        :param database: The database.
+        :param limit: The number of runs, or None for every run.
+        """
+        with self.lock:
+            if not self.covers(limit):
+                self.sync(database, limit)
+            return self.runs[:limit]
+
+    def invalidate(self):
+        """
+        Forget the runs synced in this session, e.g. because a new run has been saved, so that the next read syncs.
+        """
+        with self.lock:
+            self.runs = None
@@ -3,23 +3,20 @@ This module adds all the FlakeFighter configuration options to pytest.
 """
 
 import logging
-from typing import Any
+import os
+from typing import TYPE_CHECKING, Any, Union
 
-import coverage
 import pytest
-import yaml
-from importlib_metadata import entry_points, version
+from importlib_metadata import version
 from packaging.version import Version
 
-from pytest_flakefighters.config import options
-from pytest_flakefighters.database_management import Database
-from pytest_flakefighters.flakefighters.diff_cov import DiffCov
-from pytest_flakefighters.function_coverage import Profiler
-from pytest_flakefighters.plugin import FlakeFighterPlugin
-from pytest_flakefighters.rerun_strategies import All, FlakyFailure, PreviouslyFlaky
-from pytest_flakefighters.sffl import SFFL
+from pytest_flakefighters.config import options, rerun_strategies
 
-rerun_strategies = {"ALL": All, "FLAKY_FAILURE": FlakyFailure, "PREVIOUSLY_FLAKY": PreviouslyFlaky}
+# This module is loaded by every pytest session with the plugin installed, even if it is not enabled, so the heavy
+# dependencies (SQLAlchemy, coverage, pandas, GitPython, etc.) are only imported once the plugin is enabled
+if TYPE_CHECKING:
+    from pytest_flakefighters.database_management import Database
+    from pytest_flakefighters.sffl import SFFL
 
 logger = logging.getLogger(__name__)
 
@@ -29,10 +26,69 @@ def rerun_strategy(strategy: str, max_reruns: int, **kwargs):
     Instantiate the selected rerun strategy.
     """
     if strategy == "PREVIOUSLY_FLAKY":
-        return PreviouslyFlaky(max_reruns, kwargs["database"])
+        return rerun_strategies[strategy](max_reruns, kwargs["database"])
     return rerun_strategies[strategy](max_reruns)
 
 
+def config_list(value: Any) -> list[str]:
+    """
+    Parse a list-valued configuration option, which will be a string if it was specified in a configuration file.
+    :param value: The configuration value.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.split()
+    return list(value)
+
+
+def coverage_scope(flakefighters: list, sffl: Union["SFFL", None]) -> Union[list[str], None]:
+    """
+    Determine which files the active flakefighters and SFFL need the coverage of.
+    :param flakefighters: The active flakefighters.
+    :param sffl: The SFFL object, if active.
+    :returns: List of the files whose coverage is needed, or None if every file under the project root is needed.
+    """
+    if sffl is not None:
+        return None
+    scopes = [ff.coverage_scope() for ff in flakefighters]
+    if any(scope is None for scope in scopes):
+        return None
+    return sorted(set().union(*scopes))
+
+
+def coverage_backend(config: pytest.Config, scope: Union[list[str], None] = None):
+    """
+    Instantiate the selected coverage measurement backend.
+    Only files under the project root (plus any extra includes), and not omitted, are measured.
+    If the scope is restricted to particular files, then only those are measured.
+    :param config: The config options.
+    :param scope: The files to measure, or None to measure every file under the project root.
+    """
+    # pylint: disable=C0415
+    import coverage
+
+    from pytest_flakefighters.file_filter import FileFilter
+    from pytest_flakefighters.function_coverage import Profiler
+    from pytest_flakefighters.monitoring_coverage import Monitor
+    from pytest_flakefighters.null_coverage import NullCoverage
+
+    if scope == []:
+        return NullCoverage()
+    if scope is None:
+        include = [os.path.join(os.path.abspath(get_config_value(config, "root")), "*")] + config_list(
+            get_config_value(config, "coverage_include")
+        )
+    else:
+        include = scope
+    omit = config_list(get_config_value(config, "coverage_omit"))
+    if get_config_value(config, "function_coverage"):
+        return Profiler(FileFilter(include, omit))
+    if get_config_value(config, "monitoring_coverage"):
+        return Monitor(FileFilter(include, omit))
+    return coverage.Coverage(data_file=None, include=include, omit=omit)
+
+
 def pytest_addoption(parser: pytest.Parser):
     """
     Add extra pytest options.
@@ -82,11 +138,25 @@ def get_config_value(config, name):
         return None
 
 
+def history_cache_dir(config: pytest.Config) -> Union[str, None]:
+    """
+    Return the directory to cache the history of previous runs in, which is within the pytest cache directory.
+    :param config: The config options.
+    :returns: The directory, or None if the pytest cache is disabled.
+    """
+    if getattr(config, "cache", None) is None:
+        logger.warning("The pytest cache is disabled, so the history of previous runs will not be cached.")
+        return None
+    return str(config.cache.mkdir("flakefighters"))
+
+
 def setup_flakefighter_configs(flakefighter_configs: Any):
     """
     Parse the flakefighter configurations from string, or initialise to empty if None.
     :param flakefighter_configs: The flakefighter config object.
     """
+    import yaml  # pylint: disable=C0415
+
     # Can't measure coverage since the branch taken depends on the python version
     if isinstance(flakefighter_configs, str):  # pragma: no cover
         return yaml.safe_load(flakefighter_configs)["flakefighters"]  # pragma: no cover
@@ -97,27 +167,18 @@ def setup_flakefighter_configs(flakefighter_configs: Any):
     raise TypeError(f"Unexpected type for config: {type(flakefighter_configs)}")  # pragma: no cover
 
 
-def pytest_configure(config: pytest.Config):
+def load_flakefighters(config: pytest.Config, database: "Database") -> list:
     """
-    Initialise the FlakeFighterPlugin class.
+    Instantiate the active flakefighters.
+    Commandline options override those in configuration files, and basic differential coverage is used if no
+    flakefighters are specified.
     :param config: The config options.
+    :param database: The database of previous runs.
     """
-    # Skip plugin registration if disabled
-    if not get_config_value(config, "flakefighters"):
-        return
-
-    if get_config_value(config, "root") is None:
-        config.option.root = str(config.rootdir)
-
-    max_runs = get_config_value(config, "load_max_runs")
-    database = Database(
-        get_config_value(config, "database_url"),
-        max_runs if max_runs != "" else None,
-        get_config_value(config, "store_max_runs"),
-        get_config_value(config, "time_immemorial"),
-    )
+    # pylint: disable=C0415
+    from importlib_metadata import entry_points
 
-    cov = Profiler() if get_config_value(config, "function_coverage") else coverage.Coverage()
+    from pytest_flakefighters.flakefighters.diff_cov import DiffCov
 
     algorithms = {ff.name: ff for ff in entry_points(group="pytest_flakefighters")}
     flakefighter_configs = config.inicfg.get("pytest_flakefighters")
@@ -161,12 +222,60 @@ def pytest_configure(config: pytest.Config):
                             | params
                         )
                     )
+    return flakefighters
+
+
+def pytest_configure(config: pytest.Config):
+    """
+    Initialise the FlakeFighterPlugin class.
+    :param config: The config options.
+    """
+    # Skip plugin registration if disabled
+    if not get_config_value(config, "flakefighters"):
+        return
+
+    # pylint: disable=C0415
+    from pytest_flakefighters.database_management import Database
+    from pytest_flakefighters.distributed import is_controller, is_worker
+    from pytest_flakefighters.plugin import FlakeFighterPlugin
+
+    if get_config_value(config, "root") is None:
+        config.option.root = str(config.rootdir)
+
+    max_runs = get_config_value(config, "load_max_runs")
+    database = Database(
+        get_config_value(config, "database_url"),
+        max_runs if max_runs != "" else None,
+        get_config_value(config, "store_max_runs"),
+        get_config_value(config, "time_immemorial"),
+        get_config_value(config, "concurrent_database"),
+        history_cache_dir(config) if get_config_value(config, "history_cache") else None,
+        get_config_value(config, "coverage_index"),
+        get_config_value(config, "coverage_store"),
+        get_config_value(config, "coverage_deltas"),
+    )
+    # Closing the database finishes any background reads, even if configuration fails before the session starts
+    config.add_cleanup(database.close)
+
+    flakefighters = load_flakefighters(config, database)
+
+    sffl = None
+    if get_config_value(config, "sffl"):
+        from pytest_flakefighters.sffl import SFFL
+
+        sffl = SFFL(
+            root=get_config_value(config, "root"),
+            metric=get_config_value(config, "sffl"),
+            output_file=get_config_value(config, "sffl_output_file"),
+            include_test_code=get_config_value(config, "sffl_include_test_code"),
+        )
 
     config.pluginmanager.register(
         FlakeFighterPlugin(
             root=get_config_value(config, "root"),
             database=database,
-            cov=cov,
+            # Working out which files to measure can wait for DiffCov's diff, so is left until the session starts
+            cov=lambda: coverage_backend(config, coverage_scope(flakefighters, sffl)),
             flakefighters=flakefighters,
             rerun_strategy=rerun_strategy(
                 get_config_value(config, "rerun_strategy"), get_config_value(config, "max_reruns"), database=database
@@ -174,16 +283,11 @@ def pytest_configure(config: pytest.Config):
             save_run=not get_config_value(config, "no_save"),
             display_outcomes=get_config_value(config, "display_outcomes"),
             display_verdicts=get_config_value(config, "display_verdicts"),
-            sffl=(
-                SFFL(
-                    root=get_config_value(config, "root"),
-                    metric=get_config_value(config, "sffl"),
-                    output_file=get_config_value(config, "sffl_output_file"),
-                    include_test_code=get_config_value(config, "sffl_include_test_code"),
-                )
-                if get_config_value(config, "sffl")
-                else None
-            ),
+            sffl=sffl,
+            continuous_coverage=get_config_value(config, "continuous_coverage"),
+            stream_results=get_config_value(config, "stream_results"),
+            worker=is_worker(config),
+            controller=is_controller(config),
         ),
         name="flakefighter_plugin",
     )
@@ -0,0 +1,90 @@
+"""
+This module implements the :code:`flakefighters-db` command for maintaining a flakefighters database outside of a test
+session.
+"""
+
+import argparse
+from typing import Sequence, Union
+
+from pytest_flakefighters.database_management import Database
+
+
+def upgrade(args: argparse.Namespace):
+    """
+    Bring the schema of an existing database up to date, creating any missing tables, columns, and indexes, and
+    building any missing test summaries.
+    :param args: The parsed command line arguments.
+    """
+    # Opening the database brings it up to date
+    with Database(args.database_url) as db:
+        print(f"Upgraded {db.engine.url.render_as_string(hide_password=True)}")
+
+
+def prune(args: argparse.Namespace):
+    """
+    Delete old runs, so that retention does not need to be enforced at the end of every test session.
+    :param args: The parsed command line arguments.
+    """
+    # Opening the database brings it up to date first, since pruning reads and updates tables added since it was
+    # created
+    with Database(
+        args.database_url,
+        store_max_runs=args.store_max_runs,
+        time_immemorial=args.time_immemorial,
+        coverage_store_dir=args.coverage_store,
+    ) as db:
+        pruned = db.prune()
+        print(f"Pruned {pruned} runs from {db.engine.url.render_as_string(hide_password=True)}")
+
+
+def add_database_url(parser: argparse.ArgumentParser):
+    """
+    Add the database URL argument to a subcommand parser.
+    :param parser: The subcommand parser.
+    """
+    parser.add_argument(
+        "--database-url",
+        "-D",
+        default="sqlite:///flakefighters.db",
+        help="The database URL. Defaults to 'flakefighters.db' in the current working directory.",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command line argument parser, with one subcommand per maintenance task.
+    """
+    parser = argparse.ArgumentParser(prog="flakefighters-db", description="Maintain a flakefighters database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    upgrade_parser = subparsers.add_parser(
+        "upgrade", help="Add any tables, columns, and indexes that are missing from an existing database."
+    )
+    add_database_url(upgrade_parser)
+    upgrade_parser.set_defaults(func=upgrade)
+
+    prune_parser = subparsers.add_parser(
+        "prune", help="Delete runs that are older than time immemorial or exceed the maximum number of stored runs."
+    )
+    add_database_url(prune_parser)
+    prune_parser.add_argument(
+        "--store-max-runs", type=int, help="The maximum number of runs to keep. Default is to keep all."
+    )
+    prune_parser.add_argument(
+        "--time-immemorial",
+        help="How long to keep runs for, specified as `days:hours:minutes`. E.g. to keep runs for one week, use 7:0:0.",
+    )
+    prune_parser.add_argument(
+        "--coverage-store", help="The coverage store directory, from which to delete the coverage of the pruned runs."
+    )
+    prune_parser.set_defaults(func=prune)
+    return parser
+
+
+def main(argv: Union[Sequence[str], None] = None):
+    """
+    Entry point for the :code:`flakefighters-db` command.
+    :param argv: The command line arguments. Defaults to :code:`sys.argv[1:]`.
+    """
+    args = build_parser().parse_args(argv)
+    args.func(args)
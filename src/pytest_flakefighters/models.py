@@ -0,0 +1,657 @@
+"""
+This module defines the classes that are stored in the test run database, and the columns-only views of them that
+history is read as. The database itself is managed by :code:`database_management`, which re-exports these classes.
+"""
+
+import pickle
+from dataclasses import dataclass
+from datetime import datetime
+from typing import NamedTuple, Union
+
+from sqlalchemy import (
+    Boolean,
+    CheckConstraint,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    PickleType,
+    String,
+    Text,
+    TypeDecorator,
+    func,
+)
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    declared_attr,
+    relationship,
+    validates,
+)
+
+from pytest_flakefighters.coverage_map import CoverageMap, unpack_delta
+
+# Maximum number of values to look up per query, to stay within database limits on query parameters
+LOOKUP_BATCH_SIZE = 500
+# Every pickle written by earlier versions begins with the PROTO opcode, which is never the version of packed coverage
+PICKLE_PREFIX = b"\x80"
+
+
+def as_coverage_map(coverage: Union[dict, CoverageMap, None]) -> Union[CoverageMap, None]:
+    """
+    Convert coverage dictionaries to CoverageMaps so that consumers only ever see one representation.
+    :param coverage: The coverage to convert.
+    """
+    if coverage is None or isinstance(coverage, CoverageMap):
+        return coverage
+    return CoverageMap(coverage)
+
+
+def unpack_coverage(data: bytes) -> CoverageMap:
+    """
+    Decode stored coverage, which is packed by :code:`CoverageMap.pack` unless it was pickled by an earlier version.
+    Coverage pickled as plain dictionaries is converted to a CoverageMap.
+    :param data: The stored coverage.
+    """
+    if data[:1] == PICKLE_PREFIX:
+        return as_coverage_map(pickle.loads(data))
+    return CoverageMap.unpack(data)
+
+
+class CoverageType(TypeDecorator):  # pylint: disable=W0223,R0901
+    """
+    Column type for line coverage, which is stored packed (see :code:`CoverageMap.pack`) and always loaded as a
+    CoverageMap.
+    Coverage pickled by earlier versions can still be loaded, but is converted when the database is opened (see
+    :code:`upgrade_coverage`).
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):  # pylint: disable=W0613
+        """
+        Pack coverage to be stored. The packed format is the same for every database dialect.
+        :param value: The coverage, as a CoverageMap or a dictionary.
+        :param dialect: The database dialect.
+        """
+        return None if value is None else as_coverage_map(value).pack()
+
+    def process_result_value(self, value, dialect):  # pylint: disable=W0613
+        """
+        Unpack stored coverage into a CoverageMap.
+        :param value: The stored coverage.
+        :param dialect: The database dialect.
+        """
+        return None if value is None else unpack_coverage(value)
+
+
+@dataclass
+class Base(DeclarativeBase):
+    """
+    Declarative base class for data objects.
+
+    :ivar id: Unique autoincrementing ID for the object.
+    """
+
+    id: Mapped[int] = Column(Integer, primary_key=True)  # pylint: disable=C0103
+    # Explicitly flag that we don't want pytest to collect our Test, TestExecution, etc. classes.
+    __test__ = False  # pylint: disable=C0103
+
+    @declared_attr
+    def __tablename__(self):
+        return self.__name__.lower()
+
+
+@dataclass
+class Run(Base):
+    """
+    Class to store attributes of a flakefighters run.
+    :ivar start_time: The time the test run was begun.
+    :ivar created_at: The time the entry was added to the database.
+    This is not necessarily equivalent to start_time if the test suite took a long time to run or
+    if the entry was migrated from a separate database.
+    :ivar root: The root directory of the project.
+    :ivar commit_sha: The commit SHA at the time of the run.
+                      This should only be set if the root is a git repo and is clean at the time of the run.
+    :ivar collection_coverage: The lines covered while importing and collecting the tests. These are common to every
+                               test execution in the run, so are stored once here rather than with each execution.
+    :ivar coverage_matrix: The name of the matrix of the coverage of the executions of the run in the coverage store,
+                           if it was saved with one.
+    :ivar tests: The test suite.
+    :ivar active_flakefighters: The flakefighters that are active on the run.
+    """
+
+    start_time = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=func.now(), index=True)
+    root: Mapped[str] = Column(String)
+    # <<<<<<< HEAD
+    # tests = relationship("Test", backref="run", cascade="all, delete")
+    # active_flakefighters = relationship("ActiveFlakeFighter", backref="run", cascade="all, delete")
+    # =======
+    commit_sha: Mapped[str] = Column(String, index=True)
+    collection_coverage: Mapped[CoverageMap] = Column(CoverageType)
+    coverage_matrix: Mapped[str] = Column(String)
+    tests = relationship(
+        "Test",
+        backref="run",
+        lazy="subquery",
+        cascade="all, delete",
+        passive_deletes=True,
+    )
+    active_flakefighters = relationship(
+        "ActiveFlakeFighter",
+        backref="run",
+        lazy="subquery",
+        cascade="all, delete",
+        passive_deletes=True,
+    )
+
+    @validates("collection_coverage")
+    def validate_collection_coverage(self, _, coverage: Union[dict, CoverageMap, None]) -> Union[CoverageMap, None]:
+        """
+        Convert coverage dictionaries to CoverageMaps.
+        """
+        return as_coverage_map(coverage)
+
+
+# >>>>>>> main
+
+
+@dataclass
+class ActiveFlakeFighter(Base):
+    """
+    Store relevant information about the active flakefighters.
+
+    :ivar run_id: Foreign key of the related run.
+    :ivar name: Class name of the flakefighter.
+    :ivar params: The parameterss of the flakefighter.
+    """
+
+    run_id: Mapped[int] = Column(Integer, ForeignKey("run.id", ondelete="CASCADE"), nullable=False, index=True)
+    name: Mapped[str] = Column(String)
+    params: Mapped[dict] = Column(PickleType)
+
+
+@dataclass
+class Test(Base):
+    """
+    Class to store attributes of a test case.
+
+    :ivar run_id: Foreign key of the related run.
+    :ivar fspath: File system path of the file containing the test definition.
+    :ivar line_no: Line number of the test definition.
+    :ivar name: Name of the test case.
+    :ivar skipped: Boolean true if the test was skipped, else false.
+    :ivar executions: List of execution attempts.
+    :ivar flakefighter_results: List of test-level flakefighter results.
+
+    .. note::
+      Execution-level flakefighter results will be stored inside the individual TestExecution objects
+    """
+
+    run_id: Mapped[int] = Column(Integer, ForeignKey("run.id", ondelete="CASCADE"), nullable=False, index=True)
+    fspath: Mapped[str] = Column(String)
+    line_no: Mapped[int] = Column(Integer)
+    name: Mapped[str] = Column(String, index=True)
+    skipped: Mapped[bool] = Column(Boolean, default=False)
+    executions = relationship("TestExecution", backref="test", cascade="all, delete", passive_deletes=True)
+    flakefighter_results = relationship(
+        "FlakefighterResult",
+        backref="test",
+        cascade="all, delete",
+        passive_deletes=True,
+    )
+
+    @property
+    def flaky(self) -> bool:
+        """
+        Return whether a test (or any of its executions) has been marked as flaky by any flakefighter.
+        """
+        if not self.executions and not self.flakefighter_results:
+            return None
+        return any(result.flaky for result in self.flakefighter_results) or any(
+            execution.flaky for execution in self.executions
+        )
+
+
+def apply_delta(base: CoverageMap, delta: bytes) -> CoverageMap:
+    """
+    Reconstruct coverage that is stored as a delta.
+    :param base: The coverage the delta is based on.
+    :param delta: The lines added and removed relative to the base, encoded by :code:`pack_delta`.
+    """
+    added, removed = unpack_delta(delta)
+    return (base - removed) | added
+
+
+@dataclass
+class CoverageBlob(Base):
+    """
+    Class to store line coverage, identified by its content so that identical coverage is only stored once.
+    Coverage is either stored in full, or as a delta of the lines added and removed relative to the coverage of a
+    previous execution of the same test (see :code:`Database.coverage_deltas`). Either way, :code:`covered_lines` is
+    the full coverage.
+
+    :ivar digest: The content hash of the full coverage.
+    :ivar coverage: The covered lines, if stored in full.
+    :ivar delta: The lines added and removed relative to the base, if stored as a delta.
+    :ivar base_id: Foreign key of the coverage the delta is based on.
+    :ivar base: The coverage the delta is based on.
+    :ivar depth: The number of deltas between this coverage and coverage stored in full.
+    """
+
+    __tablename__ = "coverage_blob"
+
+    digest: Mapped[bytes] = Column(LargeBinary(16), unique=True, nullable=False)
+    coverage: Mapped[CoverageMap] = Column(CoverageType)
+    delta: Mapped[bytes] = Column(LargeBinary)
+    base_id: Mapped[int] = Column(Integer, ForeignKey("coverage_blob.id"), index=True)
+    depth: Mapped[int] = Column(Integer, default=0)
+    base = relationship("CoverageBlob", remote_side="CoverageBlob.id")
+
+    @property
+    def covered_lines(self) -> CoverageMap:
+        """
+        Return the covered lines, reconstructing them from the base if they are stored as a delta.
+        """
+        if self.delta is None:
+            return self.coverage
+        # Cached outside the mapped columns, so that reconstructed coverage is never written back in full
+        if getattr(self, "_covered_lines", None) is None:
+            self._covered_lines = apply_delta(self.base.covered_lines, self.delta)  # pylint: disable=W0201
+        return self._covered_lines
+
+
+@dataclass
+class CoveredFile(Base):
+    """
+    Class to store the path of a file covered by stored coverage, so that the coverage index refers to it by ID.
+
+    :ivar path: The file path.
+    """
+
+    __tablename__ = "covered_file"
+
+    path: Mapped[str] = Column(String, unique=True, nullable=False)
+
+
+@dataclass
+class CoveredRange(Base):
+    """
+    Class to store a range of consecutive lines of a file covered by stored coverage.
+    Together, the ranges index the stored coverage, so that the coverage that includes given lines can be found with a
+    single query rather than by decoding every coverage blob. Ranges are only stored if the coverage index is enabled.
+
+    :ivar coverage_id: Foreign key of the stored coverage.
+    :ivar file_id: Foreign key of the covered file.
+    :ivar first_line: The first line of the range.
+    :ivar last_line: The last line of the range.
+    """
+
+    __tablename__ = "covered_range"
+    # Lines are looked up by file, and the coverage is read from the index itself
+    __table_args__ = (Index("ix_covered_range_lines", "file_id", "first_line", "last_line", "coverage_id"),)
+
+    coverage_id: Mapped[int] = Column(
+        Integer, ForeignKey("coverage_blob.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    file_id: Mapped[int] = Column(Integer, ForeignKey("covered_file.id"), nullable=False)
+    first_line: Mapped[int] = Column(Integer, nullable=False)
+    last_line: Mapped[int] = Column(Integer, nullable=False)
+
+
+@dataclass
+class TestExecution(Base):  # pylint: disable=R0902
+    """
+    Class to store attributes of a test outcome.
+
+    :ivar test_id: Foreign key of the related test.
+    :ivar outcome: Outcome of the test. One of "passed", "failed", or "skipped".
+    :ivar stdout: The captured stdout string.
+    :ivar stedrr: The captured stderr string.
+    :ivar start_time: The start time of the test.
+    :ivar end_time: The end time of the test.
+    :ivar coverage: The lines covered by the test itself. Dictionaries mapping files to lines are converted to
+                    CoverageMaps. See :code:`full_coverage` for the coverage including test collection.
+    :ivar coverage_id: Foreign key of the stored coverage, which may be shared with other executions.
+    :ivar coverage_blob: The stored coverage.
+    :ivar inline_coverage: Coverage stored with the execution itself by earlier versions.
+    :ivar flakefighter_results: The execution-level flakefighter results.
+    :ivar exception: The exception associated with the test if one was thrown.
+    """
+
+    __tablename__ = "test_execution"
+
+    test_id: Mapped[int] = Column(Integer, ForeignKey("test.id", ondelete="CASCADE"), nullable=False, index=True)
+    outcome: Mapped[str] = Column(String)
+    stdout: Mapped[str] = Column(Text)
+    stderr: Mapped[str] = Column(Text)
+    report: Mapped[str] = Column(Text)
+    start_time: Mapped[datetime] = Column(DateTime(timezone=True))
+    end_time: Mapped[datetime] = Column(DateTime(timezone=True))
+    coverage_id: Mapped[int] = Column(Integer, ForeignKey("coverage_blob.id"), nullable=True, index=True)
+    inline_coverage: Mapped[CoverageMap] = Column("coverage", CoverageType)
+    coverage_blob = relationship("CoverageBlob")
+    flakefighter_results = relationship(
+        "FlakefighterResult",
+        backref="test_execution",
+        cascade="all, delete",
+        passive_deletes=True,
+    )
+    exception = relationship(
+        "TestException",
+        uselist=False,
+        backref="test_execution",
+        cascade="all, delete",
+        passive_deletes=True,
+    )
+
+    @property
+    def coverage(self) -> Union[CoverageMap, None]:
+        """
+        Return the lines covered by the test itself.
+        """
+        if self.coverage_blob is not None:
+            return self.coverage_blob.covered_lines
+        return self.inline_coverage
+
+    @coverage.setter
+    def coverage(self, coverage: Union[dict, CoverageMap, None]):
+        """
+        Set the lines covered by the test itself.
+        Identical coverage is only stored once, since new blobs are replaced by existing ones with the same digest when
+        the execution is saved.
+        """
+        coverage = as_coverage_map(coverage)
+        self.inline_coverage = None
+        self.coverage_blob = None if coverage is None else CoverageBlob(digest=coverage.digest(), coverage=coverage)
+
+    @property
+    def full_coverage(self) -> Union[CoverageMap, None]:
+        """
+        Return the lines covered by the test merged with those covered while collecting the tests of its run.
+        """
+        # The test is set by the backref of Test.executions, which pylint cannot see
+        # pylint: disable=E1101
+        if self.coverage is None or self.test is None or self.test.run is None:
+            return self.coverage
+        if not self.test.run.collection_coverage:
+            return self.coverage
+        return self.test.run.collection_coverage | self.coverage
+
+    @property
+    def flaky(self) -> bool:
+        """
+        Return whether a test (or any of its executions) has been marked as flaky by any flakefighter.
+        """
+        return any(result.flaky for result in self.flakefighter_results)
+
+
+@dataclass
+class TestException(Base):  # pylint: disable=R0902
+    """
+    Class to store information about the exceptions that cause tests to fail.
+
+    :ivar execution_id: Foreign key of the related execution.
+    :ivar name: Name of the exception.
+    :traceback: The full stack of traceback entries.
+    """
+
+    __tablename__ = "test_exception"
+
+    execution_id: Mapped[int] = Column(
+        Integer, ForeignKey("test_execution.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    name: Mapped[str] = Column(String)
+    traceback = relationship(
+        "TracebackEntry",
+        backref="exception",
+        cascade="all, delete",
+        passive_deletes=True,
+    )
+
+
+@dataclass
+class TracebackEntry(Base):  # pylint: disable=R0902
+    """
+    Class to store attributes of entries in the stack trace.
+
+    :ivar exception_id: Foreign key of the related exception.
+    :ivar path: Filepath of the source file.
+    :ivar lineno: Line number of the executed statement.
+    :ivar colno: Column number of the executed statement.
+    :ivar statement: The executed statement.
+    :ivar source: The surrounding source code.
+    """
+
+    exception_id: Mapped[int] = Column(
+        Integer, ForeignKey("test_exception.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    path: Mapped[str] = Column(String)
+    lineno: Mapped[int] = Column(Integer)
+    colno: Mapped[int] = Column(Integer)
+    statement: Mapped[str] = Column(String)
+    source: Mapped[str] = Column(Text)
+
+
+@dataclass
+class FlakefighterResult(Base):  # pylint: disable=R0902
+    """
+    Class to store flakefighter results.
+
+    :ivar test_execution_id: Foreign key of the related test execution. Should not be set if test_id is present.
+    :ivar test_id: Foreign key of the related test. Should not be set if test_execution_id is present.
+    :ivar name: Name of the flakefighter.
+    :ivar flaky: Boolean true if the test (execution) was classified as flaky.
+    """
+
+    __tablename__ = "flakefighter_result"
+
+    test_execution_id: Mapped[int] = Column(
+        Integer, ForeignKey("test_execution.id", ondelete="CASCADE"), nullable=True, index=True
+    )
+    test_id: Mapped[int] = Column(Integer, ForeignKey("test.id", ondelete="CASCADE"), nullable=True, index=True)
+    name: Mapped[str] = Column(String)
+    flaky: Mapped[bool] = Column(Boolean)
+
+    __table_args__ = (
+        CheckConstraint(
+            "NOT (test_execution_id IS NULL AND test_id IS NULL)",
+            name="check_test_id_not_null",
+        ),
+    )
+
+    @property
+    def classification(self):
+        """
+        Return the classification as a string.
+        "flaky" if the test was classified as flaky, else "genuine".
+        """
+        return "flaky" if self.flaky else "genuine"
+
+
+@dataclass
+class SchemaVersion(Base):
+    """
+    Class to store the version of the format of data whose encoding has changed, so that data stored in an earlier
+    format is only converted once, and how far other one-off upgrades of the stored data have got.
+
+    :ivar name: The name of the data, e.g. "coverage".
+    :ivar version: The version of the format that all of the data is stored in. For the coverage index, this is instead
+                   the ID of the most recent coverage that the index is up to date with.
+    """
+
+    __tablename__ = "schema_version"
+
+    name: Mapped[str] = Column(String, unique=True, nullable=False)
+    version: Mapped[int] = Column(Integer, nullable=False)
+
+
+@dataclass
+class TestSummary(Base):  # pylint: disable=R0902
+    """
+    Class to store a running summary of the history of a test case, which is updated whenever a run is saved.
+    The tests of pruned runs are subtracted from the summaries, so they cover the runs that are still stored.
+
+    :ivar name: Name of the test case.
+    :ivar runs: The number of runs the test has been part of.
+    :ivar passed_executions: The number of executions of the test that have passed.
+    :ivar failed_executions: The number of executions of the test that have failed.
+    :ivar flaky_runs: The number of runs in which the test has been marked as flaky.
+    :ivar verdicts: Dictionary mapping each flakefighter to whether it marked the test as flaky the last time it was
+                    run on the test.
+    :ivar last_outcomes: The outcomes of the executions of the test in the last run it was part of.
+    :ivar last_run_id: The ID of the last run the test was part of.
+    :ivar last_commit_sha: The commit SHA of the last run the test was part of.
+    :ivar last_seen: The start time of the last run the test was part of.
+    :ivar total_duration: The total time in seconds taken by the timed executions of the test.
+    :ivar timed_executions: The number of executions of the test with a start and end time.
+    """
+
+    __tablename__ = "test_summary"
+
+    name: Mapped[str] = Column(String, unique=True, nullable=False)
+    runs: Mapped[int] = Column(Integer, default=0)
+    passed_executions: Mapped[int] = Column(Integer, default=0)
+    failed_executions: Mapped[int] = Column(Integer, default=0)
+    flaky_runs: Mapped[int] = Column(Integer, default=0)
+    verdicts: Mapped[dict] = Column(PickleType)
+    last_outcomes: Mapped[list] = Column(PickleType)
+    last_run_id: Mapped[int] = Column(Integer)
+    last_commit_sha: Mapped[str] = Column(String, index=True)
+    last_seen: Mapped[datetime] = Column(DateTime)
+    total_duration: Mapped[float] = Column(Float, default=0)
+    timed_executions: Mapped[int] = Column(Integer, default=0)
+
+    @property
+    def mean_duration(self) -> Union[float, None]:
+        """
+        Return the mean time in seconds taken by the timed executions of the test, or None if none have been timed.
+        """
+        return self.total_duration / self.timed_executions if self.timed_executions else None
+
+
+class ResultView(NamedTuple):
+    """
+    Columns-only view of a stored flakefighter result.
+
+    :ivar name: Name of the flakefighter.
+    :ivar flaky: Boolean true if the test (execution) was classified as flaky.
+    """
+
+    name: str
+    flaky: bool
+
+    @property
+    def classification(self):
+        """
+        Return the classification as a string.
+        "flaky" if the test was classified as flaky, else "genuine".
+        """
+        return "flaky" if self.flaky else "genuine"
+
+
+class TracebackView(NamedTuple):
+    """
+    Columns-only view of a stored traceback entry, without its surrounding source code.
+
+    :ivar path: Filepath of the source file.
+    :ivar lineno: Line number of the executed statement.
+    :ivar colno: Column number of the executed statement.
+    :ivar statement: The executed statement.
+    """
+
+    path: str
+    lineno: int
+    colno: int
+    statement: str
+
+
+class ExceptionView(NamedTuple):
+    """
+    Columns-only view of a stored exception.
+
+    :ivar name: Name of the exception.
+    :ivar traceback: The full stack of traceback entries.
+    """
+
+    name: str
+    traceback: list[TracebackView]
+
+
+class ExecutionView(NamedTuple):
+    """
+    Columns-only view of a stored test execution, without its coverage or captured output.
+
+    :ivar outcome: Outcome of the test. One of "passed", "failed", or "skipped".
+    :ivar flakefighter_results: The execution-level flakefighter results.
+    :ivar exception: The exception associated with the test if one was thrown and tracebacks were loaded.
+    :ivar start_time: The start time of the test.
+    :ivar end_time: The end time of the test.
+    """
+
+    outcome: str
+    flakefighter_results: list[ResultView]
+    exception: Union[ExceptionView, None] = None
+    start_time: Union[datetime, None] = None
+    end_time: Union[datetime, None] = None
+
+    @property
+    def flaky(self) -> bool:
+        """
+        Return whether the execution has been marked as flaky by any flakefighter.
+        """
+        return any(result.flaky for result in self.flakefighter_results)
+
+
+class TestView(NamedTuple):
+    """
+    Columns-only view of a stored test case.
+
+    :ivar name: Name of the test case.
+    :ivar line_no: Line number of the test definition.
+    :ivar executions: List of execution attempts.
+    :ivar flakefighter_results: List of test-level flakefighter results.
+    """
+
+    __test__ = False
+
+    name: str
+    line_no: int
+    executions: list[ExecutionView]
+    flakefighter_results: list[ResultView]
+
+    @property
+    def flaky(self) -> bool:
+        """
+        Return whether a test (or any of its executions) has been marked as flaky by any flakefighter.
+        """
+        if not self.executions and not self.flakefighter_results:
+            return None
+        return any(result.flaky for result in self.flakefighter_results) or any(
+            execution.flaky for execution in self.executions
+        )
+
+
+class RunView(NamedTuple):
+    """
+    Columns-only view of a stored flakefighters run.
+    The attributes of each view have the same names as those of the corresponding mapped class, so code which reads
+    previous runs works on either.
+
+    :ivar id: The ID of the run.
+    :ivar start_time: The time the test run was begun.
+    :ivar root: The root directory of the project.
+    :ivar commit_sha: The commit SHA at the time of the run.
+    :ivar tests: The test suite.
+    """
+
+    id: int  # pylint: disable=C0103
+    start_time: datetime
+    root: str
+    commit_sha: str
+    tests: list[TestView]
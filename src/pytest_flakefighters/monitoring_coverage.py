@@ -0,0 +1,123 @@
+"""
+This module implements the Monitor class to measure line coverage using the PEP 669 :code:`sys.monitoring` API.
+"""
+
+import os
+import sys
+from types import CodeType
+
+import coverage
+from coverage import CoverageData
+
+from pytest_flakefighters.file_filter import FileFilter
+
+# Pylint cannot see the members of sys.monitoring, which only exists from Python 3.12
+# pylint: disable=E1101
+
+# IDs 0, 1, 2, and 5 are reserved for debuggers, coverage tools, profilers, and optimisers respectively.
+FREE_TOOL_IDS = [3, 4]
+# Never measure the code that records the coverage data
+IGNORED_PATHS = (os.path.dirname(coverage.__file__), os.path.abspath(__file__))
+
+
+class Monitor:
+    """
+    Provides functionality to measure line coverage of a pytest test suite using :code:`sys.monitoring`, which is
+    available from Python 3.12.
+    Line events are only enabled for code objects once they start executing, and each line event is disabled after its
+    first hit, so lines that execute repeatedly within the same context cost almost nothing.
+    Events are re-enabled whenever the context changes so that each context records its own coverage.
+
+    :ivar coverage_data: The covered lines for each module.
+    :ivar file_filter: Decides which modules to measure. Line events are never enabled for other modules.
+    :ivar tool_id: The :code:`sys.monitoring` tool ID used while measuring coverage.
+    :ivar running: Whether coverage is currently being measured.
+    """
+
+    def __init__(self, file_filter: FileFilter = None):
+        if not hasattr(sys, "monitoring"):
+            raise RuntimeError("Measuring coverage with sys.monitoring requires Python 3.12 or later.")
+        self.coverage_data: CoverageData = CoverageData(no_disk=True)
+        self.file_filter = file_filter or FileFilter()
+        self.tool_id: int = None
+        self.running = False
+        self._lines: dict[str, set[int]] = {}
+        self._instrumented: set[CodeType] = set()
+
+    def _on_start(self, code: CodeType, instruction_offset: int):  # pylint: disable=unused-argument
+        """
+        Enable line events for a code object the first time it starts or resumes executing, unless it is part of the
+        coverage measurement machinery or its module is not measured.
+
+        :param code: The code object being executed.
+        :param instruction_offset: The offset of the instruction being executed. UNUSED.
+        """
+        if not code.co_filename.startswith(IGNORED_PATHS) and self.file_filter(code.co_filename):
+            sys.monitoring.set_local_events(self.tool_id, code, sys.monitoring.events.LINE)
+            self._instrumented.add(code)
+        return sys.monitoring.DISABLE
+
+    def _on_line(self, code: CodeType, line_number: int):
+        """
+        Record a line as covered and disable further events from it until the context changes.
+
+        :param code: The code object being executed.
+        :param line_number: The line number being executed.
+        """
+        self._lines.setdefault(code.co_filename, set()).add(line_number)
+        return sys.monitoring.DISABLE
+
+    def _record_lines(self):
+        """
+        Add the lines covered since they were last recorded to the coverage data under the current context.
+        """
+        lines, self._lines = self._lines, {}
+        if lines:
+            self.coverage_data.add_lines(lines)
+
+    def start(self):
+        """
+        Start measuring coverage.
+        """
+        self.tool_id = next(tool_id for tool_id in FREE_TOOL_IDS if sys.monitoring.get_tool(tool_id) is None)
+        sys.monitoring.use_tool_id(self.tool_id, "pytest-flakefighters")
+        sys.monitoring.register_callback(self.tool_id, sys.monitoring.events.PY_START, self._on_start)
+        sys.monitoring.register_callback(self.tool_id, sys.monitoring.events.PY_RESUME, self._on_start)
+        sys.monitoring.register_callback(self.tool_id, sys.monitoring.events.LINE, self._on_line)
+        sys.monitoring.set_events(self.tool_id, sys.monitoring.events.PY_START | sys.monitoring.events.PY_RESUME)
+        sys.monitoring.restart_events()
+        self.running = True
+
+    def stop(self):
+        """
+        Stop measuring coverage.
+        """
+        sys.monitoring.set_events(self.tool_id, sys.monitoring.events.NO_EVENTS)
+        for code in self._instrumented:
+            sys.monitoring.set_local_events(self.tool_id, code, sys.monitoring.events.NO_EVENTS)
+        self._instrumented = set()
+        for event in [sys.monitoring.events.PY_START, sys.monitoring.events.PY_RESUME, sys.monitoring.events.LINE]:
+            sys.monitoring.register_callback(self.tool_id, event, None)
+        sys.monitoring.free_tool_id(self.tool_id)
+        self.running = False
+        self._record_lines()
+
+    def switch_context(self, context: str):
+        """
+        Set the context name of the coverage measurement.
+        The lines covered so far are recorded under the previous context, and disabled line events are re-enabled so
+        that they are recorded again under the new context.
+
+        :param context: The context name to set.
+        """
+        self._record_lines()
+        self.coverage_data.set_context(context)
+        if self.running:
+            sys.monitoring.restart_events()
+
+    def get_data(self) -> CoverageData:
+        """
+        Return coverage data.
+        """
+        self._record_lines()
+        return self.coverage_data
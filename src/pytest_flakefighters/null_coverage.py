@@ -0,0 +1,40 @@
+"""
+This module implements the NullCoverage class to stand in for a coverage backend when no coverage is needed.
+"""
+
+from coverage import CoverageData
+
+
+class NullCoverage:
+    """
+    Provides the same interface as the other coverage backends without measuring anything, so no tracer is installed.
+
+    :ivar coverage_data: The (always empty) coverage data.
+    """
+
+    def __init__(self):
+        self.coverage_data: CoverageData = CoverageData(no_disk=True)
+
+    def start(self):
+        """
+        Do not start measuring coverage.
+        """
+
+    def stop(self):
+        """
+        Do not stop measuring coverage.
+        """
+
+    def switch_context(self, context: str):
+        """
+        Set the context name of the (empty) coverage data.
+
+        :param context: The context name to set.
+        """
+        self.coverage_data.set_context(context)
+
+    def get_data(self) -> CoverageData:
+        """
+        Return the empty coverage data.
+        """
+        return self.coverage_data
@@ -7,14 +7,14 @@ from datetime import datetime
 from enum import Enum
 from importlib.metadata import version
 from re import escape
-from typing import Union
+from typing import TYPE_CHECKING, Callable, Union
 from xml.etree import ElementTree as ET
 
-import coverage
 import pytest
 from _pytest.runner import runtestprotocol
 from packaging.version import Version
 
+from pytest_flakefighters.coverage_map import CoverageMap
 from pytest_flakefighters.database_management import (
     ActiveFlakeFighter,
     Database,
@@ -22,11 +22,29 @@ from pytest_flakefighters.database_management import (
     Test,
     TestException,
     TestExecution,
+    TestView,
     TracebackEntry,
 )
-from pytest_flakefighters.flakefighters.abstract_flakefighter import FlakeFighter
+from pytest_flakefighters.distributed import (
+    WORKER_OUTPUT_KEY,
+    pack_worker_output,
+    unpack_worker_output,
+)
+from pytest_flakefighters.flakefighters.abstract_flakefighter import (
+    FlakeFighter,
+    Requirements,
+)
 from pytest_flakefighters.function_coverage import Profiler
-from pytest_flakefighters.sffl import SFFL
+from pytest_flakefighters.monitoring_coverage import Monitor
+from pytest_flakefighters.null_coverage import NullCoverage
+from pytest_flakefighters.result_writer import ResultWriter
+
+if TYPE_CHECKING:
+    import coverage
+
+    from pytest_flakefighters.sffl import SFFL
+
+CoverageBackend = Union["coverage.Coverage", Profiler, Monitor, NullCoverage]
 
 
 def context(item: pytest.Item) -> str:
@@ -52,19 +70,25 @@ class RerunStrategy(Enum):
 class FlakeFighterPlugin:  # pylint: disable=R0902
     """
     The main plugin to manage the various FlakeFighter tools.
+    Under pytest-xdist, workers run the tests and live flakefighters, and the controller assembles their tests into a
+    single run for the postprocessing flakefighters, SFFL, and the database.
     """
 
     def __init__(  # pylint: disable=R0913,R0917
         self,
         root: str,
         database: Database,
-        cov: Union[coverage.Coverage, Profiler],
+        cov: Union[CoverageBackend, Callable[[], CoverageBackend]],
         flakefighters: list[FlakeFighter],
         save_run: bool = True,
         rerun_strategy: RerunStrategy = RerunStrategy.FLAKY_FAILURE,
         display_outcomes: int = 0,
         display_verdicts: bool = False,
-        sffl: SFFL = None,
+        sffl: "SFFL" = None,
+        continuous_coverage: bool = False,
+        stream_results: bool = False,
+        worker: bool = False,
+        controller: bool = False,
     ):
         self.root = root
         self.database = database
@@ -76,47 +100,111 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
         self.display_verdicts = display_verdicts
         self.display_outcomes = display_outcomes
         self.sffl = sffl
-
-        self.run = Run(  # pylint: disable=E1123
-            root=root,
-            active_flakefighters=[
-                ActiveFlakeFighter(name=f.__class__.__name__, params=f.params())
-                for f in flakefighters
-            ],
-            start_time=datetime.now(),
+        self.continuous_coverage = continuous_coverage
+        self.worker = worker
+        self.controller = controller
+        self.requirements = Requirements(coverage=sffl is not None, history=bool(display_outcomes))
+        for ff in flakefighters:
+            self.requirements |= ff.requirements
+        self.writer = ResultWriter(database) if stream_results and save_run and not worker else None
+        # History is only queried if it is displayed, and is then loaded in the background while the tests run.
+        # A streamed run may be written before the history has loaded, so one more run is loaded in case.
+        self.display_history = (
+            database.prefetch(database.load_history, limit=display_outcomes + (self.writer is not None))
+            if display_outcomes and not worker
+            else None
         )
+        # Tests can be released once written if nothing reads them again at the end of the session
+        self.release_tests = (
+            self.writer is not None
+            and all(ff.run_live for ff in flakefighters)
+            and sffl is None
+            and not display_verdicts
+            and not display_outcomes
+        )
+        self.released_genuine_failure = False
+
+        self.run = Run(root=root, start_time=datetime.now())  # pylint: disable=E1123
+
+    def record_flakefighters(self):
+        """
+        Record the active flakefighters on the run, just before it is saved.
+        Their parameters can depend on work that is prefetched at startup (e.g. the commits that DiffCov diffs), so they
+        are only read once the run is saved, by which point that work has long finished.
+        """
+        self.run.active_flakefighters = [
+            ActiveFlakeFighter(name=f.__class__.__name__, params=f.params()) for f in self.flakefighters
+        ]
 
     def pytest_sessionstart(self, session: pytest.Session):  # pylint: disable=unused-argument
         """
         Start the coverage measurement before tests are collected so we measure class and method definitions as covered.
         :param session: The session.
         """
+        # The controller does not run any tests itself
+        if self.controller:
+            return
+        # The files to measure can depend on work that is prefetched at startup, so the backend may only be created now
+        if callable(self.cov):
+            self.cov = self.cov()
         self.cov.start()
         self.cov.switch_context("collection")  # pragma: no cover
 
     def pytest_collection_finish(self, session: pytest.Session):  # pylint: disable=unused-argument
         """
         Stop the coverage measurement after tests are collected.
+        If measuring continuously, the tracer is left running and only the context is cleared.
         :param session: The session.
         """
         # Line cannot appear as covered on our tests because the coverage measurement is leaking into the self.cov
         self.cov.switch_context(None)  # pragma: no cover
-        self.cov.stop()  # pragma: no cover
+        if not self.continuous_coverage:  # pragma: no cover
+            self.cov.stop()  # pragma: no cover
+        collection_coverage = self.pop_coverage("collection")  # pragma: no cover
+        if self.requirements.coverage:  # pragma: no cover
+            self.run.collection_coverage = collection_coverage  # pragma: no cover
+        if self.writer is not None:  # pragma: no cover
+            self.record_flakefighters()  # pragma: no cover
+            self.writer.start_run(self.run)  # pragma: no cover
+
+    def pop_coverage(self, context_label: str) -> CoverageMap:
+        """
+        Return the lines measured under the given context and release all the coverage data measured so far.
+        Erasing the data after each test means that extraction only ever reads the footprint of the current test,
+        rather than every context recorded so far in the session, and memory usage stays flat.
+        Lines measured under any other context (e.g. test setup and teardown when measuring continuously) are dropped.
+
+        :param context_label: The context whose lines to return.
+        :returns: The covered lines of each measured file.
+        """
+        data = self.cov.get_data()
+        if not data:
+            return CoverageMap()
+        data.set_query_contexts([f"^{escape(context_label)}$"])
+        line_coverage = CoverageMap({file_path: data.lines(file_path) or () for file_path in data.measured_files()})
+        data.erase()
+        return line_coverage
 
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_call(self, item: pytest.Item):
         """
         Start the coverage measurement and label the coverage for the current test, run the test,
         then stop coverage measurement.
+        If measuring continuously, the tracer is already running, so we just switch to the context of the test and
+        back to an unlabelled context afterwards so that teardown is not attributed to the test.
 
         :param item: The item.
         """
         item.start = datetime.now().timestamp()
-        self.cov.start()
+        if not self.continuous_coverage:
+            self.cov.start()
         # Lines cannot appear as covered on our tests because the coverage measurement is leaking into the self.cov
         self.cov.switch_context(context(item))  # pragma: no cover
         yield  # pragma: no cover
-        self.cov.stop()  # pragma: no cover
+        if self.continuous_coverage:  # pragma: no cover
+            self.cov.switch_context(None)  # pragma: no cover
+        else:
+            self.cov.stop()  # pragma: no cover
         item.stop = datetime.now().timestamp()
 
     @pytest.hookimpl(hookwrapper=True)
@@ -131,7 +219,7 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
         outcome = yield
         report = outcome.get_result()
         excinfo = call.excinfo
-        if excinfo is not None and call.when == "call":
+        if excinfo is not None and call.when == "call" and self.requirements.traceback:
             report.exception = TestException(  # pylint: disable=E1123
                 name=excinfo.type.__name__,
                 traceback=[
@@ -183,24 +271,21 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
                 if report.when == "setup" and report.skipped:
                     skipped = True
                 if report.when == "call":
-                    line_coverage = self.cov.get_data()
-                    line_coverage.set_query_contexts(
-                        ["collection", escape(context(item))]
-                    )
-                    captured_output = dict(report.sections)
+                    line_coverage = self.pop_coverage(context(item))
+                    captured_output = dict(report.sections) if self.requirements.captured_output else {}
                     test_execution = TestExecution(  # pylint: disable=E1123
                         outcome=report.outcome,
                         stdout=captured_output.get("stdout"),
                         stderr=captured_output.get("stderr"),
-                        report=str(report.longrepr),
+                        report=str(report.longrepr) if self.requirements.captured_output else None,
                         start_time=datetime.fromtimestamp(item.start),
                         end_time=datetime.fromtimestamp(item.stop),
-                        coverage={
-                            file_path: line_coverage.lines(file_path)
-                            for file_path in line_coverage.measured_files()
-                        },
+                        coverage=line_coverage if self.requirements.coverage else None,
                         exception=report.exception,
                     )
+                    if self.worker:
+                        # Reports are sent to the controller, and so cannot hold database objects
+                        del report.exception
                     test.executions.append(test_execution)
                     for ff in filter(lambda ff: ff.run_live, self.flakefighters):
                         ff.flaky_test_live(test_execution)
@@ -280,9 +365,53 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
             else:
                 break  # Skip further reruns
 
+        if self.writer is not None:
+            self.write(test)
+
         item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
         return True
 
+    def write(self, test: Test):
+        """
+        Submit a finished test to the result writer, releasing it if nothing else needs it.
+        :param test: The test.
+        """
+        self.writer.submit(test, release=self.release_tests)
+        if self.release_tests:
+            self.released_genuine_failure |= not test.flaky and any(e.outcome != "passed" for e in test.executions)
+            self.run.tests.remove(test)
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport):
+        """
+        Keep the reports that the controller receives from workers, so that they can be annotated with the results of
+        postprocessing flakefighters. Workers and single processes keep their reports as the tests run.
+        :param report: The report.
+        """
+        if self.controller and report.when == "call":
+            self.test_reports[report.nodeid] = report
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):  # pylint: disable=unused-argument
+        """
+        Add the tests run by a pytest-xdist worker to the run once the worker has finished.
+        :param node: The worker node.
+        :param error: The error that stopped the worker, if any.
+        """
+        output = getattr(node, "workeroutput", {}).get(WORKER_OUTPUT_KEY)
+        # Workers that crashed never ship their tests
+        if output is None:
+            return
+        collection_coverage, tests = unpack_worker_output(output)
+        if self.requirements.coverage and self.run.collection_coverage is None:
+            self.run.collection_coverage = collection_coverage
+        if self.writer is not None and self.writer.ident is None:
+            self.record_flakefighters()
+            self.writer.start_run(self.run)
+        for test in tests:
+            self.run.tests.append(test)
+            if self.writer is not None:
+                self.write(test)
+
     def pytest_report_teststatus(
         self,
         report: pytest.TestReport,
@@ -309,6 +438,12 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
         :param session: The pytest session object.
         """
         yield
+        # Postprocessing is done once by the controller, which sees the tests of every worker
+        if self.worker:
+            return
+        # A streamed run is written in full first, so that postprocessing can read its coverage from the coverage store
+        if self.writer is not None and self.writer.ident is not None:
+            self.writer.flush()
         for ff in filter(lambda ff: not ff.run_live, self.flakefighters):
             ff.flaky_tests_post(self.run)
         for test in self.run.tests:
@@ -318,7 +453,7 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
                 }
                 self.test_reports[test.name].flaky = test.flaky
         if self.sffl:
-            self.sffl.rank(self.run.tests)
+            self.sffl.rank(self.run.tests, self.database.load_run_coverage(self.run), self.run.collection_coverage)
 
     @pytest.hookimpl(optionalhook=True)
     def pytest_json_modifyreport(self, json_report: dict):
@@ -336,7 +471,7 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
                 ].flakefighter_results
             }
 
-    def build_outcome_string(self, test: Test) -> str:
+    def build_outcome_string(self, test: Union[Test, TestView]) -> str:
         """
         Construct a string to represent previous flakefighter outcomes for a given test and its associated executions.
 
@@ -458,13 +593,27 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
         :param session: The pytest session object.
         :param exitstatus: The status which pytest will return to the system.
         """
+        if self.worker:
+            session.config.workeroutput[WORKER_OUTPUT_KEY] = pack_worker_output(
+                self.run.collection_coverage, self.run.tests
+            )
+            if self.continuous_coverage:
+                self.cov.stop()
+            self.database.close()
+            return
 
         if session.config.option.xmlpath:
             self.modify_xml(session.config.option.xmlpath)
 
+        # A streamed run is already in the database, so must be told apart from the previous runs
+        streamed_run_id = None
+        if self.writer is not None and self.writer.ident is not None:
+            self.writer.finish()
+            streamed_run_id = self.writer.run_id
+
         runs = [self.run]
-        if self.display_outcomes:
-            runs += self.database.load_runs(self.display_outcomes)
+        if self.display_history is not None:
+            runs += [run for run in self.display_history.result() if run.id != streamed_run_id][: self.display_outcomes]
         if self.display_verdicts or self.display_outcomes:
             for run in runs:
                 for test in run.tests:
@@ -476,7 +625,7 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
                             )
                         )
 
-        genuine_failure_observed = any(
+        genuine_failure_observed = self.released_genuine_failure or any(
             not test.flaky
             for test in self.run.tests
             if any(e.outcome != "passed" for e in test.executions)
@@ -489,6 +638,10 @@ class FlakeFighterPlugin:  # pylint: disable=R0902
         ):
             session.exitstatus = pytest.ExitCode.OK
 
-        if self.save_run:
+        if self.continuous_coverage and not self.controller:
+            self.cov.stop()
+
+        if self.save_run and streamed_run_id is None:
+            self.record_flakefighters()
             self.database.save(self.run)
         self.database.close()
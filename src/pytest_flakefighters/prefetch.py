@@ -0,0 +1,34 @@
+"""
+This module implements prefetching of slow startup work, such as loading history from the database and diffing the
+repository, in background threads. The work starts while pytest configures itself, and overlaps with test collection and
+the first tests, so that only consumers that need the results before they are ready have to wait for them.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# The startup work is mostly waiting on the database and git, so only a few threads are needed
+EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="flakefighters-prefetch")
+
+
+def prefetch(function: Callable[..., T], *args, **kwargs) -> "Future[T]":
+    """
+    Start calling a function in a background thread.
+    :param function: The function.
+    :param args: The positional arguments of the function.
+    :param kwargs: The keyword arguments of the function.
+    :returns: The future result of the function, which blocks until it is ready and re-raises any exception.
+    """
+    return EXECUTOR.submit(function, *args, **kwargs)
+
+
+def resolved(value: T) -> "Future[T]":
+    """
+    Wrap a value that is already known as a future, so that it can be used in place of a prefetched one.
+    :param value: The value.
+    """
+    future = Future()
+    future.set_result(value)
+    return future
@@ -3,12 +3,13 @@ This module implements the various supported test rerun strategies.
 """
 
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
 
 import pytest
-from sqlalchemy import select
-from sqlalchemy.orm import Session
 
-from pytest_flakefighters.database_management import Database, Test
+# The strategies are listed in the configuration options, so are imported even if the plugin is not enabled
+if TYPE_CHECKING:
+    from pytest_flakefighters.database_management import Database
 
 
 class RerunStrategy(ABC):
@@ -72,18 +73,23 @@ class PreviouslyFlaky(FlakyFailure):
     Rerun failed tests marked as flaky and tests previously marked as flaky.
     """
 
-    def __init__(self, reruns: int, database: Database):
+    def __init__(self, reruns: int, database: "Database"):
+        # pylint: disable=C0415
+        from sqlalchemy import select
+        from sqlalchemy.orm import Session
+
+        from pytest_flakefighters.database_management import TestSummary
+
         super().__init__(reruns)
         with Session(database.engine) as session:
-            tests = session.scalars(select(Test)).all()
-            self.previously_flaky = list(filter(lambda t: t.flaky, tests))
+            self.previously_flaky = set(session.scalars(select(TestSummary.name).where(TestSummary.flaky_runs > 0)))
 
     def rerun(self, report: pytest.TestReport) -> bool:
         """
         :return: Boolean true if a test is a flaky failure or has previously been marked as flaky and has the same name
             as the current test.
         """
-        return super().rerun(report) or any(test.name == report.nodeid for test in self.previously_flaky)
+        return super().rerun(report) or report.nodeid in self.previously_flaky
 
     @classmethod
     def help(cls):
@@ -0,0 +1,224 @@
+"""
+This module implements the ResultWriter class to stream test results into the database while the test suite runs.
+"""
+
+import threading
+import time
+from queue import Empty, Queue
+
+from sqlalchemy import update
+
+from pytest_flakefighters.bulk_insert import (
+    TestRecord,
+    assign_ids,
+    insert_results,
+    insert_run,
+    insert_tests,
+    result_row,
+    snapshot_run,
+    snapshot_test,
+)
+from pytest_flakefighters.database_management import (
+    Database,
+    Run,
+    Test,
+    summarise_test,
+    update_test_summaries,
+    with_retries,
+)
+
+# The maximum number of tests to insert in a single transaction
+BATCH_SIZE = 100
+# The maximum time in seconds to wait for a batch to fill up before inserting it
+FLUSH_INTERVAL = 1.0
+# The maximum number of finished tests waiting to be inserted before the test suite blocks until the writer catches up
+MAX_QUEUED = 1000
+
+
+class ResultWriter(threading.Thread):  # pylint: disable=R0902
+    """
+    Background thread which inserts each test into the database as soon as it has finished, in batches, so that the
+    results of the session so far survive if the process dies and do not all have to be written at the end.
+    Tests are snapshotted into plain records before they are queued, so the writer never touches ORM objects owned by
+    the main thread.
+    Flakefighter results that are added to a test after it has been written (i.e. by postprocessing flakefighters) are
+    inserted when the writer is finished, along with the running summaries of the tests.
+    If the database has a coverage store, the coverage of each batch is written to it as a matrix of its own as soon as
+    the batch is inserted, and these are concatenated into the matrix of the run when the writer is flushed, so the
+    coverage of released tests is not kept in memory until then either.
+
+    :ivar database: The database to write to.
+    :ivar run_id: The ID of the run being written, once it has been inserted.
+    :ivar error: The exception raised while writing, if any. This is re-raised when the writer is finished.
+    :ivar batch_size: The maximum number of tests to insert in a single transaction.
+    :ivar flush_interval: The maximum time in seconds to wait for a batch to fill up before inserting it. Committing
+                          every test as soon as it finishes would make the writer slower than the tests themselves.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_queued: int = MAX_QUEUED,
+    ):
+        super().__init__(name="flakefighters-result-writer", daemon=True)
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.run_id: int = None
+        self.error: Exception = None
+        self._queue: Queue = Queue(maxsize=max_queued)
+        self._flushed = False
+        self._run: Run = None
+        self._run_rows = None
+        self._written: list[tuple[Test, TestRecord]] = []
+        self._released_summaries: list[dict] = []
+        self._coverage_batches: list[str] = []
+
+    def start_run(self, run: Run):
+        """
+        Start writing the given run. Its tests are written as they are submitted.
+        :param run: The run to write.
+        """
+        self._run = run
+        self._run_rows = snapshot_run(run)
+        self.start()
+
+    def submit(self, test: Test, release: bool = False):
+        """
+        Queue a finished test to be written, blocking if too many tests are already waiting.
+        :param test: The test to write.
+        :param release: Whether the caller is releasing the test, in which case results added to it later are not saved.
+        """
+        record = snapshot_test(test)
+        if release:
+            self._released_summaries.append(summarise_test(test))
+        else:
+            self._written.append((test, record))
+        self._queue.put(record)
+
+    def run(self):
+        """
+        Insert the run, then insert the submitted tests in batches until the writer is closed.
+        Once an error occurs, submitted tests are discarded so that the test suite is never blocked.
+        """
+        try:
+            self.run_id = with_retries(self.insert_run, self.database.retries)
+        except Exception as e:  # pylint: disable=W0718
+            self.error = e
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            if records and self.error is None:
+                try:
+                    with_retries(lambda: self.insert_batch(records), self.database.retries)
+                except Exception as e:  # pylint: disable=W0718
+                    self.error = e
+            if batch[-1] is None:
+                return
+
+    def insert_run(self) -> int:
+        """
+        Insert the run without its tests.
+        :returns: The ID of the run.
+        """
+        with self.database.begin_write() as connection:
+            return insert_run(connection, *self._run_rows)
+
+    def insert_batch(self, records: list[TestRecord]):
+        """
+        Insert a batch of tests in a single transaction.
+        :param records: The snapshots of the tests.
+        """
+        with self.database.begin_write() as connection:
+            insert_tests(connection, self.run_id, records, self.database.coverage_index, self.database.coverage_deltas)
+        if self.database.coverage_store is not None:
+            executions = [execution for record in records for execution in record.executions]
+            self._coverage_batches.append(
+                self.database.coverage_store.write(
+                    [execution.id for execution in executions], [execution.coverage for execution in executions]
+                )
+            )
+
+    def flush(self):
+        """
+        Wait for all submitted tests to be written, then write the coverage matrix of the run to the coverage store and
+        give the run and its written tests and executions their IDs, so that postprocessing flakefighters can read the
+        matrix. Any error is raised when the writer is finished.
+        """
+        if self._flushed:
+            return
+        self._flushed = True
+        self._queue.put(None)
+        self.join()
+        if self.database.coverage_store is not None:
+            try:
+                if self.error is None:
+                    with_retries(self.store_coverage_matrix, self.database.retries)
+            except Exception as e:  # pylint: disable=W0718
+                self.error = e
+            finally:
+                for name in self._coverage_batches:
+                    self.database.coverage_store.remove(name)
+        if self.error is not None:
+            return
+        self._run.id = self.run_id
+        for test, record in self._written:
+            assign_ids(test, record)
+
+    def finish(self):
+        """
+        Wait for all submitted tests to be written, if they have not been already, then write any flakefighter results
+        that were added to them since they were submitted, update the test summaries, and prune old runs.
+        """
+        self.flush()
+        if self.error is not None:
+            raise self.error
+        with_retries(self.insert_late_results, self.database.retries)
+        with_retries(self.database.prune, self.database.retries, rollback=self.database.session.rollback)
+
+    def store_coverage_matrix(self):
+        """
+        Concatenate the coverage matrices of the written batches into the matrix of the run, and refer to it from the
+        run.
+        """
+        name = self.database.coverage_store.merge(self._coverage_batches)
+        try:
+            with self.database.begin_write() as connection:
+                connection.execute(update(Run).where(Run.id == self.run_id).values(coverage_matrix=name))
+        except Exception:
+            self.database.coverage_store.remove(name)
+            raise
+
+    def insert_late_results(self):
+        """
+        Insert the flakefighter results that were added to the written tests since they were submitted, and update the
+        test summaries.
+        """
+        with self.database.begin_write() as connection:
+            insert_results(
+                connection,
+                [
+                    row | {"test_id": record.id, "test_execution_id": None}
+                    for test, record in self._written
+                    for row in map(result_row, test.flakefighter_results[len(record.results) :])
+                ]
+                + [
+                    row | {"test_id": None, "test_execution_id": execution_record.id}
+                    for test, record in self._written
+                    for execution, execution_record in zip(test.executions, record.executions)
+                    for row in map(result_row, execution.flakefighter_results[len(execution_record.results) :])
+                ],
+            )
+            update_test_summaries(
+                connection,
+                {"id": self.run_id} | self._run_rows[0],
+                self._released_summaries + [summarise_test(test) for test, _ in self._written],
+            )
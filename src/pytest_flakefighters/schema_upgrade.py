@@ -0,0 +1,92 @@
+"""
+This module implements the upgrade of databases created by earlier versions, adding the columns and indexes that have
+since been added to the schema and converting data whose encoding has since changed.
+"""
+
+from sqlalchemy import (
+    Connection,
+    Integer,
+    LargeBinary,
+    bindparam,
+    column,
+    delete,
+    insert,
+    inspect,
+    select,
+    table,
+    text,
+    update,
+)
+from sqlalchemy.engine import Engine
+
+from pytest_flakefighters.coverage_map import PACKED_VERSION
+from pytest_flakefighters.models import (
+    LOOKUP_BATCH_SIZE,
+    PICKLE_PREFIX,
+    Base,
+    CoverageBlob,
+    Run,
+    SchemaVersion,
+    TestExecution,
+    unpack_coverage,
+)
+
+
+def upgrade_schema(engine: Engine):
+    """
+    Add any columns and indexes that have been added to the schema since the database was created.
+    New columns are always nullable, so this is enough to bring databases created by earlier versions up to date.
+    Creating the indexes of a large existing database can take a while, so it may be worth running
+    :code:`flakefighters-db upgrade` as a one-off rather than waiting for the next test session to do it.
+    :param engine: The database engine.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for model_table in Base.metadata.sorted_tables:
+            existing_columns = {model_column["name"] for model_column in inspector.get_columns(model_table.name)}
+            for model_column in model_table.columns:
+                if model_column.name not in existing_columns:
+                    column_type = model_column.type.compile(dialect=engine.dialect)
+                    connection.execute(
+                        text(f"ALTER TABLE {model_table.name} ADD COLUMN {model_column.name} {column_type}")
+                    )
+            existing_indexes = {index["name"] for index in inspector.get_indexes(model_table.name)}
+            for index in model_table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+
+
+def upgrade_coverage(connection: Connection) -> int:
+    """
+    Convert the coverage pickled by earlier versions to the packed encoding, then record that all coverage is packed.
+    The coverage is read and rewritten in batches, without loading the objects it belongs to. Coverage that is already
+    packed is left as it is, so the conversion is safe to repeat if it is interrupted.
+    :param connection: The connection to convert the coverage with, within a transaction.
+    :returns: The number of values that were converted.
+    """
+    converted = 0
+    for model, name in [(Run, "collection_coverage"), (CoverageBlob, "coverage"), (TestExecution, "coverage")]:
+        # Read the raw bytes, rather than through the coverage column type
+        raw = table(model.__tablename__, column("id", Integer), column(name, LargeBinary))
+        last_id = None
+        while True:
+            query = select(raw.c.id, raw.c[name]).where(raw.c[name].is_not(None)).order_by(raw.c.id)
+            if last_id is not None:
+                query = query.where(raw.c.id > last_id)
+            rows = connection.execute(query.limit(LOOKUP_BATCH_SIZE)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            pickled = [
+                {"row_id": row_id, "packed": unpack_coverage(value).pack()}
+                for row_id, value in rows
+                if value[:1] == PICKLE_PREFIX
+            ]
+            if pickled:
+                connection.execute(
+                    update(raw).where(raw.c.id == bindparam("row_id")).values({name: bindparam("packed")}), pickled
+                )
+                converted += len(pickled)
+    connection.execute(delete(SchemaVersion).where(SchemaVersion.name == "coverage"))
+    connection.execute(insert(SchemaVersion).values(name="coverage", version=PACKED_VERSION))
+    return converted
@@ -5,29 +5,35 @@ suspiciousness score of code statements based on how likely they are to be the c
 
 from collections import defaultdict
 from math import sqrt
+from typing import Union
 
-import pandas as pd
+import numpy as np
 
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.coverage_store import CoverageMatrix
 from pytest_flakefighters.database_management import Test
 
 
-def total_coverage(root: str, test: Test) -> dict[str, set[int]]:
+def total_coverage(root: str, test: Test) -> CoverageMap:
     """
-    Merge lines covered by all test executions into a single dictionary.
+    Merge lines covered by all test executions into a single coverage map.
+    For flaky tests, only the lines of each file that are covered by every execution that covers the file are kept.
     :param root: The root directory of the repo.
     :param test: The test to be processed.
-    :returns: Dictionary mapping filename to lines covered.
+    :returns: The lines covered in each file under the root.
     """
-    coverage = {}
-    reduce = set.intersection if test.flaky else set.union
-    for execution in test.executions:
-        for file, lines in execution.coverage.items():
-            if file.startswith(root):
-                coverage[file] = coverage.get(file, []) + [set(lines)]
-    return {file: reduce(*lines) for file, lines in coverage.items()}
+    coverages = [execution.full_coverage.filter(lambda file: file.startswith(root)) for execution in test.executions]
+    if not test.flaky:
+        return CoverageMap.union(*coverages)
+    return CoverageMap(
+        {
+            file: set.intersection(*(set(coverage[file]) for coverage in coverages if file in coverage))
+            for file in CoverageMap.union(*coverages)
+        }
+    )
 
 
-def update_covered(covered: dict[tuple[str, int], int], coverage: dict[str, list[int]]):
+def update_covered(covered: dict[tuple[str, int], int], coverage: CoverageMap):
     """
     Update the counts of lines covered by flaky/stable tests.
     :param covered: Dictionary mapping (filename, line) to number of tests covered.
@@ -55,6 +61,39 @@ def safe_div(x: float, y: float) -> float:
     return x / y
 
 
+def covered_columns(tests: list[Test], coverage: CoverageMatrix) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the columns of a coverage matrix that each test covers.
+    :param tests: The tests.
+    :param coverage: The coverage matrix, with one row per execution of the tests in order.
+    :returns: The test and column of each pair of a test and a column it covers, and the number of executions of the
+              test that cover the column.
+    """
+    columns = max(len(coverage.column_lines), 1)
+    row_tests = np.repeat(np.arange(len(tests)), [len(test.executions) for test in tests])
+    entry_tests = np.repeat(row_tests, np.diff(coverage.indptr))
+    keys, counts = np.unique(entry_tests * columns + coverage.indices.astype(np.int64), return_counts=True)
+    return *np.divmod(keys, columns), counts
+
+
+def covering_executions(tests: list[Test], coverage: CoverageMatrix, test_columns: tuple[np.ndarray, np.ndarray]):
+    """
+    Count the executions of each test that cover any line of the file of each column.
+    :param tests: The tests.
+    :param coverage: The coverage matrix, with one row per execution of the tests in order.
+    :param test_columns: The test and column of each pair to count, as returned by :code:`covered_columns`.
+    :returns: The number of executions of the test of each pair that cover the file of its column.
+    """
+    files = max(len(coverage.paths), 1)
+    row_tests = np.repeat(np.arange(len(tests)), [len(test.executions) for test in tests])
+    rows = np.repeat(np.arange(len(row_tests)), np.diff(coverage.indptr))
+    # Each execution covers a file once, however many of its lines it covers
+    row_files = np.unique(rows * files + coverage.column_files[coverage.indices].astype(np.int64))
+    keys, counts = np.unique(row_tests[row_files // files] * files + row_files % files, return_counts=True)
+    key_tests, key_columns = test_columns
+    return counts[np.searchsorted(keys, key_tests * files + coverage.column_files[key_columns].astype(np.int64))]
+
+
 class SFFL:  # pylint: disable=R0902
     """
     This class implements Spectrum-based Flaky Fault Localization ranking.
@@ -124,25 +163,122 @@ class SFFL:  # pylint: disable=R0902
         """
         return self.flaky[s] - safe_div(self.stable[s], self.total_stable + 1)
 
-    def rank(self, tests: list[Test]):
+    def count_coverage(self, tests: list[Test]) -> list[tuple[str, int]]:
         """
-        Calculate the supiciousness score of each code statement and rank them most to least suspicious.
+        Count the flaky and stable tests that cover each code statement, from the coverage of each test execution.
         :param tests: The test suite.
+        :returns: The statements to rank.
         """
-        all_covered_lines = {}
+        all_covered_lines = CoverageMap()
         for test in tests:
-            for execution in test.executions:
-                for file, lines in execution.coverage.items():
-                    if file.startswith(self.root) and (self.include_test_code or file != test.fspath):
-                        all_covered_lines[file] = set.union(all_covered_lines.get(file, set()), lines)
+            all_covered_lines |= CoverageMap.union(
+                *(
+                    execution.full_coverage.filter(
+                        lambda file, test=test: file.startswith(self.root)
+                        and (self.include_test_code or file != test.fspath)
+                    )
+                    for execution in test.executions
+                )
+            )
             if test.flaky:
                 self.total_flaky += 1
                 update_covered(self.flaky, total_coverage(self.root, test))
             else:
                 self.total_stable += 1
                 update_covered(self.stable, total_coverage(self.root, test))
+        return [(file, line) for file, lines in all_covered_lines.items() for line in lines]
+
+    def count_matrix(
+        self, tests: list[Test], coverage: CoverageMatrix, collection_coverage: Union[CoverageMap, None]
+    ) -> list[tuple[str, int]]:
+        """
+        Count the flaky and stable tests that cover each code statement, from a coverage matrix of the test executions,
+        without decoding the coverage of each execution.
+        :param tests: The test suite.
+        :param coverage: The coverage matrix, with one row per execution of the tests in order.
+        :param collection_coverage: The lines covered while collecting the tests, which every execution also covers.
+        :returns: The statements to rank.
+        """
+        common = CoverageMap()
+        if collection_coverage:
+            common = collection_coverage.filter(lambda file: file.startswith(self.root))
+        self.total_flaky += sum(bool(test.flaky) for test in tests)
+        self.total_stable += sum(not test.flaky for test in tests)
+        return sorted(self.count_columns(tests, coverage, common) | self.count_common(tests, common))
+
+    def count_columns(self, tests: list[Test], coverage: CoverageMatrix, common: CoverageMap) -> set[tuple[str, int]]:
+        """
+        Count the flaky and stable tests that cover each column of a coverage matrix.
+        :param tests: The test suite.
+        :param coverage: The coverage matrix, with one row per execution of the tests in order.
+        :param common: The lines covered by every execution under the root directory, which are counted by
+                       :code:`count_common` instead.
+        :returns: The statements to rank.
+        """
+        flaky = np.array([test.flaky for test in tests], dtype=bool)
+        key_tests, key_columns, covering = covered_columns(tests, coverage)
+        column_paths = coverage.paths[coverage.column_files]
+        statements = list(zip(column_paths.tolist(), coverage.column_lines.tolist()))
+        counted = np.char.startswith(column_paths, self.root)[key_columns]
+        listed = counted & (
+            self.include_test_code
+            | (column_paths[key_columns] != np.array([test.fspath or "" for test in tests], dtype=str)[key_tests])
+        )
+        counted &= ~np.isin(coverage.statement_keys(), common.statement_keys())[key_columns]
+        # Flaky tests only count the lines covered by every one of their executions that covers the file, which is every
+        # execution for the files that are covered while collecting the tests
+        executions = np.where(
+            np.isin(column_paths, np.array(list(common), dtype=str))[key_columns],
+            np.array([len(test.executions) for test in tests], dtype=np.int64)[key_tests],
+            covering_executions(tests, coverage, (key_tests, key_columns)),
+        )
+        for column in key_columns[counted & flaky[key_tests] & (covering == executions)].tolist():
+            self.flaky[statements[column]] += 1
+        for column in key_columns[counted & ~flaky[key_tests]].tolist():
+            self.stable[statements[column]] += 1
+        return {statements[column] for column in key_columns[listed].tolist()}
+
+    def count_common(self, tests: list[Test], common: CoverageMap) -> set[tuple[str, int]]:
+        """
+        Count the flaky and stable tests that cover each code statement covered by every execution, i.e. while
+        collecting the tests.
+        :param tests: The test suite.
+        :param common: The lines covered by every execution under the root directory.
+        :returns: The statements to rank.
+        """
+        run = [test for test in tests if test.executions]
+        ranked = set()
+        for file, lines in common.items():
+            for line in lines:
+                self.flaky[(file, line)] += sum(bool(test.flaky) for test in run)
+                self.stable[(file, line)] += sum(not test.flaky for test in run)
+            if run and (self.include_test_code or any(test.fspath != file for test in run)):
+                ranked.update((file, line) for line in lines)
+        return ranked
+
+    def rank(
+        self,
+        tests: list[Test],
+        coverage: CoverageMatrix = None,
+        collection_coverage: Union[CoverageMap, None] = None,
+    ):
+        """
+        Calculate the supiciousness score of each code statement and rank them most to least suspicious.
+        :param tests: The test suite.
+        :param coverage: The coverage matrix of the test executions, with one row per execution of the tests in order
+                         and without collection coverage, e.g. read from the coverage store. If not given, the coverage
+                         of each execution is read instead.
+        :param collection_coverage: The lines covered while collecting the tests, which are added to every row of the
+                                    coverage matrix.
+        """
+        if coverage is None:
+            statements = self.count_coverage(tests)
+        else:
+            statements = self.count_matrix(tests, coverage, collection_coverage)
+
+        import pandas as pd  # pylint: disable=C0415
 
-        flat = [(file, line, self.metric((file, line))) for file, lines in all_covered_lines.items() for line in lines]
+        flat = [(file, line, self.metric((file, line))) for file, line in statements]
         pd.DataFrame(flat, columns=["file", "line", "suspiciousness"]).sort_values(
             ["suspiciousness", "line", "file"], ascending=[False, True, True]
         ).reset_index(drop=True).to_csv(self.output_file)
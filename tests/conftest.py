@@ -5,17 +5,84 @@ Define fixtures and plugins.
 import os
 import shutil
 import sqlite3
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import git
 import pytest
 
+from pytest_flakefighters.database_management import (
+    FlakefighterResult,
+    Run,
+    Test,
+    TestException,
+    TestExecution,
+    TracebackEntry,
+)
+
 # pylint:disable=C0103
 pytest_plugins = "pytester"
 CURRENT_DIR = Path(__file__).parent
 collect_ignore = ["resources"]
 
 
+def make_execution(
+    outcome: str = "passed",
+    coverage: dict = None,
+    exception: bool = False,
+    verdicts: dict[str, bool] = None,
+    duration: int = None,
+) -> TestExecution:
+    """
+    Create a test execution.
+    :param outcome: The outcome of the execution.
+    :param coverage: The lines covered by the execution.
+    :param exception: Whether the execution raised an exception with a traceback.
+    :param verdicts: The execution-level flakefighter results, as whether each flakefighter found it flaky.
+    :param duration: The duration of the execution in seconds, starting on 1st January 2025, if it was timed.
+    """
+    execution = TestExecution(  # pylint: disable=E1123
+        outcome=outcome,
+        coverage=coverage,
+        flakefighter_results=[FlakefighterResult(name=name, flaky=flaky) for name, flaky in (verdicts or {}).items()],
+    )
+    if duration is not None:
+        execution.start_time = datetime(2025, 1, 1)
+        execution.end_time = execution.start_time + timedelta(seconds=duration)
+    if exception:
+        execution.exception = TestException(  # pylint: disable=E1123
+            name="AssertionError", traceback=[TracebackEntry(path="file1", lineno=2, statement="assert False")]
+        )
+    return execution
+
+
+def make_test(
+    name: str = "test", executions: list[TestExecution] = None, verdicts: dict[str, bool] = None, **kwargs
+) -> Test:
+    """
+    Create a test.
+    :param name: The name of the test.
+    :param executions: The executions of the test. Defaults to a single passing execution.
+    :param verdicts: The test-level flakefighter results, as whether each flakefighter found it flaky.
+    :param kwargs: Any other attributes of the test, e.g. its fspath.
+    """
+    return Test(  # pylint: disable=E1123
+        name=name,
+        executions=[make_execution()] if executions is None else executions,
+        flakefighter_results=[FlakefighterResult(name=name, flaky=flaky) for name, flaky in (verdicts or {}).items()],
+        **kwargs,
+    )
+
+
+def make_run(tests: list[Test] = None, **kwargs) -> Run:
+    """
+    Create a run.
+    :param tests: The tests of the run.
+    :param kwargs: Any other attributes of the run, e.g. its start time. The root defaults to the current directory.
+    """
+    return Run(**{"root": "."} | kwargs, tests=tests or [])  # pylint: disable=E1123
+
+
 @pytest.fixture(autouse=True)
 def _close_leaked_sqlite_connections(monkeypatch):
     """
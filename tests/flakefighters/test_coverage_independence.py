@@ -2,9 +2,17 @@
 This module tests the CoverageIndependence flakefighter.
 """
 
+import os
+from tempfile import TemporaryDirectory
+
+import numpy as np
 import pytest
+from scipy.spatial.distance import pdist
 
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.coverage_store import CoverageMatrix
 from pytest_flakefighters.database_management import (
+    Database,
     FlakefighterResult,
     Run,
     Test,
@@ -12,7 +20,9 @@ from pytest_flakefighters.database_management import (
 )
 from pytest_flakefighters.flakefighters.coverage_independence import (
     CoverageIndependence,
+    pairwise_distances,
 )
+from pytest_flakefighters.result_writer import ResultWriter
 
 
 def test_from_config_params():
@@ -124,3 +134,55 @@ def test_flaky_tests_post_single_execution():
     coverage_independence = CoverageIndependence()
     coverage_independence.flaky_tests_post(run)
     assert all(t.flakefighter_results == [] for t in run.tests)
+
+
+@pytest.mark.parametrize("metric", ["jaccard", "hamming"])
+def test_pairwise_distances(metric):
+    """
+    Test that the distances between executions are those of their full coverage, without it being built.
+    """
+    coverage = [CoverageMap({"file1.py": [1, 2], "file2.py": [3]}), None, CoverageMap({"file1.py": [2, 5]}), {}]
+    collection_coverage = CoverageMap({"file1.py": [1, 9]})
+    full_coverage = [collection_coverage | CoverageMap(lines) if lines is not None else None for lines in coverage]
+    assert (
+        pairwise_distances(
+            CoverageMatrix.from_coverage([CoverageMap(lines) if lines is not None else None for lines in coverage]),
+            np.array([lines is not None for lines in coverage]),
+            collection_coverage,
+            metric,
+        )
+        == pdist(CoverageMatrix.from_coverage(full_coverage).to_dense(), metric=metric)
+    ).all()
+
+
+def test_flaky_tests_post_coverage_store(monkeypatch):
+    """
+    Test that flaky_tests_post reads the coverage of a streamed run from the coverage store.
+    """
+
+    def from_coverage(*_):
+        raise AssertionError("The coverage matrix should be read from the store")
+
+    run = Run(  # pylint: disable=E1123
+        root=".",
+        collection_coverage={"conftest.py": [1]},
+        tests=[
+            Test(  # pylint: disable=E1123
+                name=f"Test{i}",
+                executions=[TestExecution(outcome=outcome, coverage={"file1.py": [1, 2, 3, 6, 7]})],
+            )
+            for i, outcome in enumerate(["passed", "failed"])
+        ],
+    )
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db", coverage_store_dir=os.path.join(tempdir, "coverage")) as db:
+            writer = ResultWriter(db)
+            writer.start_run(run)
+            for test in run.tests:
+                writer.submit(test)
+            writer.flush()
+            monkeypatch.setattr(CoverageMatrix, "from_coverage", from_coverage)
+            CoverageIndependence(database=db).flaky_tests_post(run)
+            monkeypatch.undo()
+            writer.finish()
+            assert all(test.flaky for test in db.load_runs()[0].tests)
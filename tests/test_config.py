@@ -3,9 +3,12 @@ This module contains tests for the configuration setup.
 """
 
 import os
+import subprocess
+import sys
 
 from pytest_flakefighters.flakefighters.traceback_matching import CosineSimilarity
 from pytest_flakefighters.main import pytest_configure
+from pytest_flakefighters.null_coverage import NullCoverage
 
 
 def test_flakefighters(pytester, diff_cov_repo):
@@ -35,6 +38,26 @@ def test_no_flakefighters(pytester, diff_cov_repo):
     assert plugin is None
 
 
+def test_no_flakefighters_lazy_imports():
+    """
+    Test that loading the plugin entry point does not import any heavy dependencies, since this happens in every pytest
+    session with the plugin installed, even if it is not enabled.
+    See benchmarks/import_time.py for the time this takes.
+    """
+    heavy = ["coverage", "git", "numpy", "pandas", "scipy", "sklearn", "sqlalchemy", "unidiff", "yaml"]
+    imported = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, pytest_flakefighters.main; print(*sorted(set({heavy}) & set(sys.modules)))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    assert imported == []
+
+
 def test_active_flakefighters_cmd(pytester, flaky_reruns_repo):
     """
     Test that only the specified active flakefighters are activated.
@@ -152,3 +175,53 @@ def test_active_flakefighters_active_cmd(pytester, flaky_reruns_repo):
     assert [f.params() for f in plugin.flakefighters] == [
         {"run_live": False, "root": flaky_reruns_repo.working_dir, "threshold": 1}
     ]
+
+
+def test_coverage_scope_diff_cov(pytester, diff_cov_repo):
+    """
+    Test that coverage measurement is restricted to the changed files when DiffCov is the only coverage consumer.
+    """
+    config = pytester.parseconfig(
+        os.path.join(diff_cov_repo.working_dir, "app.py"),
+        "--flakefighters",
+        "--active-flakefighters",
+        "DiffCov",
+        "TracebackMatching",
+    )
+    pytest_configure(config)
+
+    plugin = config.pluginmanager.get_plugin("flakefighter_plugin")
+    assert plugin.cov().config.run_include == [os.path.join(diff_cov_repo.working_dir, "app.py")]
+
+
+def test_coverage_scope_sffl(pytester, diff_cov_repo):
+    """
+    Test that every file under the root is measured when SFFL is active.
+    """
+    config = pytester.parseconfig(
+        os.path.join(diff_cov_repo.working_dir, "app.py"),
+        "--flakefighters",
+        "--active-flakefighters",
+        "DiffCov",
+        "--sffl",
+    )
+    pytest_configure(config)
+
+    plugin = config.pluginmanager.get_plugin("flakefighter_plugin")
+    assert plugin.cov().config.run_include == [os.path.join(diff_cov_repo.working_dir, "*")]
+
+
+def test_coverage_scope_no_consumers(pytester, flaky_reruns_repo):
+    """
+    Test that coverage is not measured when no active flakefighter needs it.
+    """
+    config = pytester.parseconfig(
+        os.path.join(flaky_reruns_repo.working_dir, "flaky_reruns.py"),
+        "--flakefighters",
+        "--active-flakefighters",
+        "TracebackMatching",
+    )
+    pytest_configure(config)
+
+    plugin = config.pluginmanager.get_plugin("flakefighter_plugin")
+    assert isinstance(plugin.cov(), NullCoverage)
@@ -0,0 +1,108 @@
+"""
+This module implements tests for the CoverageMap class.
+"""
+
+import pickle
+
+import pytest
+
+from pytest_flakefighters.coverage_map import (
+    FILES,
+    PACKED_VERSION,
+    PACKED_ZLIB,
+    CoverageMap,
+)
+
+
+def test_construction():
+    """
+    Test that lines are deduplicated and sorted, and that files with no covered lines are dropped.
+    """
+    coverage = CoverageMap({"file1": [3, 1, 3], "file2": []})
+    assert list(coverage) == ["file1"]
+    assert list(coverage["file1"]) == [1, 3]
+    assert coverage == {"file1": [1, 3]}
+    with pytest.raises(KeyError):
+        coverage["file2"]  # pylint: disable=W0104
+
+
+def test_files_interned():
+    """
+    Test that each file path is only stored once, however many maps cover it.
+    """
+    CoverageMap({"interned_file": [1]})
+    CoverageMap({"interned_file": [2]})
+    assert FILES.paths.count("interned_file") == 1
+
+
+def test_union_intersection():
+    """
+    Test the union, intersection, and difference of coverage maps.
+    """
+    coverage1 = CoverageMap({"file1": [3, 1], "file2": [5]})
+    coverage2 = CoverageMap({"file1": [2, 3]})
+    assert coverage1 | coverage2 == {"file1": [1, 2, 3], "file2": [5]}
+    assert coverage1 & coverage2 == {"file1": [3]}
+    assert coverage1 - coverage2 == {"file1": [1], "file2": [5]}
+    assert coverage2 - coverage1 == {"file1": [2]}
+    assert CoverageMap.union(coverage1, coverage2, CoverageMap({"file3": [1]})) == {
+        "file1": [1, 2, 3],
+        "file2": [5],
+        "file3": [1],
+    }
+    assert CoverageMap.intersection(coverage1, coverage2, CoverageMap({"file1": [1]})) == {}
+    assert CoverageMap.intersection() == {}
+
+
+def test_covers():
+    """
+    Test line membership.
+    """
+    coverage = CoverageMap({"file1": [1, 5, 9]})
+    assert coverage.covers("file1", 5)
+    assert not coverage.covers("file1", 6)
+    assert not coverage.covers("file1", 10)
+    assert not coverage.covers("file2", 1)
+    assert not list(coverage.lines("file2"))
+
+
+def test_filter():
+    """
+    Test that filtering keeps only the files that satisfy the predicate.
+    """
+    coverage = CoverageMap({"src/file1": [1], "test/file2": [2]})
+    assert coverage.filter(lambda file: file.startswith("src")) == {"src/file1": [1]}
+
+
+def test_statements():
+    """
+    Test that statements are (file ID, line) pairs, and the line count is the number of statements.
+    """
+    coverage = CoverageMap({"file1": [1, 2], "file2": [3]})
+    assert list(coverage.statements()) == [(FILES.ids["file1"], 1), (FILES.ids["file1"], 2), (FILES.ids["file2"], 3)]
+    assert coverage.line_count() == 3
+
+
+def test_pickle():
+    """
+    Test that coverage maps survive pickling.
+    """
+    coverage = CoverageMap({"file1": [1, 2, 70000], "file2": [3]})
+    assert pickle.loads(pickle.dumps(coverage)) == coverage
+
+
+def test_pack():
+    """
+    Test that coverage maps survive packing, with and without compression, including lines far apart.
+    """
+    coverage = CoverageMap({"file1": [1, 2, 70000, 2**32 - 1], "file2": [3], "dir/file3": range(0, 10000, 3)})
+    for compress in [None, False, True]:
+        packed = coverage.pack(compress)
+        assert packed[0] == PACKED_VERSION
+        assert CoverageMap.unpack(packed) == coverage
+    assert coverage.pack(True)[1] & PACKED_ZLIB
+    assert not coverage.pack(False)[1] & PACKED_ZLIB
+    assert CoverageMap.unpack(CoverageMap().pack()) == CoverageMap()
+    assert len(CoverageMap({"file1": range(1, 1000)}).pack()) < 1020
+    with pytest.raises(ValueError):
+        CoverageMap.unpack(pickle.dumps(coverage))
@@ -0,0 +1,145 @@
+"""
+This module implements tests for the coverage store.
+"""
+
+import os
+from datetime import datetime
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pytest
+
+from pytest_flakefighters import maintenance
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.coverage_store import CoverageMatrix, CoverageStore
+from pytest_flakefighters.database_management import Database, Run
+from pytest_flakefighters.result_writer import ResultWriter
+
+from .conftest import make_execution, make_run, make_test
+
+COVERAGE = [CoverageMap({"file2": [3, 1], "file1": [2]}), None, CoverageMap({"file1": [2, 5]})]
+
+
+def coverage_run(day: int) -> Run:
+    """
+    Create a run with a test for each coverage map.
+    """
+    return make_run(
+        [make_test(f"test_{i}", [make_execution(coverage=coverage)]) for i, coverage in enumerate(COVERAGE)],
+        start_time=datetime(2025, 1, day),
+    )
+
+
+def test_coverage_matrix():
+    """
+    Test that coverage matrices hold the coverage of each execution, and are memory-mapped once stored.
+    """
+    matrix = CoverageMatrix.from_coverage(COVERAGE, [1, 2, 3])
+    assert matrix.shape == (3, 4)
+    assert sorted(matrix.columns()) == [("file1", 2), ("file1", 5), ("file2", 1), ("file2", 3)]
+    assert matrix.to_dense().sum(axis=1).tolist() == [3, 0, 2]
+    assert (matrix.to_sparse().toarray() == matrix.to_dense()).all()
+    assert [matrix.row(i) for i in range(3)] == [COVERAGE[0], {}, COVERAGE[2]]
+    assert CoverageMatrix.from_coverage([]).shape == (0, 0)
+    taken = matrix.take([2, 0])
+    assert taken.execution_ids.tolist() == [3, 1]
+    assert [taken.row(i) for i in range(2)] == [COVERAGE[2], COVERAGE[0]]
+    assert matrix.take([0, 1, 2]) is matrix
+
+    concatenated = CoverageMatrix.concatenate(
+        [CoverageMatrix.from_coverage(COVERAGE[:2], [1, 2]), CoverageMatrix.from_coverage(COVERAGE[2:], [3])]
+    )
+    assert concatenated.execution_ids.tolist() == [1, 2, 3]
+    assert sorted(concatenated.columns()) == sorted(matrix.columns())
+    assert [concatenated.row(i) for i in range(3)] == [COVERAGE[0], {}, COVERAGE[2]]
+    assert CoverageMatrix.concatenate([]).shape == (0, 0)
+
+    with TemporaryDirectory() as tempdir:
+        store = CoverageStore(tempdir)
+        name = store.write([1, 2, 3], COVERAGE)
+        loaded = store.read(name)
+        assert isinstance(loaded.indices, np.memmap)
+        assert np.shares_memory(loaded.to_sparse().indices, loaded.indices)
+        assert loaded.execution_ids.tolist() == [1, 2, 3]
+        assert (loaded.to_dense() == matrix.to_dense()).all()
+        assert [loaded.row(i) for i in range(3)] == [COVERAGE[0], {}, COVERAGE[2]]
+        store.remove(name)
+        assert os.listdir(tempdir) == []
+
+
+@pytest.mark.parametrize("save", ["bulk", "orm", "stream"])
+def test_saved_coverage_matrices(save):
+    """
+    Test that runs are saved with a coverage matrix, however they are saved, and the matrices of pruned runs are
+    deleted.
+    """
+    with TemporaryDirectory() as tempdir:
+        store_dir = os.path.join(tempdir, "coverage")
+        with Database(f"sqlite:///{tempdir}/test.db", store_max_runs=1, coverage_store_dir=store_dir) as db:
+            for day in [1, 2]:
+                run = coverage_run(day)
+                if save == "stream":
+                    writer = ResultWriter(db)
+                    writer.start_run(Run(root=".", start_time=run.start_time))  # pylint: disable=E1123
+                    for test in run.tests:
+                        writer.submit(test)
+                    writer.finish()
+                else:
+                    db.save(run, bulk=save == "bulk")
+            (run,) = db.load_runs()
+            matrices = db.load_coverage_matrices()
+            assert list(matrices) == [run.id]
+            assert matrices[run.id].execution_ids.tolist() == [test.executions[0].id for test in run.tests]
+            assert [matrices[run.id].row(i) for i in range(3)] == [COVERAGE[0], {}, COVERAGE[2]]
+            assert os.listdir(store_dir) == [run.coverage_matrix]
+
+
+def test_streamed_coverage_batches(monkeypatch):
+    """
+    Test that streamed coverage is written to the store a batch at a time, rather than kept until the run is flushed,
+    and that only the matrix of the run is left once it is.
+    """
+    merged = []
+    merge = CoverageStore.merge
+    monkeypatch.setattr(CoverageStore, "merge", lambda self, names: merged.append(list(names)) or merge(self, names))
+    with TemporaryDirectory() as tempdir:
+        store_dir = os.path.join(tempdir, "coverage")
+        with Database(f"sqlite:///{tempdir}/test.db", coverage_store_dir=store_dir) as db:
+            run = coverage_run(1)
+            writer = ResultWriter(db, batch_size=2)
+            writer.start_run(Run(root=".", start_time=run.start_time))  # pylint: disable=E1123
+            for test in run.tests:
+                writer.submit(test, release=True)
+            writer.finish()
+            assert len(merged) == 1 and len(merged[0]) > 1
+            (saved,) = db.load_runs()
+            assert os.listdir(store_dir) == [saved.coverage_matrix]
+            matrix = db.load_coverage_matrices()[saved.id]
+            assert [matrix.row(i) for i in range(3)] == [COVERAGE[0], {}, COVERAGE[2]]
+
+
+def test_prune_command_coverage_store(capsys):
+    """
+    Test that the prune command deletes the coverage matrices of the pruned runs.
+    """
+    with TemporaryDirectory() as tempdir:
+        store_dir = os.path.join(tempdir, "coverage")
+        with Database(f"sqlite:///{tempdir}/test.db", coverage_store_dir=store_dir) as db:
+            for day in [1, 2]:
+                db.save(coverage_run(day))
+
+        maintenance.main(
+            [
+                "prune",
+                "--database-url",
+                f"sqlite:///{tempdir}/test.db",
+                "--store-max-runs",
+                "1",
+                "--coverage-store",
+                store_dir,
+            ]
+        )
+        assert "Pruned 1 runs" in capsys.readouterr().out
+        with Database(f"sqlite:///{tempdir}/test.db", coverage_store_dir=store_dir) as db:
+            assert os.listdir(store_dir) == [run.coverage_matrix for run in db.load_runs()]
+            assert len(db.load_coverage_matrices()) == 1
@@ -2,13 +2,42 @@
 This module contains tests that are specific to database management.
 """
 
+import multiprocessing
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
 
-from sqlalchemy import select
+import pytest
+from sqlalchemy import MetaData, create_engine, func, inspect, select, text
 from sqlalchemy.orm import Session
 
-from pytest_flakefighters.database_management import Database, Run, Test
+from pytest_flakefighters import bulk_insert, coverage_blobs, maintenance
+from pytest_flakefighters.coverage_blobs import KEYFRAME_INTERVAL
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.database_management import (
+    ActiveFlakeFighter,
+    Base,
+    CoverageBlob,
+    CoveredRange,
+    Database,
+    ExceptionView,
+    ExecutionView,
+    FlakefighterResult,
+    ResultView,
+    Run,
+    Test,
+    TestException,
+    TestExecution,
+    TestSummary,
+    TestView,
+    TracebackEntry,
+    TracebackView,
+    cascades_deletes,
+)
+
+from .conftest import make_execution, make_run, make_test
 
 
 def test_run_saving(pytester, flaky_triangle_repo):
@@ -278,3 +307,685 @@ def test_display_outcomes_verdicts(pytester, flaky_reruns_repo):
     for run in [runs[0]] + runs[3:]:
         assert f"Flakefighter Verdicts {run.start_time}" not in result.stdout.str()
     db.close()
+
+
+def test_coverage_loaded_as_coverage_map():
+    """
+    Test that saved coverage is loaded as a CoverageMap, including coverage saved as a dictionary by earlier versions.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            execution = TestExecution(coverage={"file1": [2, 1]})  # pylint: disable=E1123
+            assert isinstance(execution.coverage, CoverageMap)
+            db.save(Run(root=tempdir, tests=[Test(name="test", executions=[execution])]))  # pylint: disable=E1123
+            with Session(db.engine) as session:
+                session.execute(
+                    text("UPDATE test_execution SET coverage = :coverage, coverage_id = NULL"),
+                    {"coverage": pickle.dumps({"file2": [3]})},
+                )
+                session.commit()
+
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            coverage = db.load_runs()[0].tests[0].executions[0].coverage
+    assert isinstance(coverage, CoverageMap), f"Expected a CoverageMap but got {type(coverage)}"
+    assert coverage == {"file2": [3]}
+
+
+def test_upgrade_coverage():
+    """
+    Test that coverage pickled by earlier versions is packed when the database is next opened, and only then.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            db.save(
+                Run(  # pylint: disable=E1123
+                    root=tempdir,
+                    collection_coverage={"file1": [1]},
+                    tests=[
+                        Test(  # pylint: disable=E1123
+                            name="test",
+                            executions=[TestExecution(coverage={"file1": [2, 3]})],  # pylint: disable=E1123
+                        )
+                    ],
+                )
+            )
+            with db.engine.begin() as connection:
+                connection.execute(text("DELETE FROM schema_version"))
+                connection.execute(
+                    text("UPDATE run SET collection_coverage = :coverage"), {"coverage": pickle.dumps({"file1": [1]})}
+                )
+                connection.execute(
+                    text("UPDATE coverage_blob SET coverage = :coverage"), {"coverage": pickle.dumps({"file1": [2, 3]})}
+                )
+                connection.execute(
+                    text("UPDATE test_execution SET coverage = :coverage, coverage_id = NULL"),
+                    {"coverage": pickle.dumps({"file2": [4]})},
+                )
+
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            with db.engine.connect() as connection:
+                stored = [
+                    connection.scalar(text(f"SELECT {name} FROM {table}"))
+                    for table, name in [
+                        ("run", "collection_coverage"),
+                        ("coverage_blob", "coverage"),
+                        ("test_execution", "coverage"),
+                    ]
+                ]
+            assert [CoverageMap.unpack(value) for value in stored] == [
+                {"file1": [1]},
+                {"file1": [2, 3]},
+                {"file2": [4]},
+            ]
+            (run,) = db.load_runs()
+            assert run.collection_coverage == {"file1": [1]}
+            assert run.tests[0].executions[0].coverage == {"file2": [4]}
+
+
+def test_full_coverage():
+    """
+    Test that the full coverage of an execution includes the collection coverage of its run.
+    """
+    execution = TestExecution(coverage={"file1": [5]})  # pylint: disable=E1123
+    assert execution.full_coverage == {"file1": [5]}
+    Run(  # pylint: disable=E1123
+        collection_coverage={"file1": [1, 2], "file2": [1]}, tests=[Test(name="test", executions=[execution])]
+    )
+    assert execution.full_coverage == {"file1": [1, 2, 5], "file2": [1]}
+    assert execution.coverage == {"file1": [5]}
+
+
+def test_upgrade_schema():
+    """
+    Test that columns and indexes added since a database was created are added when it is next opened.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            with db.engine.begin() as connection:
+                connection.execute(text("ALTER TABLE run DROP COLUMN collection_coverage"))
+                connection.execute(text("DROP INDEX ix_test_run_id"))
+
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            assert "ix_test_run_id" in {index["name"] for index in inspect(db.engine).get_indexes("test")}
+            db.save(Run(root=tempdir, collection_coverage={"file1": [1]}))  # pylint: disable=E1123
+            assert db.load_runs()[0].collection_coverage == {"file1": [1]}
+
+
+def test_upgrade_command(capsys):
+    """
+    Test that the upgrade command adds missing indexes to an existing database.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            with db.engine.begin() as connection:
+                connection.execute(text("DROP INDEX ix_test_execution_test_id"))
+
+        maintenance.main(["upgrade", "--database-url", f"sqlite:///{tempdir}/test.db"])
+        assert "Upgraded" in capsys.readouterr().out
+
+        engine = create_engine(f"sqlite:///{tempdir}/test.db")
+        indexes = {index["name"] for index in inspect(engine).get_indexes("test_execution")}
+        engine.dispose()
+        assert "ix_test_execution_test_id" in indexes
+
+
+def test_coverage_deduplicated():
+    """
+    Test that identical coverage is only stored once, and that it is deleted once no stored execution references it.
+    """
+
+    def run(tempdir, *coverages):
+        executions = [make_execution(coverage=coverage) for coverage in coverages]
+        return make_run([make_test(executions=executions)], root=tempdir, start_time=datetime.now())
+
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db", store_max_runs=2) as db:
+            db.save(run(tempdir, {"file1": [1, 2]}, {"file1": [2, 1]}, {"file2": [1]}))
+            db.save(run(tempdir, {"file1": [1, 2]}))
+            with Session(db.engine) as session:
+                assert session.query(CoverageBlob).count() == 2
+            assert [e.coverage for e in db.load_runs()[-1].tests[0].executions] == [
+                {"file1": [1, 2]},
+                {"file1": [1, 2]},
+                {"file2": [1]},
+            ]
+
+            db.save(run(tempdir, {"file3": [1]}))
+            with Session(db.engine) as session:
+                assert {blob.coverage for blob in session.scalars(select(CoverageBlob))} == {
+                    CoverageMap({"file1": [1, 2]}),
+                    CoverageMap({"file3": [1]}),
+                }
+
+
+def test_coverage_stored_concurrently(monkeypatch):
+    """
+    Test that coverage stored by another session between looking up and inserting it is reused rather than failing on
+    its content hash.
+    """
+    coverage = CoverageMap({"file1": [1, 2]})
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db", coverage_index=True) as db:
+            with db.begin_write() as connection:
+                (existing,) = bulk_insert.store_coverage(connection, {coverage.digest(): coverage}).values()
+            lookups = [{}]
+            stored_coverage_ids = bulk_insert.stored_coverage_ids
+            monkeypatch.setattr(
+                bulk_insert,
+                "stored_coverage_ids",
+                lambda connection, digests: lookups.pop() if lookups else stored_coverage_ids(connection, digests),
+            )
+            with db.begin_write() as connection:
+                assert bulk_insert.store_coverage(connection, {coverage.digest(): coverage}, indexed=True) == {
+                    coverage.digest(): existing
+                }
+            with Session(db.engine) as session:
+                assert session.query(CoverageBlob).count() == 1
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_save(bulk):
+    """
+    Test that runs are saved with all their related objects, whether inserted in bulk or through the ORM.
+    """
+    execution = TestExecution(  # pylint: disable=E1123
+        outcome="failed",
+        coverage={"file1": [1, 2]},
+        exception=TestException(name="AssertionError", traceback=[TracebackEntry(path="file1", lineno=2)]),
+        flakefighter_results=[FlakefighterResult(name="DiffCov", flaky=True)],
+    )
+    run = Run(  # pylint: disable=E1123
+        root=".",
+        start_time=datetime.now(),
+        active_flakefighters=[ActiveFlakeFighter(name="DiffCov", params={"root": "."})],
+        tests=[
+            Test(  # pylint: disable=E1123
+                name="test",
+                line_no=3,
+                executions=[execution],
+                flakefighter_results=[FlakefighterResult(name="CoverageIndependence", flaky=False)],
+            )
+        ],
+    )
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            db.save(run, bulk=bulk)
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            (saved,) = db.load_runs()
+            assert saved.created_at is not None
+            assert [(ff.name, ff.params) for ff in saved.active_flakefighters] == [("DiffCov", {"root": "."})]
+            (test,) = saved.tests
+            assert (test.name, test.line_no, test.skipped) == ("test", 3, False)
+            assert [(r.name, r.flaky) for r in test.flakefighter_results] == [("CoverageIndependence", False)]
+            (saved_execution,) = test.executions
+            assert saved_execution.outcome == "failed"
+            assert saved_execution.coverage == {"file1": [1, 2]}
+            assert saved_execution.exception.name == "AssertionError"
+            assert [entry.lineno for entry in saved_execution.exception.traceback] == [2]
+            assert [(r.name, r.flaky) for r in saved_execution.flakefighter_results] == [("DiffCov", True)]
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_save_ids(bulk):
+    """
+    Test that saving a run gives it, its tests and their executions their IDs, whether inserted in bulk or through the
+    ORM, so that its stored coverage matrix can be loaded.
+    """
+    run = make_run(
+        [make_test(f"test_{i}", [make_execution(coverage={"file1": [i + 1]}) for _ in range(2)]) for i in range(2)]
+    )
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db", coverage_store_dir=os.path.join(tempdir, "coverage")) as db:
+            db.save(run, bulk=bulk)
+            (saved,) = db.load_runs()
+            assert run.id == saved.id
+            assert [test.id for test in run.tests] == [test.id for test in saved.tests]
+            assert [execution.id for test in run.tests for execution in test.executions] == [
+                execution.id for test in saved.tests for execution in test.executions
+            ]
+            matrix = db.load_run_coverage(run)
+            assert [matrix.row(i) for i in range(len(matrix))] == [{"file1": [1]}] * 2 + [{"file1": [2]}] * 2
+
+
+def test_load_history():
+    """
+    Test that history views mirror the saved runs, most recent first, and only include tracebacks when requested.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            for i, outcome in enumerate(["passed", "failed"]):
+                execution = TestExecution(  # pylint: disable=E1123
+                    outcome=outcome,
+                    coverage={"file1": [1, 2]},
+                    flakefighter_results=[FlakefighterResult(name="DiffCov", flaky=outcome == "failed")],
+                )
+                if outcome == "failed":
+                    execution.exception = TestException(  # pylint: disable=E1123
+                        name="AssertionError",
+                        traceback=[TracebackEntry(path="file1", lineno=2, colno=4, statement="assert x", source="")],
+                    )
+                db.save(
+                    Run(  # pylint: disable=E1123
+                        root=tempdir,
+                        start_time=datetime(2025, 1, 1 + i),
+                        commit_sha=f"sha{i}",
+                        tests=[
+                            Test(  # pylint: disable=E1123
+                                name="test",
+                                line_no=3,
+                                executions=[execution],
+                                flakefighter_results=[FlakefighterResult(name="CoverageIndependence", flaky=False)],
+                            )
+                        ],
+                    )
+                )
+
+            failed, passed = db.load_history()
+            assert (failed.start_time, failed.root, failed.commit_sha) == (datetime(2025, 1, 2), tempdir, "sha1")
+            assert failed.tests == [
+                TestView(
+                    name="test",
+                    line_no=3,
+                    executions=[ExecutionView("failed", [ResultView("DiffCov", True)])],
+                    flakefighter_results=[ResultView("CoverageIndependence", False)],
+                )
+            ]
+            assert failed.tests[0].flaky and not passed.tests[0].flaky
+            assert [run.commit_sha for run in db.load_history(limit=1)] == ["sha1"]
+            assert [run.commit_sha for run in db.get_source_runs("sha0")] == ["sha0"]
+
+            failed, passed = db.load_history(tracebacks=True)
+            assert failed.tests[0].executions[0].exception == ExceptionView(
+                "AssertionError", [TracebackView("file1", 2, 4, "assert x")]
+            )
+            assert passed.tests[0].executions[0].exception is None
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_test_summaries(bulk):
+    """
+    Test that the running summary of each test is updated whenever a run is saved.
+    """
+
+    def run(sha, outcomes, verdicts):
+        executions = [make_execution(outcome, duration=2 * (i + 1)) for i, outcome in enumerate(outcomes)]
+        return make_run(
+            [make_test(executions=executions, verdicts=dict(verdicts))], start_time=datetime.now(), commit_sha=sha
+        )
+
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            db.save(run("sha0", ["failed", "passed"], [("DiffCov", True), ("TracebackMatching", False)]), bulk=bulk)
+            db.save(run("sha1", ["passed"], [("DiffCov", False)]), bulk=bulk)
+            with Session(db.engine) as session:
+                (summary,) = session.scalars(select(TestSummary)).all()
+            assert (summary.name, summary.runs, summary.flaky_runs) == ("test", 2, 1)
+            assert (summary.passed_executions, summary.failed_executions) == (2, 1)
+            assert summary.verdicts == {"DiffCov": False, "TracebackMatching": False}
+            assert (summary.last_outcomes, summary.last_commit_sha) == (["passed"], "sha1")
+            assert summary.last_run_id == db.load_runs()[0].id
+            assert summary.mean_duration == pytest.approx(8 / 3)
+            assert db.get_source_outcomes("sha1") == {"test": {"passed"}}
+            assert db.get_source_outcomes("sha0") == {"test": {"failed", "passed"}}
+            assert not db.get_source_outcomes("sha2")
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_test_summaries_pruned(bulk):
+    """
+    Test that the tests of pruned runs are subtracted from the running summaries, so they cover the stored runs.
+    """
+
+    def run(day, tests):
+        return make_run(
+            [
+                make_test(name, [make_execution(outcome)], verdicts={"DiffCov": outcome == "failed"})
+                for name, outcome in tests
+            ],
+            start_time=datetime(2025, 1, day),
+        )
+
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db", store_max_runs=2) as db:
+            db.save(run(3, [("test_a", "passed"), ("test_b", "passed")]), bulk=bulk)
+            # The last run of test_b is the oldest, so it is pruned first
+            db.save(run(1, [("test_b", "failed"), ("test_c", "failed")]), bulk=bulk)
+            db.save(run(2, [("test_a", "failed")]), bulk=bulk)
+            with Session(db.engine) as session:
+                summaries = {summary.name: summary for summary in session.scalars(select(TestSummary))}
+            assert set(summaries) == {"test_a", "test_b"}
+            assert (summaries["test_a"].runs, summaries["test_a"].passed_executions) == (2, 1)
+            assert (summaries["test_a"].failed_executions, summaries["test_a"].flaky_runs) == (1, 1)
+            assert (summaries["test_b"].runs, summaries["test_b"].flaky_runs) == (1, 0)
+            assert summaries["test_b"].last_outcomes == ["passed"]
+            assert summaries["test_b"].verdicts == {"DiffCov": False}
+
+
+def test_test_summaries_rebuilt():
+    """
+    Test that test summaries are built from the stored runs when opening a database which does not have them.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            for outcome in ["failed", "passed"]:
+                db.save(make_run([make_test(executions=[make_execution(outcome)])], start_time=datetime.now()))
+            with db.engine.begin() as connection:
+                connection.execute(text("DROP TABLE test_summary"))
+
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            with Session(db.engine) as session:
+                (summary,) = session.scalars(select(TestSummary)).all()
+            assert (summary.runs, summary.passed_executions, summary.failed_executions) == (2, 1, 1)
+            assert summary.last_outcomes == ["passed"]
+            assert summary.mean_duration is None
+
+
+@pytest.mark.parametrize("cascade", [True, False])
+def test_prune_runs(cascade):
+    """
+    Test that pruning deletes every row related to the pruned runs, whether or not the database cascades deletes.
+    """
+    with TemporaryDirectory() as tempdir:
+        if not cascade:
+            # Create the tables as earlier versions did, without ON DELETE CASCADE
+            metadata = MetaData()
+            for table in Base.metadata.sorted_tables:
+                table.to_metadata(metadata)
+            for table in metadata.sorted_tables:
+                for constraint in table.foreign_key_constraints:
+                    constraint.ondelete = None
+            engine = create_engine(f"sqlite:///{tempdir}/test.db")
+            metadata.create_all(engine)
+            engine.dispose()
+
+        with Database(f"sqlite:///{tempdir}/test.db", store_max_runs=1, coverage_index=True) as db:
+            with db.engine.connect() as connection:
+                assert cascades_deletes(connection) == cascade
+            for i in range(2):
+                execution = TestExecution(  # pylint: disable=E1123
+                    outcome="failed",
+                    coverage={"file1": [i]},
+                    exception=TestException(name="AssertionError", traceback=[TracebackEntry(path="file1")]),
+                    flakefighter_results=[FlakefighterResult(name="DiffCov", flaky=True)],
+                )
+                db.save(
+                    Run(  # pylint: disable=E1123
+                        root=tempdir,
+                        start_time=datetime(2025, 1, 1 + i),
+                        active_flakefighters=[ActiveFlakeFighter(name="DiffCov")],
+                        tests=[
+                            Test(  # pylint: disable=E1123
+                                name="test",
+                                executions=[execution],
+                                flakefighter_results=[FlakefighterResult(name="DiffCov", flaky=True)],
+                            )
+                        ],
+                    )
+                )
+            with db.engine.connect() as connection:
+                for table in Base.metadata.sorted_tables:
+                    if table.name not in ["run", "test_summary"]:
+                        expected = 2 if table.name == "flakefighter_result" else 1
+                        count = connection.execute(select(func.count()).select_from(table)).scalar()
+                        assert count == expected, f"Expected {expected} rows in {table.name} but found {count}"
+            assert [run.start_time for run in db.load_history()] == [datetime(2025, 1, 2)]
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_covering_executions(bulk):
+    """
+    Test that the executions that covered given lines are found the same whether or not the coverage is indexed, and
+    that coverage saved before the index was enabled is indexed once it is.
+    """
+    coverage = [{"file1": [1, 2, 3, 7]}, {"file1": [5], "file2": [1, 2]}, {"file2": [10, 11]}, {"file1": [1, 2, 3, 7]}]
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        with Database(url) as db:
+            for i, lines in enumerate(coverage):
+                db.save(
+                    Run(  # pylint: disable=E1123
+                        root=tempdir,
+                        start_time=datetime(2025, 1, 1 + i),
+                        commit_sha=str(i % 2),
+                        tests=[
+                            Test(  # pylint: disable=E1123
+                                name="test", executions=[TestExecution(coverage=lines)]  # pylint: disable=E1123
+                            )
+                        ],
+                    ),
+                    bulk=bulk,
+                )
+            with db.engine.connect() as connection:
+                assert not connection.scalar(select(func.count()).select_from(CoveredRange))
+
+        queries = [
+            ({"file1": [3]}, [], [1, 4]),
+            ({"file1": [4, 5, 6]}, [], [2]),
+            ({"file2": [2, 3], "file1": [7]}, [], [1, 2, 4]),
+            ({"file2": [12], "file3": [1]}, [], []),
+            ({"file1": [1]}, [Run.commit_sha == "1"], [4]),
+        ]
+        for coverage_index in [False, True]:
+            with Database(url, coverage_index=coverage_index) as db:
+                for lines, criteria, expected in queries:
+                    assert db.covering_executions(CoverageMap(lines), *criteria) == expected
+                with db.engine.connect() as connection:
+                    # The three distinct coverage maps cover five ranges of lines
+                    assert connection.scalar(select(func.count()).select_from(CoveredRange)) == 5 * coverage_index
+
+        with Database(url, coverage_index=True) as db:
+            db.save(
+                Run(  # pylint: disable=E1123
+                    root=tempdir,
+                    tests=[
+                        Test(  # pylint: disable=E1123
+                            name="test", executions=[TestExecution(coverage={"file3": [1]})]  # pylint: disable=E1123
+                        )
+                    ],
+                ),
+                bulk=bulk,
+            )
+            assert db.covering_executions(CoverageMap({"file2": [12], "file3": [1]})) == [5]
+
+
+def test_coverage_index_backfilled_once(monkeypatch):
+    """
+    Test that stored coverage is only read to backfill the coverage index once, even if it has no lines to index, and
+    that coverage saved by sessions without the index is indexed by the next session with it.
+    """
+    loaded = []
+    load_coverage = coverage_blobs.load_coverage
+
+    def recording_load_coverage(connection, coverage_ids):
+        loaded.append(list(coverage_ids))
+        return load_coverage(connection, coverage_ids)
+
+    monkeypatch.setattr(coverage_blobs, "load_coverage", recording_load_coverage)
+
+    def run(coverage: list[dict]) -> Run:
+        return make_run([make_test(f"test_{i}", [make_execution(coverage=lines)]) for i, lines in enumerate(coverage)])
+
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        with Database(url) as db:
+            db.save(run([{}, {"file1": [1, 2]}]))
+        for _ in range(2):
+            with Database(url, coverage_index=True):
+                pass
+        assert loaded == [[1, 2]]
+
+        with Database(url) as db:
+            db.save(run([{"file2": [3]}]))
+        with Database(url, coverage_index=True) as db:
+            assert loaded == [[1, 2], [3]]
+            assert db.covering_executions(CoverageMap({"file2": [3]})) == [3]
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_coverage_deltas(bulk):
+    """
+    Test that coverage stored as deltas is read in full, with keyframes every KEYFRAME_INTERVAL versions, and that the
+    coverage that deltas are based on is kept when pruning.
+    """
+    coverage = [{"file1": list(range(1, 101)) + [200 + i]} for i in range(KEYFRAME_INTERVAL + 2)]
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        with Database(url, coverage_deltas=True) as db:
+            runs = [
+                Run(  # pylint: disable=E1123
+                    root=tempdir,
+                    start_time=datetime(2025, 1, 1 + i),
+                    tests=[
+                        Test(name="test", executions=[TestExecution(coverage=lines)]),  # pylint: disable=E1123
+                        Test(  # pylint: disable=E1123
+                            name="other", executions=[TestExecution(coverage={"file2": [i]})]  # pylint: disable=E1123
+                        ),
+                    ],
+                )
+                for i, lines in enumerate(coverage)
+            ]
+            for run in runs:
+                db.save(run, bulk=bulk)
+            if not bulk:
+                assert [run.tests[0].executions[0].coverage for run in runs] == coverage
+            with db.engine.connect() as connection:
+                depths = connection.execute(
+                    select(CoverageBlob.depth, CoverageBlob.coverage.is_(None))
+                    .join(TestExecution, TestExecution.coverage_id == CoverageBlob.id)
+                    .join(Test, Test.id == TestExecution.test_id)
+                    .where(Test.name == "test")
+                    .order_by(CoverageBlob.id)
+                ).all()
+            assert depths == [(i % KEYFRAME_INTERVAL, i % KEYFRAME_INTERVAL > 0) for i in range(len(coverage))]
+
+        with Database(url, coverage_index=True) as db:
+            runs = db.load_runs()
+            assert [run.tests[0].executions[0].coverage for run in reversed(runs)] == coverage
+            assert db.covering_executions(CoverageMap({"file1": [205]})) == [runs[4].tests[0].executions[0].id]
+
+        with Database(url, store_max_runs=1) as db:
+            db.prune()
+            (run,) = db.load_runs()
+            assert run.tests[0].executions[0].coverage == coverage[-1]
+            assert db.covering_executions(CoverageMap({"file1": [1]})) == [run.tests[0].executions[0].id]
+            with db.engine.connect() as connection:
+                # The last coverage of "test" is based on the keyframe before it, and "other" is stored in full
+                assert connection.scalar(select(func.count()).select_from(CoverageBlob)) == 3
+
+
+def test_prune_command(capsys):
+    """
+    Test that the prune command deletes old runs.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            for i in range(3):
+                db.save(Run(root=tempdir, start_time=datetime(2025, 1, 1 + i)))  # pylint: disable=E1123
+
+        maintenance.main(["prune", "--database-url", f"sqlite:///{tempdir}/test.db", "--store-max-runs", "1"])
+        assert "Pruned 2 runs" in capsys.readouterr().out
+
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            assert [run.start_time for run in db.load_history()] == [datetime(2025, 1, 3)]
+
+
+def test_prune_command_old_schema(capsys):
+    """
+    Test that the prune command brings a database created by an earlier version up to date before pruning it.
+    """
+    with TemporaryDirectory() as tempdir:
+        engine = create_engine(f"sqlite:///{tempdir}/test.db")
+        with engine.begin() as connection:
+            # The tables that pruning touches, as they were before coverage, summaries, and schema versions were stored
+            connection.execute(
+                text(
+                    "CREATE TABLE run (id INTEGER PRIMARY KEY, start_time DATETIME, created_at DATETIME, root VARCHAR, "
+                    "commit_sha VARCHAR)"
+                )
+            )
+            connection.execute(
+                text(
+                    "CREATE TABLE test (id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL REFERENCES run (id), "
+                    "fspath VARCHAR, line_no INTEGER, name VARCHAR, skipped BOOLEAN)"
+                )
+            )
+            connection.execute(
+                text(
+                    "CREATE TABLE test_execution (id INTEGER PRIMARY KEY, "
+                    "test_id INTEGER NOT NULL REFERENCES test (id), outcome VARCHAR, stdout TEXT, stderr TEXT, "
+                    "report TEXT, start_time DATETIME, end_time DATETIME, coverage BLOB)"
+                )
+            )
+            for i in range(3):
+                connection.execute(
+                    text("INSERT INTO run (id, start_time, root) VALUES (:id, :start_time, '.')"),
+                    {"id": i + 1, "start_time": f"2025-01-0{i + 1} 00:00:00.000000"},
+                )
+                connection.execute(text("INSERT INTO test (id, run_id, name) VALUES (:id, :id, 'test')"), {"id": i + 1})
+                connection.execute(
+                    text("INSERT INTO test_execution (test_id, outcome, coverage) VALUES (:id, 'passed', :coverage)"),
+                    {"id": i + 1, "coverage": pickle.dumps({"file1": [i + 1]})},
+                )
+        engine.dispose()
+
+        maintenance.main(["prune", "--database-url", f"sqlite:///{tempdir}/test.db", "--store-max-runs", "1"])
+        assert "Pruned 2 runs" in capsys.readouterr().out
+
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            (run,) = db.load_runs()
+            assert run.start_time == datetime(2025, 1, 3)
+            assert run.tests[0].executions[0].coverage == {"file1": [3]}
+            with db.engine.connect() as connection:
+                assert connection.scalars(select(TestSummary.name)).all() == ["test"]
+
+
+def save_runs(url: str, writer: int, runs: int, tests: int) -> int:
+    """
+    Save runs to a shared database in concurrent mode, as one of several writer processes.
+    Coverage is the same across writers, so that they race to store the same blobs.
+    """
+    with Database(url, concurrent=True, store_max_runs=1000) as db:
+        for i in range(runs):
+            db.save(
+                Run(  # pylint: disable=E1123
+                    root=".",
+                    start_time=datetime.now(),
+                    commit_sha=f"sha{writer}",
+                    tests=[
+                        Test(  # pylint: disable=E1123
+                            name=f"test_{t}",
+                            executions=[
+                                TestExecution(  # pylint: disable=E1123
+                                    outcome="passed" if (t + i) % 3 else "failed",
+                                    coverage={"src.py": [t, t + 1]},
+                                )
+                            ],
+                            flakefighter_results=[FlakefighterResult(name="DiffCov", flaky=(t + i) % 3 == 0)],
+                        )
+                        for t in range(tests)
+                    ],
+                ),
+                bulk=writer % 2 == 0,
+            )
+    return runs
+
+
+def test_concurrent_writers():
+    """
+    Test that several processes can create and save runs to the same SQLite database at once in concurrent mode,
+    without any save failing because the database is locked.
+    """
+    writers, runs, tests = 8, 5, 20
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        with ProcessPoolExecutor(writers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            saved = list(executor.map(save_runs, [url] * writers, range(writers), [runs] * writers, [tests] * writers))
+        assert saved == [runs] * writers
+
+        with Database(url, concurrent=True) as db:
+            with db.engine.connect() as connection:
+                assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+                assert connection.execute(select(func.count()).select_from(Test)).scalar() == writers * runs * tests
+                assert connection.execute(select(func.count()).select_from(CoverageBlob)).scalar() == tests
+                assert set(connection.execute(select(TestSummary.runs)).scalars()) == {writers * runs}
+            assert len(db.load_history()) == writers * runs
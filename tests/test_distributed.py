@@ -0,0 +1,116 @@
+"""
+This module implements tests for running the plugin under pytest-xdist.
+"""
+
+import os
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+
+import pytest
+
+from pytest_flakefighters.database_management import Database, Test
+from pytest_flakefighters.distributed import (
+    WORKER_OUTPUT_KEY,
+    pack_worker_output,
+    unpack_worker_output,
+)
+from pytest_flakefighters.flakefighters.coverage_independence import (
+    CoverageIndependence,
+)
+from pytest_flakefighters.function_coverage import Profiler
+from pytest_flakefighters.plugin import FlakeFighterPlugin
+
+from .conftest import make_execution, make_test
+
+
+def single_test(name: str, outcome: str) -> Test:
+    """
+    Create a test with a single execution.
+    """
+    execution = make_execution(
+        outcome, {"file1": [1, 2]}, exception=outcome == "failed", verdicts={"DiffCov": False}, duration=1
+    )
+    return make_test(name, [execution], fspath="file1", line_no=1)
+
+
+def test_worker_output():
+    """
+    Test that the tests shipped by a worker are rebuilt with all of their related objects.
+    """
+    collection_coverage, (passed, failed) = unpack_worker_output(
+        pack_worker_output({"file1": [1]}, [single_test("test_0", "passed"), single_test("test_1", "failed")])
+    )
+    assert collection_coverage == {"file1": [1]}
+    assert (passed.name, passed.fspath, passed.line_no) == ("test_0", "file1", 1)
+    assert [execution.outcome for execution in passed.executions] == ["passed"]
+    assert passed.executions[0].coverage == {"file1": [1, 2]}
+    assert passed.executions[0].end_time == datetime(2025, 1, 1, second=1)
+    assert passed.executions[0].exception is None
+    assert [(result.name, result.flaky) for result in passed.executions[0].flakefighter_results] == [("DiffCov", False)]
+    assert failed.executions[0].exception.name == "AssertionError"
+    assert [(entry.lineno, entry.statement) for entry in failed.executions[0].exception.traceback] == [
+        (2, "assert False")
+    ]
+
+
+def test_controller_assembles_run():
+    """
+    Test that the controller assembles the tests of every worker into a single run, so that postprocessing
+    flakefighters classify tests across workers, and saves it once.
+    """
+    with TemporaryDirectory() as tempdir:
+        db = Database(f"sqlite:///{tempdir}/test.db")
+        plugin = FlakeFighterPlugin(
+            root=tempdir, database=db, cov=Profiler(), flakefighters=[CoverageIndependence()], controller=True
+        )
+        workers = [
+            SimpleNamespace(
+                workeroutput={WORKER_OUTPUT_KEY: pack_worker_output({"file1": [1]}, [single_test(name, outcome)])}
+            )
+            for name, outcome in [("test_0", "passed"), ("test_1", "failed")]
+        ]
+        for worker in workers + [SimpleNamespace()]:  # The last worker crashed
+            plugin.pytest_testnodedown(worker, None)
+
+        runtestloop = plugin.pytest_runtestloop(None)
+        next(runtestloop)
+        with pytest.raises(StopIteration):
+            next(runtestloop)
+        assert plugin.run.collection_coverage == {"file1": [1]}
+        assert [test.name for test in plugin.run.tests] == ["test_0", "test_1"]
+        # The tests ran on different workers, but cover the same lines with different outcomes
+        assert all(test.flaky for test in plugin.run.tests)
+
+        db.save(plugin.run)
+        (run,) = db.load_runs()
+        assert [test.name for test in run.tests] == ["test_0", "test_1"]
+        assert run.tests[1].executions[0].exception.traceback[0].lineno == 2
+        db.close()
+
+
+def test_xdist(pytester, flaky_triangle_repo):
+    """
+    Test that a run spread across pytest-xdist workers is saved as a single run.
+    """
+    pytest.importorskip("xdist")
+    with open(os.path.join(flaky_triangle_repo.working_dir, "suffix.txt"), "w") as f:
+        print("Triangle", file=f)
+
+    result = pytester.runpytest(
+        os.path.join(flaky_triangle_repo.working_dir, "triangle.py"),
+        "--flakefighters",
+        "--max-reruns=2",
+        "-n",
+        "2",
+    )
+    result.assert_outcomes(failed=2, skipped=1)
+
+    with Database(f"sqlite:///{os.path.join(flaky_triangle_repo.working_dir, 'flakefighters.db')}") as db:
+        (run,) = db.load_runs()
+        assert sorted((test.name.split("::")[-1], len(test.executions)) for test in run.tests) == [
+            ("test_eqiulateral", 3),
+            ("test_isosceles", 3),
+            ("test_scalene", 0),
+        ]
+        assert [test.flaky for test in run.tests if test.executions] == [True, True]
@@ -4,10 +4,14 @@ Test end to end runs.
 
 import json
 import os
+import sys
 
 import pandas as pd
+import pytest
 from pytest import ExitCode
 
+from pytest_flakefighters.database_management import Database
+
 
 def test_real_failures(pytester, diff_cov_repo):
     """Make sure that genuine failures are labelled as such."""
@@ -149,6 +153,128 @@ def test_diff_cov_example(pytester, diff_cov_repo):
     result.stdout.fnmatch_lines(["FAILED app.py::test_app - assert False"])
 
 
+def test_coverage_restricted_to_root(pytester, diff_cov_repo):
+    """
+    Test that coverage is only stored for files under the project root, minus omitted files.
+    """
+
+    pytester.runpytest(
+        os.path.join(diff_cov_repo.working_dir, "app.py"),
+        f"--root={diff_cov_repo.working_dir}",
+        "--coverage-omit=*/conftest.py",
+        "-s",
+        "--flakefighters",
+    )
+
+    with Database(f"sqlite:///{os.path.join(diff_cov_repo.working_dir, 'flakefighters.db')}") as db:
+        run = db.load_runs()[0]
+        coverage = run.tests[0].executions[0].full_coverage
+        collection_coverage = run.collection_coverage
+    assert list(coverage) == [os.path.join(diff_cov_repo.working_dir, "app.py")], f"Unexpected files {list(coverage)}"
+    assert list(collection_coverage) == list(coverage), f"Unexpected collection files {list(collection_coverage)}"
+
+
+def test_only_required_data_collected(pytester, diff_cov_repo):
+    """
+    Test that data which no active flakefighter needs is not collected.
+    """
+
+    pytester.runpytest(
+        os.path.join(diff_cov_repo.working_dir, "app.py"),
+        "--active-flakefighters",
+        "TracebackMatching",
+        "-s",
+        "--flakefighters",
+    )
+
+    with Database(f"sqlite:///{os.path.join(diff_cov_repo.working_dir, 'flakefighters.db')}") as db:
+        execution = db.load_runs()[0].tests[0].executions[0]
+        assert execution.coverage is None, f"Expected no coverage but got {execution.coverage}"
+        assert execution.report is None, f"Expected no report but got {execution.report}"
+        assert execution.exception.name == "AssertionError"
+
+
+def test_stream_results(pytester, diff_cov_repo):
+    """
+    Test that streamed results are saved the same as results saved at the end of the session.
+    """
+
+    result = pytester.runpytest(
+        os.path.join(diff_cov_repo.working_dir, "app.py"),
+        "--stream-results",
+        "-s",
+        "--flakefighters",
+    )
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines(["FAILED app.py::test_app - assert False"])
+    assert result.ret == ExitCode.TESTS_FAILED, f"Expected exit code {ExitCode.TESTS_FAILED} but was {result.ret}."
+
+    with Database(f"sqlite:///{os.path.join(diff_cov_repo.working_dir, 'flakefighters.db')}") as db:
+        runs = db.load_runs()
+        assert len(runs) == 1, f"Expected 1 saved run but was {len(runs)}"
+        assert [ff.name for ff in runs[0].active_flakefighters] == ["DiffCov"]
+        execution = runs[0].tests[0].executions[0]
+        assert execution.outcome == "failed"
+        assert [(r.name, r.flaky) for r in execution.flakefighter_results] == [("DiffCov", False)]
+
+
+def test_stream_results_postprocessing(pytester, flaky_reruns_repo):
+    """
+    Test that verdicts of postprocessing flakefighters are saved for tests that were streamed before classification.
+    """
+
+    with open(os.path.join(flaky_reruns_repo.working_dir, "pyproject.toml"), "w") as f:
+        f.write("[tool.pytest.ini_options.pytest_flakefighters.flakefighters.diff_cov.DiffCov]\nrun_live=false")
+
+    result = pytester.runpytest(
+        os.path.join(flaky_reruns_repo.working_dir, "flaky_reruns.py"),
+        "--stream-results",
+        "-s",
+        "--flakefighters",
+        "--suppress-flaky-failures-exit-code",
+    )
+    result.assert_outcomes(failed=1)
+
+    with Database(f"sqlite:///{os.path.join(flaky_reruns_repo.working_dir, 'flakefighters.db')}") as db:
+        test = db.load_runs()[0].tests[0]
+        assert test.flaky, "Expected postprocessing verdict to have been saved"
+
+
+def test_diff_cov_example_continuous_coverage(pytester, diff_cov_repo):
+    """
+    Test the DiffCov example with coverage measured continuously across the whole session.
+    """
+
+    # run pytest with the following cmd args
+    result = pytester.runpytest(
+        os.path.join(diff_cov_repo.working_dir, "app.py"),
+        "--continuous-coverage",
+        "-s",
+        "--flakefighters",
+    )
+
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines(["FAILED app.py::test_app - assert False"])
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="sys.monitoring requires Python 3.12 or later")
+def test_diff_cov_example_monitoring_coverage(pytester, diff_cov_repo):
+    """
+    Test the DiffCov example with line coverage measured by sys.monitoring.
+    """
+
+    # run pytest with the following cmd args
+    result = pytester.runpytest(
+        os.path.join(diff_cov_repo.working_dir, "app.py"),
+        "--monitoring-coverage",
+        "-s",
+        "--flakefighters",
+    )
+
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines(["FAILED app.py::test_app - assert False"])
+
+
 def test_diff_cov_example_function_coverage(pytester, diff_cov_repo):
     """
     Test the DiffCov example with function coverage.
@@ -0,0 +1,24 @@
+"""
+This module implements tests for the FileFilter class.
+"""
+
+import pytest
+
+from pytest_flakefighters.file_filter import FileFilter
+
+
+@pytest.mark.parametrize(
+    ("include, omit, file_path, expected"),
+    [
+        pytest.param(None, None, "/lib/python3/os.py", True, id="no-patterns"),
+        pytest.param(["/project/*"], None, "/project/src/app.py", True, id="included"),
+        pytest.param(["/project/*"], None, "/lib/python3/os.py", False, id="not-included"),
+        pytest.param(["/project/*"], ["*/tests/*"], "/project/tests/test_app.py", False, id="omitted"),
+        pytest.param(None, ["*/tests/*"], "/project/src/app.py", True, id="not-omitted"),
+    ],
+)
+def test_file_filter(include, omit, file_path, expected):
+    """
+    Test that files are measured if they are included and not omitted.
+    """
+    assert FileFilter(include, omit)(file_path) == expected
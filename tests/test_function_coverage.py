@@ -4,6 +4,7 @@ This module implements tests for function-level coverage.
 
 import os
 
+from pytest_flakefighters.file_filter import FileFilter
 from pytest_flakefighters.function_coverage import Profiler
 
 
@@ -78,3 +79,46 @@ def test_set_context():
     expected = list(range(11, 19)) + [25, 26]
     lines = profiler.get_data().lines(triangle)
     assert lines == expected, f"Expected test_isosceles coverage {expected} but was {lines}."
+
+
+def test_switch_context_while_running():
+    """Make sure that switching context while profiling records the functions called under the previous context."""
+    profiler = Profiler()
+    from tests.resources.triangle import (  # pylint: disable=C0415
+        test_eqiulateral,
+        test_isosceles,
+    )
+
+    triangle = os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources", "triangle.py")
+
+    profiler.start()
+    profiler.switch_context("test_eqiulateral")
+    test_eqiulateral()
+    profiler.switch_context("test_isosceles")
+    test_isosceles()
+    profiler.switch_context(None)
+    profiler.stop()
+
+    profiler.get_data().set_query_context("test_eqiulateral")
+    expected = list(range(11, 19)) + [21, 22]
+    lines = profiler.get_data().lines(triangle)
+    assert lines == expected, f"Expected test_eqiulateral coverage {expected} but was {lines}."
+
+    profiler.get_data().set_query_context("test_isosceles")
+    expected = list(range(11, 19)) + [25, 26]
+    lines = profiler.get_data().lines(triangle)
+    assert lines == expected, f"Expected test_isosceles coverage {expected} but was {lines}."
+
+
+def test_file_filter():
+    """Make sure that modules which are not measured are not recorded."""
+    profiler = Profiler(FileFilter(omit=["*/triangle.py"]))
+    from tests.resources.triangle import triangle_type  # pylint: disable=C0415
+
+    profiler.start()
+    triangle_type(3, 4, 5)
+    profiler.stop()
+
+    triangle = os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources", "triangle.py")
+    assert triangle not in profiler.get_data().measured_files()
+    assert triangle not in profiler.function_defs
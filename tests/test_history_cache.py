@@ -0,0 +1,204 @@
+"""
+This module implements tests for the HistoryCache class.
+"""
+
+import os
+import pickle
+from datetime import datetime, timedelta, timezone
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from sqlalchemy import text
+
+from pytest_flakefighters.bulk_insert import (
+    insert_results,
+    insert_run,
+    insert_tests,
+    result_row,
+    snapshot_run,
+    snapshot_test,
+)
+from pytest_flakefighters.database_management import (
+    Database,
+    ExceptionView,
+    ExecutionView,
+    FlakefighterResult,
+    ResultView,
+    Run,
+    RunView,
+    TestView,
+    TracebackView,
+)
+from pytest_flakefighters.history_cache import CachedRuns, HistoryCache
+
+from .conftest import make_execution, make_run, make_test
+
+
+def single_run(start_time: datetime, outcome: str) -> Run:
+    """
+    Create a run with a single test with a single execution.
+    """
+    return make_run([make_test(executions=[make_execution(outcome, exception=True)])], start_time=start_time)
+
+
+def outcomes(runs) -> list[str]:
+    """
+    Return the outcome of the execution of each run.
+    """
+    return [run.tests[0].executions[0].outcome for run in runs]
+
+
+def test_history_cache():
+    """
+    Test that history is read through the cache, only downloading runs that are not already cached.
+    """
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        cache_dir = os.path.join(tempdir, "cache")
+        start = datetime(2025, 1, 1)
+        with Database(url) as db:
+            for i in range(3):
+                db.save(single_run(start + timedelta(days=i), "failed"))
+            expected = db.load_history(limit=2, tracebacks=True)
+
+        with Database(url, history_cache_dir=cache_dir) as db:
+            assert db.load_history(limit=2) == expected
+            assert os.path.exists(db.history_cache.path)
+            # Runs saved during the session are read through
+            db.save(single_run(start + timedelta(days=3), "passed"))
+            assert outcomes(db.load_history(limit=2)) == ["passed", "failed"]
+
+        with Database(url) as db:
+            with db.engine.begin() as connection:
+                connection.execute(text("UPDATE test_execution SET outcome = 'skipped'"))
+            db.save(single_run(start + timedelta(days=4), "passed"))
+
+        with Database(url, history_cache_dir=cache_dir) as db:
+            # Only the new run is downloaded, so cached runs still have their original outcomes
+            assert outcomes(db.load_history(limit=3)) == ["passed", "passed", "failed"]
+            assert db.load_history(limit=3)[-1].tests[0].executions[0].exception.traceback[0].lineno == 2
+            # Runs older than those cached are downloaded once more are needed
+            assert outcomes(db.load_history()) == ["passed", "passed", "failed", "skipped", "skipped"]
+            assert db.load_history(Run.start_time < start + timedelta(days=1))[0].tests[0].executions[0].outcome == (
+                "skipped"
+            )
+
+
+def test_history_cache_recreated_database():
+    """
+    Test that the cache does not confuse runs in a database that has been recreated at the same URL with the runs of
+    the old database, nor with runs that have since been pruned.
+    """
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        cache_dir = os.path.join(tempdir, "cache")
+        with Database(url, history_cache_dir=cache_dir) as db:
+            db.save(single_run(datetime(2025, 1, 1), "failed"))
+            db.save(single_run(datetime(2025, 1, 2), "failed"))
+            assert outcomes(db.load_history()) == ["failed", "failed"]
+        os.remove(f"{tempdir}/test.db")
+
+        with Database(url, history_cache_dir=cache_dir) as db:
+            db.save(single_run(datetime(2025, 2, 1), "passed"))
+            assert outcomes(db.load_history()) == ["passed"]
+
+        with Database(url, store_max_runs=1, history_cache_dir=cache_dir) as db:
+            db.save(single_run(datetime(2025, 2, 2), "skipped"))
+            assert [run.start_time for run in db.load_history()] == [datetime(2025, 2, 2)]
+
+
+def test_history_cache_run_being_written():
+    """
+    Test that runs which were still being written when they were cached are downloaded again once more of them has
+    been written.
+    """
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        cache_dir = os.path.join(tempdir, "cache")
+        run = single_run(datetime(2025, 1, 1), "failed")
+        with Database(url) as db:
+            with db.begin_write() as connection:
+                run_id = insert_run(connection, *snapshot_run(run))
+            with Database(url, history_cache_dir=cache_dir) as reader:
+                assert [run.tests for run in reader.load_history()] == [[]]
+
+            record = snapshot_test(run.tests[0])
+            with db.begin_write() as connection:
+                insert_tests(connection, run_id, [record])
+            with Database(url, history_cache_dir=cache_dir) as reader:
+                assert outcomes(reader.load_history()) == ["failed"]
+                assert not reader.load_history()[0].tests[0].flaky
+
+            with db.begin_write() as connection:
+                insert_results(
+                    connection,
+                    [
+                        result_row(FlakefighterResult(name="DiffCov", flaky=True))
+                        | {"test_id": record.id, "test_execution_id": None}
+                    ],
+                )
+            with Database(url, history_cache_dir=cache_dir) as reader:
+                assert reader.load_history()[0].tests[0].flaky
+
+
+def test_history_cache_unreadable():
+    """
+    Test that an unreadable cache file is rebuilt from the database.
+    """
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        with Database(url, history_cache_dir=tempdir) as db:
+            db.save(single_run(datetime(2025, 1, 1), "failed"))
+            assert outcomes(db.load_history()) == ["failed"]
+            with open(db.history_cache.path, "rb") as f:
+                valid = f.read()
+            for contents in [b"", b"not a cache", valid[:-4], pickle.dumps((1, []))]:
+                with open(db.history_cache.path, "wb") as f:
+                    f.write(contents)
+                db.history_cache.invalidate()
+                assert outcomes(db.load_history()) == ["failed"]
+            assert db.history_cache.load() == db.load_history()
+
+
+def test_history_cache_round_trip():
+    """
+    Test that every attribute of the cached views survives being stored, including missing values and time zones, and
+    that the cache file is memory-mapped rather than read.
+    """
+    runs = [
+        RunView(
+            2,
+            datetime(2025, 1, 2, 3, 4, 5, 6),
+            "/root",
+            "abc123",
+            [
+                TestView(
+                    "test_a",
+                    7,
+                    [
+                        ExecutionView(
+                            "failed",
+                            [ResultView("DiffCov", True), ResultView("DeFlaker", None)],
+                            ExceptionView(
+                                "AssertionError",
+                                [TracebackView("file1", 2, 4, "assert x"), TracebackView("file2", None, None, None)],
+                            ),
+                            datetime(2025, 1, 2, tzinfo=timezone.utc),
+                            datetime(2025, 1, 2, 0, 0, 1, tzinfo=timezone(timedelta(hours=1))),
+                        ),
+                        ExecutionView("passed", []),
+                    ],
+                    [ResultView("CoverageIndependence", False)],
+                ),
+                TestView("test_b", None, [], []),
+            ],
+        ),
+        RunView(1, None, "/root", None, []),
+    ]
+    with TemporaryDirectory() as tempdir:
+        cache = HistoryCache(tempdir, "sqlite:///test.db")
+        cache.store(runs)
+        assert cache.load() == runs
+        cached = CachedRuns.load(cache.path)
+        assert isinstance(cached.arrays["run_id"].base, np.memmap)
+        assert [cached.fingerprint(i) for i in range(2)] == [(datetime(2025, 1, 2, 3, 4, 5, 6), 2, 3), (None, 0, 0)]
@@ -0,0 +1,83 @@
+"""
+This module implements tests for line coverage measured with sys.monitoring.
+"""
+
+import os
+import sys
+
+import pytest
+
+from pytest_flakefighters.file_filter import FileFilter
+from pytest_flakefighters.monitoring_coverage import Monitor
+
+# Pylint cannot see the members of sys.monitoring, which only exists from Python 3.12
+# pylint: disable=E1101
+
+TRIANGLE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources", "triangle.py")
+
+
+requires_monitoring = pytest.mark.skipif(
+    sys.version_info < (3, 12), reason="sys.monitoring requires Python 3.12 or later"
+)
+
+
+@requires_monitoring
+def test_monitor_lines():
+    """Make sure that line coverage is measured."""
+    monitor = Monitor()
+    from tests.resources.triangle import triangle_type  # pylint: disable=C0415
+
+    monitor.start()
+    triangle_type(3, 4, 5)
+    monitor.stop()
+
+    lines = sorted(monitor.get_data().lines(TRIANGLE))
+    assert lines == [12, 14, 16, 18], f"Expected [12, 14, 16, 18] but was {lines}."
+    assert monitor.tool_id is not None
+    assert sys.monitoring.get_tool(monitor.tool_id) is None, "Expected the tool ID to be freed after stopping"
+
+
+@requires_monitoring
+def test_set_context():
+    """Make sure that lines are recorded again under each context."""
+    monitor = Monitor()
+    from tests.resources.triangle import (  # pylint: disable=C0415
+        test_eqiulateral,
+        test_isosceles,
+    )
+
+    monitor.start()
+    monitor.switch_context("test_eqiulateral")
+    test_eqiulateral()
+    monitor.switch_context("test_isosceles")
+    test_isosceles()
+    monitor.switch_context(None)
+    monitor.stop()
+
+    monitor.get_data().set_query_context("test_eqiulateral")
+    lines = sorted(monitor.get_data().lines(TRIANGLE))
+    assert lines == [12, 14, 15, 22], f"Expected test_eqiulateral coverage [12, 14, 15, 22] but was {lines}."
+
+    monitor.get_data().set_query_context("test_isosceles")
+    lines = sorted(monitor.get_data().lines(TRIANGLE))
+    assert lines == [12, 14, 16, 17, 26], f"Expected test_isosceles coverage [12, 14, 16, 17, 26] but was {lines}."
+
+
+@requires_monitoring
+def test_file_filter():
+    """Make sure that modules which are not measured are not recorded."""
+    monitor = Monitor(FileFilter(omit=["*/triangle.py"]))
+    from tests.resources.triangle import triangle_type  # pylint: disable=C0415
+
+    monitor.start()
+    triangle_type(3, 4, 5)
+    monitor.stop()
+
+    assert TRIANGLE not in monitor.get_data().measured_files()
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason="sys.monitoring is available")
+def test_unsupported_version():
+    """Make sure that a helpful error is raised on Python versions without sys.monitoring."""
+    with pytest.raises(RuntimeError):
+        Monitor()
@@ -0,0 +1,83 @@
+"""
+This module implements tests for the FlakeFighterPlugin class.
+"""
+
+import os
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from pytest_flakefighters.database_management import Database
+from pytest_flakefighters.flakefighters.abstract_flakefighter import Requirements
+from pytest_flakefighters.flakefighters.coverage_independence import (
+    CoverageIndependence,
+)
+from pytest_flakefighters.function_coverage import Profiler
+from pytest_flakefighters.plugin import FlakeFighterPlugin
+
+TRIANGLE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources", "triangle.py")
+
+
+@pytest.fixture(name="plugin")
+def _plugin():
+    with TemporaryDirectory() as tempdir:
+        db = Database(f"sqlite:///{tempdir}/test.db")
+        yield FlakeFighterPlugin(root=tempdir, database=db, cov=Profiler(), flakefighters=[])
+        db.close()
+
+
+def test_requirements():
+    """
+    Test that the plugin collects the data required by any of its flakefighters.
+    """
+    with TemporaryDirectory() as tempdir:
+        db = Database(f"sqlite:///{tempdir}/test.db")
+        plugin = FlakeFighterPlugin(root=tempdir, database=db, cov=Profiler(), flakefighters=[CoverageIndependence()])
+        db.close()
+    assert plugin.requirements == Requirements(coverage=True)
+    assert Requirements(coverage=True) | Requirements(traceback=True) == Requirements(coverage=True, traceback=True)
+
+
+def test_pop_coverage(plugin):
+    """
+    Test that popping coverage only returns the lines measured since the previous pop.
+    """
+    from tests.resources.triangle import (  # pylint: disable=C0415
+        test_eqiulateral,
+        test_isosceles,
+    )
+
+    plugin.cov.switch_context("test_eqiulateral")
+    plugin.cov.start()
+    test_eqiulateral()
+    plugin.cov.stop()
+    lines = list(plugin.pop_coverage("test_eqiulateral").lines(TRIANGLE))
+    assert lines == list(range(11, 19)) + [21, 22], f"Unexpected test_eqiulateral coverage {lines}"
+
+    plugin.cov.switch_context("test_isosceles")
+    plugin.cov.start()
+    test_isosceles()
+    plugin.cov.stop()
+    lines = list(plugin.pop_coverage("test_isosceles").lines(TRIANGLE))
+    assert lines == list(range(11, 19)) + [25, 26], f"Unexpected test_isosceles coverage {lines}"
+
+    assert not plugin.pop_coverage("test_isosceles"), "Expected coverage data to have been released"
+
+
+def test_pop_coverage_other_contexts(plugin):
+    """
+    Test that popping coverage drops lines measured under other contexts.
+    """
+    from tests.resources.triangle import (  # pylint: disable=C0415
+        test_eqiulateral,
+        test_isosceles,
+    )
+
+    plugin.cov.start()
+    plugin.cov.switch_context("test_eqiulateral")
+    test_eqiulateral()
+    plugin.cov.switch_context(None)
+    test_isosceles()
+    plugin.cov.stop()
+    lines = list(plugin.pop_coverage("test_eqiulateral").lines(TRIANGLE))
+    assert lines == list(range(11, 19)) + [21, 22], f"Unexpected test_eqiulateral coverage {lines}"
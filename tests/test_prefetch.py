@@ -0,0 +1,128 @@
+"""
+This module implements tests for prefetching startup work in the background.
+"""
+
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from tempfile import TemporaryDirectory
+
+import pytest
+from sqlalchemy import event
+
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.database_management import (
+    Database,
+    FlakefighterResult,
+    Run,
+    Test,
+    TestException,
+    TestExecution,
+    TracebackEntry,
+)
+from pytest_flakefighters.flakefighters.diff_cov import DiffCov
+from pytest_flakefighters.flakefighters.traceback_matching import TracebackMatching
+from pytest_flakefighters.function_coverage import Profiler
+from pytest_flakefighters.main import coverage_scope
+from pytest_flakefighters.null_coverage import NullCoverage
+from pytest_flakefighters.plugin import FlakeFighterPlugin
+from pytest_flakefighters.prefetch import prefetch, resolved
+
+
+def test_prefetch():
+    """
+    Test that prefetched results are returned once ready, and exceptions are re-raised to the consumer.
+    """
+    assert prefetch(sum, [1, 2], start=3).result() == 6
+    assert resolved([1]).result() == [1]
+    with pytest.raises(ZeroDivisionError):
+        prefetch(lambda: 1 / 0).result()
+
+
+def test_traceback_matching_prefetched():
+    """
+    Test that traceback matching can be created before the previous runs have loaded, and only waits for them when
+    classifying.
+    """
+    loaded = threading.Event()
+    previous_runs = [
+        Run(  # pylint: disable=E1123
+            root=".",
+            tests=[
+                Test(  # pylint: disable=E1123
+                    executions=[
+                        TestExecution(  # pylint: disable=E1123
+                            exception=TestException(  # pylint: disable=E1123
+                                traceback=[TracebackEntry(path="file1", lineno=2, colno=0, statement="assert False")]
+                            ),
+                        )
+                    ],
+                    flakefighter_results=[FlakefighterResult(name="DiffCov", flaky=True)],
+                )
+            ],
+        )
+    ]
+
+    def load():
+        assert loaded.wait(10)
+        return previous_runs
+
+    matcher = TracebackMatching(run_live=True, previous_runs=prefetch(load))
+    assert not matcher._previous_tracebacks.done()  # pylint: disable=W0212
+    loaded.set()
+    assert matcher.previous_tracebacks == [[("file1", 2, 0, "assert False")]]
+    assert matcher.previous_runs == previous_runs
+
+
+def test_database_prefetch():
+    """
+    Test that the previous runs are only loaded when first read, and background reads finish before the database
+    closes.
+    """
+    with TemporaryDirectory() as tempdir:
+        url = f"sqlite:///{tempdir}/test.db"
+        with Database(url) as db:
+            db.save(Run(root=".", start_time=datetime(2025, 1, 1)))  # pylint: disable=E1123
+        db = Database(url)
+        history = db.prefetch(db.load_history)
+        db.close()
+        assert history.done() or history.cancelled()
+        with Database(url) as db:
+            statements = []
+            event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+            plugin = FlakeFighterPlugin(root=tempdir, database=db, cov=Profiler(), flakefighters=[])
+            assert not plugin.requirements.history
+            assert plugin.display_history is None
+            assert not statements
+            assert [run.start_time for run in db.previous_runs] == [datetime(2025, 1, 1)]
+            assert statements
+            plugin = FlakeFighterPlugin(root=tempdir, database=db, cov=Profiler(), flakefighters=[], display_outcomes=1)
+            assert plugin.requirements.history
+            assert [run.start_time for run in plugin.display_history.result()] == [datetime(2025, 1, 1)]
+
+
+def test_plugin_defers_diff(diff_cov_repo):
+    """
+    Test that the plugin can be created before DiffCov has diffed the commits, and only waits for the diff once the
+    session starts and the run is saved.
+    """
+    diff_cov = DiffCov(run_live=True, source_runs=[], root=diff_cov_repo.working_dir)
+    diff_cov._commits = Future()  # pylint: disable=W0212
+    diff_cov._diff = Future()  # pylint: disable=W0212
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            scopes = []
+
+            def coverage_backend():
+                scopes.append(coverage_scope([diff_cov], None))
+                return NullCoverage()
+
+            plugin = FlakeFighterPlugin(root=tempdir, database=db, cov=coverage_backend, flakefighters=[diff_cov])
+            assert not scopes
+            diff_cov._commits.set_result(("source", "target"))  # pylint: disable=W0212
+            diff_cov._diff.set_result(({"file1": [1]}, CoverageMap({"file1": [1]})))  # pylint: disable=W0212
+            plugin.pytest_sessionstart(None)
+            assert scopes == [["file1"]]
+            assert isinstance(plugin.cov, NullCoverage)
+            plugin.record_flakefighters()
+            assert plugin.run.active_flakefighters[0].params["source_commit"] == "source"
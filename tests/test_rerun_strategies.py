@@ -4,10 +4,13 @@ This module implements tests for reruning flaky failures.
 
 import os
 import shutil
+from datetime import datetime
+from tempfile import TemporaryDirectory
 
 from pytest_flakefighters.database_management import Database
+from pytest_flakefighters.rerun_strategies import PreviouslyFlaky
 
-from .conftest import CURRENT_DIR
+from .conftest import CURRENT_DIR, make_execution, make_run, make_test
 
 
 def test_flaky_reruns(pytester, flaky_reruns_repo):
@@ -104,6 +107,23 @@ def test_previously_flaky(pytester, flaky_reruns_repo):
         )
 
 
+def test_previously_flaky_pruned():
+    """Make sure that tests are no longer rerun once the runs in which they were flaky are pruned"""
+
+    def run(day, flaky):
+        return make_run(
+            [make_test(executions=[make_execution("failed")], verdicts={"DiffCov": flaky})],
+            start_time=datetime(2025, 1, day),
+        )
+
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db", store_max_runs=1) as db:
+            db.save(run(1, True))
+            assert PreviouslyFlaky(1, db).previously_flaky == {"test"}
+            db.save(run(2, False))
+            assert not PreviouslyFlaky(1, db).previously_flaky
+
+
 def test_previously_flaky_no_rerun(pytester, diff_cov_repo):
     """Make sure that flaky failures are correctly rerun"""
 
@@ -0,0 +1,87 @@
+"""
+This module implements tests for the ResultWriter class.
+"""
+
+from datetime import datetime
+from tempfile import TemporaryDirectory
+
+import pytest
+from sqlalchemy import text
+
+from pytest_flakefighters.database_management import (
+    ActiveFlakeFighter,
+    Database,
+    FlakefighterResult,
+    Run,
+    Test,
+)
+from pytest_flakefighters.result_writer import ResultWriter
+
+from .conftest import make_execution, make_test
+
+
+def single_test(name: str, outcome: str) -> Test:
+    """
+    Create a test with a single execution.
+    """
+    return make_test(
+        name, [make_execution(outcome, {"file1": [1, 2]}, exception=outcome == "failed", verdicts={"DiffCov": False})]
+    )
+
+
+def test_stream():
+    """
+    Test that streamed tests are saved with all their related rows, including results added after they were streamed.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            run = Run(  # pylint: disable=E1123
+                root=tempdir,
+                start_time=datetime.now(),
+                collection_coverage={"file1": [1]},
+                active_flakefighters=[ActiveFlakeFighter(name="DiffCov", params={"root": "."})],
+            )
+            writer = ResultWriter(db, batch_size=2)
+            writer.start_run(run)
+            tests = [single_test(f"test_{i}", "failed" if i % 2 else "passed") for i in range(5)]
+            for test in tests:
+                run.tests.append(test)
+                writer.submit(test)
+            tests[0].flakefighter_results.append(FlakefighterResult(name="CoverageIndependence", flaky=True))
+            writer.finish()
+
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            (saved,) = db.load_runs()
+            assert saved.id == writer.run_id
+            assert saved.collection_coverage == {"file1": [1]}
+            assert [(ff.name, ff.params) for ff in saved.active_flakefighters] == [("DiffCov", {"root": "."})]
+            assert [test.name for test in saved.tests] == [f"test_{i}" for i in range(5)]
+            assert [test.executions[0].outcome for test in saved.tests] == ["passed", "failed"] * 2 + ["passed"]
+            assert saved.tests[1].executions[0].exception.traceback[0].lineno == 2
+            assert all(test.executions[0].coverage == {"file1": [1, 2]} for test in saved.tests)
+            assert saved.tests[0].flaky and not saved.tests[1].flaky
+            with db.engine.connect() as connection:
+                assert connection.execute(text("SELECT COUNT(*) FROM coverage_blob")).scalar() == 1
+                assert connection.execute(text("SELECT name, flaky_runs FROM test_summary ORDER BY name")).all() == [
+                    ("test_0", 1),
+                    ("test_1", 0),
+                    ("test_2", 0),
+                    ("test_3", 0),
+                    ("test_4", 0),
+                ]
+
+
+def test_stream_error():
+    """
+    Test that errors while writing do not block the test suite, and are raised when the writer is finished.
+    """
+    with TemporaryDirectory() as tempdir:
+        with Database(f"sqlite:///{tempdir}/test.db") as db:
+            with db.engine.begin() as connection:
+                connection.execute(text("DROP TABLE test"))
+            writer = ResultWriter(db, max_queued=1)
+            writer.start_run(Run(root=tempdir))  # pylint: disable=E1123
+            for i in range(3):
+                writer.submit(single_test(f"test_{i}", "passed"), release=True)
+            with pytest.raises(Exception, match="no such table"):
+                writer.finish()
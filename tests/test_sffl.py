@@ -9,6 +9,8 @@ from tempfile import TemporaryDirectory
 import pandas as pd
 import pytest
 
+from pytest_flakefighters.coverage_map import CoverageMap
+from pytest_flakefighters.coverage_store import CoverageMatrix
 from pytest_flakefighters.database_management import (
     FlakefighterResult,
     Test,
@@ -58,6 +60,63 @@ def test_total_coverage():
     assert total_coverage("", test) == {"file1": {1, 2, 3, 4}, "file2": {3, 5}}
 
 
+def test_total_coverage_flaky():
+    """
+    Test that the total coverage of a flaky test keeps the lines of each file that are covered by every execution that
+    covers the file, including files that some executions do not cover.
+    """
+    test = Test(
+        executions=[
+            TestExecution(coverage={"file1": [1, 2], "file2": [3, 5]}),
+            TestExecution(coverage={"file1": [2, 3]}),
+            TestExecution(coverage={"file1": [2, 4], "file2": [5, 6]}),
+        ],
+        flakefighter_results=[FlakefighterResult(name="dummy", flaky=True)],
+    )
+    assert total_coverage("", test) == {"file1": {2}, "file2": {5}}
+
+
+@pytest.mark.parametrize("matrix", [False, True], ids=["coverage", "matrix"])
+def test_flaky_partial_file_coverage(matrix):
+    """
+    Test that a flaky test counts the lines of a file that some of its executions do not cover, whether counted from
+    the coverage of each execution or from a coverage matrix.
+    """
+    tests = [
+        Test(
+            executions=[
+                TestExecution(coverage={"file1.py": [1, 2], "file2.py": [3]}),
+                TestExecution(coverage={"file1.py": [2]}),
+            ],
+            flakefighter_results=[FlakefighterResult(name="dummy", flaky=True)],
+        )
+    ]
+    sffl = SFFL(root="")
+    if matrix:
+        sffl.count_matrix(
+            tests,
+            CoverageMatrix.from_coverage([execution.coverage for test in tests for execution in test.executions]),
+            None,
+        )
+    else:
+        sffl.count_coverage(tests)
+    assert {statement: count for statement, count in sffl.flaky.items() if count} == {
+        ("file1.py", 2): 1,
+        ("file2.py", 3): 1,
+    }
+
+
+def test_collection_coverage_without_executions():
+    """
+    Test that the lines covered while collecting the tests are not ranked from a coverage matrix if no test was run,
+    as they are not when counted from the coverage of each execution.
+    """
+    tests = [Test(executions=[], fspath="test_file1.py")]
+    sffl = SFFL(root="", include_test_code=True)
+    assert sffl.count_matrix(tests, CoverageMatrix.from_coverage([]), CoverageMap({"file1.py": [1]})) == []
+    assert sffl.count_coverage(tests) == []
+
+
 def test_update_covered():
     """
     Test that the covered count updates as expected.
@@ -107,14 +166,22 @@ def test_safe_div(x, y, expected):
         pytest.param("barinel", True, id="barinel-source-test"),
     ],
 )
-def test_suspiciousness_scores(tests, metric, include_test_code):
+@pytest.mark.parametrize("matrix", [False, True], ids=["coverage", "matrix"])
+def test_suspiciousness_scores(tests, metric, include_test_code, matrix):
     """
-    Test all the suspiciousness metrics work as expected.
+    Test all the suspiciousness metrics work as expected, whether counted from the coverage of each execution or from a
+    coverage matrix.
     """
     with TemporaryDirectory() as tempdir:
         output_file = os.path.join(tempdir, f"{metric}.csv")
         sffl = SFFL(root="", metric=metric, output_file=output_file, include_test_code=include_test_code)
-        sffl.rank(tests)
+        if matrix:
+            sffl.rank(
+                tests,
+                CoverageMatrix.from_coverage([execution.coverage for test in tests for execution in test.executions]),
+            )
+        else:
+            sffl.rank(tests)
         assert os.path.exists(output_file)
         expected = pd.read_csv(
             os.path.join(